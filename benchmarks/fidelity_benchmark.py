@@ -0,0 +1,91 @@
+# Accuracy/speed harness for the FIDELITY_PRESETS. Every preset is run on a fixed set of entry
+# scenarios and compared with stored high-accuracy reference trajectories (benchmarks/golden/),
+# reporting impact-point error and touchdown time error against wall time.
+# Run from the repository root:
+#   python benchmarks/fidelity_benchmark.py              report
+#   python benchmarks/fidelity_benchmark.py --generate   (re)build the golden references
+import os
+import sys
+import time
+import numpy as np
+from astropy.time import Time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from constants import FIDELITY_PRESETS, EARTH_OMEGA
+from coordinate_converter import eci_to_ecef, ecef_to_geodetic, haversine_distance
+from spacecraft_model import SpacecraftModel
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+EPOCH = '2024-01-01 20:00:00'
+
+# reference solver: 8th order with tolerances well below the 'high' preset
+REFERENCE_METHOD = 'DOP853'
+REFERENCE_RTOL = 1e-13
+REFERENCE_ATOL = np.array([1e-6] * 3 + [1e-9] * 3)
+SAMPLE_DT = 10.0
+
+SCENARIOS = {
+    'default': dict(v=7540.0, lat=45.0, lon=-75.0, alt=500e3, azimuth=90.0, gamma=-2.0, Cd=1.3, A=14.0, m=5000.0, tf=3700.0),
+    'steep': dict(v=7800.0, lat=28.5, lon=-80.6, alt=120e3, azimuth=60.0, gamma=-6.0, Cd=1.2, A=12.0, m=3000.0, tf=2000.0),
+    'shallow': dict(v=7750.0, lat=0.0, lon=0.0, alt=150e3, azimuth=90.0, gamma=-0.5, Cd=2.2, A=4.0, m=1000.0, tf=8000.0),
+}
+
+
+def make_spacecraft(scenario, fidelity='standard', sim_type='RK45'):
+    return SpacecraftModel(Cd=scenario['Cd'], A=scenario['A'], m=scenario['m'], epoch=Time(EPOCH, scale='tdb'), sim_type=sim_type, fidelity=fidelity)
+
+
+def initial_state(spacecraft, scenario):
+    return spacecraft.get_initial_state(v=scenario['v'], lat=scenario['lat'], lon=scenario['lon'], alt=scenario['alt'], azimuth=scenario['azimuth'], gamma=scenario['gamma'])
+
+
+def impact_point(spacecraft, trajectory):
+    # touchdown state from the altitude event, converted to geodetic coordinates
+    t_impact = trajectory.t_events[0][0]
+    r_ecef = eci_to_ecef(np.ascontiguousarray(trajectory.y_events[0][0][0:3]), spacecraft.gmst0 + EARTH_OMEGA * t_impact)
+    lat, lon, _ = ecef_to_geodetic(r_ecef[0], r_ecef[1], r_ecef[2])
+    return t_impact, lat, lon
+
+
+def generate():
+    os.makedirs(GOLDEN_DIR, exist_ok=True)
+    for name, scenario in SCENARIOS.items():
+        spacecraft = make_spacecraft(scenario, sim_type=REFERENCE_METHOD)
+        spacecraft.rtol, spacecraft.atol = REFERENCE_RTOL, REFERENCE_ATOL
+        y0 = initial_state(spacecraft, scenario)
+        trajectory = spacecraft.run_simulation((0.0, scenario['tf']), y0, np.arange(0.0, scenario['tf'], SAMPLE_DT))
+        if not trajectory.t_events[0].size:
+            raise RuntimeError(f"Scenario {name} does not reach the ground within tf={scenario['tf']}")
+        t_impact, lat, lon = impact_point(spacecraft, trajectory)
+        np.savez_compressed(
+            os.path.join(GOLDEN_DIR, f'{name}.npz'),
+            y0=y0, t=trajectory.t, y=trajectory.y,
+            t_impact=t_impact, impact_lat=lat, impact_lon=lon,
+            rtol=REFERENCE_RTOL, atol=REFERENCE_ATOL, method=REFERENCE_METHOD,
+        )
+        print(f"{name}: touchdown at {t_impact:.6f} s, {lat:.6f}N {lon:.6f}E")
+
+
+def report(methods=('RK45', 'DOP853', 'Auto')):
+    print(f"{'scenario':<10}{'method':<8}{'fidelity':<10}{'wall (s)':>10}{'nfev':>8}{'impact error (m)':>18}{'dt touchdown (s)':>18}")
+    for name, scenario in SCENARIOS.items():
+        golden = np.load(os.path.join(GOLDEN_DIR, f'{name}.npz'))
+        for method in methods:
+            for fidelity in FIDELITY_PRESETS:
+                spacecraft = make_spacecraft(scenario, fidelity, method)
+                y0 = initial_state(spacecraft, scenario)
+                t_eval = np.arange(0.0, scenario['tf'], SAMPLE_DT)
+                spacecraft.run_simulation((0.0, scenario['tf']), y0, None)  # compile (incl. the Jacobian of 'Auto') outside the timing
+                start = time.perf_counter()
+                trajectory = spacecraft.run_simulation((0.0, scenario['tf']), y0, t_eval)
+                wall = time.perf_counter() - start
+                t_impact, lat, lon = impact_point(spacecraft, trajectory)
+                error = haversine_distance(lat, lon, float(golden['impact_lat']), float(golden['impact_lon']))
+                print(f"{name:<10}{method:<8}{fidelity:<10}{wall:>10.3f}{trajectory.nfev:>8}{error:>18.3f}{t_impact - float(golden['t_impact']):>18.6f}")
+
+
+if __name__ == '__main__':
+    if '--generate' in sys.argv:
+        generate()
+    else:
+        report()
@@ -0,0 +1,48 @@
+# Compares the implicit solvers with the analytic Jacobian (jacobian_numba) against
+# scipy's finite-difference Jacobian on the app's default reentry scenario.
+# Run from the repository root: python benchmarks/jacobian_benchmark.py
+import os
+import sys
+import time
+import numpy as np
+from astropy.time import Time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from spacecraft_model import SpacecraftModel, state_derivative_numba, jacobian_numba
+from propagator import propagate, IMPLICIT_METHODS
+
+spacecraft = SpacecraftModel(Cd=1.3, A=14.0, m=5000.0, epoch=Time('2024-01-01 20:00:00', scale='tdb'))
+y0 = spacecraft.get_initial_state(v=7540.0, lat=45.0, lon=-75.0, alt=500e3, azimuth=90.0, gamma=-2.0)
+params = spacecraft.params
+t_span = (0.0, 3700.0)
+
+
+def rhs(t, y):
+    return state_derivative_numba(t, y, params)
+
+
+def jac(t, y):
+    return jacobian_numba(t, y, params)
+
+
+def altitude_event(t, y):
+    return np.linalg.norm(y[0:3]) - 6378137.0 - 1000.0
+
+
+altitude_event.terminal = True
+altitude_event.direction = -1
+
+# compile the kernels before timing anything
+rhs(0.0, y0)
+jac(0.0, y0)
+
+print(f"{'method':<8}{'jacobian':<12}{'nfev':>8}{'njev':>6}{'nlu':>6}{'wall (s)':>10}{'touchdown (s)':>16}")
+for method in ('RK45',) + IMPLICIT_METHODS:
+    for label, options in (('numerical', {}), ('analytic', {'jac': jac})):
+        if method not in IMPLICIT_METHODS and options:
+            continue
+        start = time.perf_counter()
+        result = propagate(rhs, t_span, y0, method=method, rtol=1e-8, atol=1e-10, events=[altitude_event], **options)
+        wall = time.perf_counter() - start
+        touchdown = result.t_events[0][0] if result.t_events[0].size else float('nan')
+        print(f"{method:<8}{label if method in IMPLICIT_METHODS else '-':<12}{result.nfev:>8}{result.njev:>6}{result.nlu:>6}{wall:>10.3f}{touchdown:>16.3f}")
@@ -0,0 +1,60 @@
+# Accuracy/speed harness for lifetime.predict_lifetime. Every orbit is predicted with the mean
+# element propagation and also simulated in full with run_simulation from the same state until
+# touchdown, reporting the predicted and simulated lifetimes, their difference and both wall times.
+# The full runs take minutes each.
+# Run from the repository root:
+#   python benchmarks/lifetime_benchmark.py
+import math
+import os
+import sys
+import time
+import numpy as np
+from astropy.time import Time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from constants import EARTH_R, DEG_TO_RAD
+from lifetime import predict_lifetime, elements_to_state
+from spacecraft_model import SpacecraftModel
+
+EPOCH = '2024-01-01 20:00:00'
+SAMPLE_DT = 600.0  # output step of the full runs, s (events are located independently of it)
+
+# perigee and apogee altitudes in km, inclination in deg, vehicle, and the horizon of the full run in days
+SCENARIOS = {
+    'equatorial': dict(perigee=140.0, apogee=140.0, inc=0.0, Cd=1.3, A=14.0, m=5000.0, horizon=30.0),
+    'inclined': dict(perigee=140.0, apogee=140.0, inc=28.5, Cd=1.3, A=14.0, m=5000.0, horizon=150.0),
+    'elliptical': dict(perigee=124.0, apogee=170.0, inc=28.5, Cd=2.2, A=14.0, m=5000.0, horizon=120.0),
+}
+
+
+def make_spacecraft(scenario):
+    return SpacecraftModel(Cd=scenario['Cd'], A=scenario['A'], m=scenario['m'], epoch=Time(EPOCH, scale='tdb'), sim_type='RK45')
+
+
+def initial_state(scenario):
+    r_p, r_a = EARTH_R + scenario['perigee'] * 1e3, EARTH_R + scenario['apogee'] * 1e3
+    return elements_to_state(np.array([(r_p + r_a) / 2, (r_a - r_p) / (r_a + r_p), scenario['inc'] * DEG_TO_RAD, 0.5, 1.0, 0.0]))
+
+
+def report():
+    print(f"{'scenario':<14}{'predicted (d)':>15}{'full run (d)':>14}{'error (%)':>11}{'predict (s)':>13}{'full run (s)':>14}")
+    for name, scenario in SCENARIOS.items():
+        spacecraft = make_spacecraft(scenario)
+        y0 = initial_state(scenario)
+        predict_lifetime(spacecraft, y0, max_years=0.001)  # compile outside the timing
+        start = time.perf_counter()
+        result = predict_lifetime(spacecraft, y0)
+        predict_wall = time.perf_counter() - start
+
+        tf = scenario['horizon'] * 86400.0
+        start = time.perf_counter()
+        trajectory = spacecraft.run_simulation((0.0, tf), y0, np.arange(0.0, tf, SAMPLE_DT), diagnostics=False)
+        full_wall = time.perf_counter() - start
+        touchdown = trajectory.events['touchdown']
+        full = touchdown.t[0] / 86400.0 if len(touchdown) else math.nan
+        predicted = result.lifetime / 86400.0 if result.reentered else math.nan
+        print(f"{name:<14}{predicted:>15.2f}{full:>14.2f}{100.0 * (predicted - full) / full:>11.2f}{predict_wall:>13.1f}{full_wall:>14.1f}")
+
+
+if __name__ == '__main__':
+    report()
@@ -0,0 +1,50 @@
+# Cost of the integrators on entries with and without a stiff phase. Capsule entries stay non-stiff:
+# 'Auto' never leaves RK45 and costs the same. Light, high-drag bodies descend for a long time
+# near terminal velocity in the dense lower atmosphere, where the drag timescale pins RK45's step to its
+# stability limit; 'Auto' hands over to Radau there. Touchdown times are compared with RK45's.
+# Run from the repository root:
+#   python benchmarks/stiffness_benchmark.py
+import os
+import sys
+import time
+import numpy as np
+from astropy.time import Time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from spacecraft_model import SpacecraftModel
+
+EPOCH = '2024-01-01 20:00:00'
+SAMPLE_DT = 10.0
+
+SCENARIOS = {
+    'capsule': dict(v=7540.0, lat=45.0, lon=-75.0, alt=500e3, azimuth=90.0, gamma=-2.0, Cd=1.3, A=14.0, m=5000.0, tf=3700.0),
+    'steep': dict(v=7800.0, lat=28.5, lon=-80.6, alt=120e3, azimuth=60.0, gamma=-6.0, Cd=1.2, A=12.0, m=3000.0, tf=2000.0),
+    'debris': dict(v=7500.0, lat=45.0, lon=0.0, alt=120e3, azimuth=90.0, gamma=-1.0, Cd=2.2, A=1.0, m=2.0, tf=20000.0),
+    'parachute': dict(v=300.0, lat=45.0, lon=0.0, alt=40e3, azimuth=90.0, gamma=-30.0, Cd=1.5, A=4.0, m=10.0, tf=20000.0),
+}
+
+
+def make_spacecraft(scenario, sim_type):
+    return SpacecraftModel(Cd=scenario['Cd'], A=scenario['A'], m=scenario['m'], epoch=Time(EPOCH, scale='tdb'), sim_type=sim_type)
+
+
+def report(methods=('RK45', 'Radau', 'LSODA', 'Auto')):
+    print(f"{'scenario':<11}{'method':<8}{'wall (s)':>10}{'nfev':>8}{'final method':>14}{'dt touchdown (s)':>18}")
+    for name, scenario in SCENARIOS.items():
+        t_reference = None
+        for method in methods:
+            spacecraft = make_spacecraft(scenario, method)
+            y0 = spacecraft.get_initial_state(v=scenario['v'], lat=scenario['lat'], lon=scenario['lon'], alt=scenario['alt'],
+                                              azimuth=scenario['azimuth'], gamma=scenario['gamma'])
+            t_span = (0.0, scenario['tf'])
+            spacecraft.run_simulation(t_span, y0, None, diagnostics=False)  # compile outside the timing
+            start = time.perf_counter()
+            trajectory = spacecraft.run_simulation(t_span, y0, np.arange(0.0, scenario['tf'], SAMPLE_DT), diagnostics=False)
+            wall = time.perf_counter() - start
+            t_touchdown = trajectory.events['touchdown'].t[0]
+            t_reference = t_touchdown if t_reference is None else t_reference
+            print(f"{name:<11}{method:<8}{wall:>10.3f}{trajectory.nfev:>8}{trajectory.checkpoint.method:>14}{t_touchdown - t_reference:>18.6f}")
+
+
+if __name__ == '__main__':
+    report()
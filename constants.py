@@ -34,6 +34,8 @@ EARTH_ROTATION_RATE_DEG_PER_SEC = 360 / EARTH_ROT_S  # Earth rotation rate in de
 EARTH_RORATION_RATE_RAD_PER_SEC = EARTH_ROTATION_RATE_DEG_PER_SEC * DEG_TO_RAD  # Earth rotation rate in radians per second
 EARTH_PERIMETER = EARTH_R * 2 * PI  # Earth perimeter in meters
 EARTH_ROTATION_RATE_M_S = EARTH_PERIMETER / EARTH_ROT_S  # Earth rotation rate in meters per second
+KARMAN_LINE = 100000.0  # altitude of the Karman line in m
+TOUCHDOWN_ALTITUDE = 1000.0  # altitude at which a simulation stops, kept above the ground to avoid triggering at the atmospheric boundary (m)
 
 # ------------------
 # MATERIAL CONSTANTS
@@ -84,6 +86,17 @@ MATERIALS = {
     },
 }
 
+# ------------------
+# INTEGRATION FIDELITY PRESETS
+# ------------------
+
+# relative tolerance plus absolute tolerances per state component: position (m) and velocity (m/s)
+FIDELITY_PRESETS = {
+    'preview': {'rtol': 1e-6, 'atol_position': 1.0, 'atol_velocity': 1e-3},
+    'standard': {'rtol': 1e-8, 'atol_position': 1e-2, 'atol_velocity': 1e-5},
+    'high': {'rtol': 1e-11, 'atol_position': 1e-5, 'atol_velocity': 1e-8},
+}
+
 # ------------------
 # MOON CONSTANTS
 # ------------------
@@ -10,6 +10,7 @@ PI = np.pi
 DEG_TO_RAD = float(PI / 180.0) # degrees to radians
 RAD_TO_DEG = float(180.0 / PI) # radians to degrees
 JD_AT_0 = 2451545.0 # Julian date at 0 Jan 2000
+JD_UNIX_EPOCH = 2440587.5 # Julian date at 1970-01-01 00:00
 #Earth
 # Constants
 EARTH_R = 6378137.0  # Earth's mean radius in meters
@@ -134,3 +135,13 @@ def haversine_distance(lat1, lon1, lat2, lon2, R=EARTH_R):
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
 
     return R * c
+
+def jd_to_datetime64(jd):
+    '''
+    Converts Julian dates to numpy datetime64 with microsecond resolution in one array operation.
+    Matches Time(jd, format='jd').datetime except on leap-second days, which astropy stretches (< 1 s).
+    :param jd: scalar or array of Julian dates
+    :return: datetime64[us] array
+    '''
+    microseconds = np.round((np.asarray(jd, dtype=np.float64) - JD_UNIX_EPOCH) * 86400e6).astype(np.int64)
+    return np.datetime64('1970-01-01T00:00:00', 'us') + microseconds.astype('timedelta64[us]')
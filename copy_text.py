@@ -67,13 +67,22 @@ INPUTS = {
         "help_text": "The simulation will be broken down into a time step. Shorter timesteps give more precision but will increase the processing time.",
     },
     "sim_type": {
-        "help_text": "The integration method to be used by the simulation physics solver. Explicit Runge-Kutta methods ('RK23', 'RK45', 'DOP853') should be used for non-stiff problems and implicit methods ('Radau', 'BDF') for stiff problems. Among Runge-Kutta methods, 'DOP853' is recommended for solving with high precision (low values of `rtol` and `atol`).:s If not sure, first try to run 'RK45'. If it makes unusually many iterations, diverges, or fails, your problem is likely to be stiff and you should use 'Radau' or 'BDF'. 'LSODA' can also be a good universal choice, but it might be somewhat less convenient to work with as it wraps old Fortran code.:s You can also pass an arbitrary class derived from `OdeSolver` which implements the solver."
+        "help_text": "The integration method to be used by the simulation physics solver. 'Auto' (the default) starts with the explicit 'RK45' method and switches to the implicit 'Radau' method whenever the atmosphere makes the problem stiff, and back again when it no longer is, so you do not have to pick one yourself.:s Explicit Runge-Kutta methods ('RK23', 'RK45', 'DOP853') should be used for non-stiff problems and implicit methods ('Radau', 'BDF') for stiff problems. Among Runge-Kutta methods, 'DOP853' is recommended for solving with high precision (low values of `rtol` and `atol`).:s If not sure, first try to run 'RK45'. If it makes unusually many iterations, diverges, or fails, your problem is likely to be stiff and you should use 'Radau' or 'BDF'. 'LSODA' can also be a good universal choice, but it might be somewhat less convenient to work with as it wraps old Fortran code.:s You can also pass an arbitrary class derived from `OdeSolver` which implements the solver."
+    },
+    "fidelity": {
+        "help_text": "Trade accuracy for speed. 'preview' is the fastest and lands within a few kilometres of the reference solution, 'standard' within a few metres, 'high' within centimetres at roughly twice the cost of 'standard'. The tolerances behind each preset are checked against stored reference trajectories in benchmarks/fidelity_benchmark.py."
     },
     "iter_fact": {
         "help_text": "Advanced: The iteration slowdown factor is used to slow down the temperature algorithm iterator. It has the purpose of fine tunning experimental data with simulation results. The default value is 2.0. If you are not sure, leave it as is."
     },
     "max_points": {
-        "help_text": "max_points"
+        "help_text": "Number of output points of the simulation. They are placed where altitude, g-load and heat shield temperature change quickly, so the peak heating window is finely resolved while coasting in vacuum gets few points. Set it to 0 to output a point every time step instead; only then does a longer duration continue the finished run instead of starting over."
+    },
+    "targeting": {
+        "help_text": "Finds the flight path angle and azimuth that land the spacecraft on the target, keeping the other inputs. Each iteration propagates one trajectory (a few in parallel when the sensitivities are rebuilt); nearby targets solved before are used as starting points."
+    },
+    "stream_to_disk": {
+        "help_text": "Advanced: write the simulation output to a memory-mapped file on disk while it runs instead of keeping it in memory. Use it for very long or very fine-grained runs (multi-day decay at small time steps)."
     },
 }
 
@@ -0,0 +1,193 @@
+import warnings
+import numpy as np
+import pandas as pd
+from constants import EARTH_GRAVITY, KARMAN_LINE, TOUCHDOWN_ALTITUDE, MATERIALS
+from ensemble import propagate_ensemble, TOUCHDOWN, LIMIT_EXCEEDED, FAILED
+from scenario import make_scenario, scenario_epoch, scenario_model
+from spacecraft_model import thermal_environment_numba, heat_balance_numba, material_cases
+
+# Entry corridor of a scenario: the flight path angles between the steep boundary, where a limit on
+# peak g, heat flux or heat shield temperature is exceeded, and the shallow boundary, where the vehicle
+# skips out or stays in orbit. Outcomes are expected to be monotonic in the flight path angle, so each
+# boundary is bracketed and narrowed by k-section: every round propagates k candidates per open bracket,
+# all brackets and entry speeds in one parallel ensemble call, and a round shrinks each bracket k + 1 times.
+# Candidates stop as soon as their outcome is known: on a g or heat flux limit, on skip-out, or at
+# touchdown. Where they are not (e.g. a shallow entry that skips and exceeds the g limit on the way
+# down), the widest run of inside candidates is bracketed instead and the result is flagged as unordered.
+CORRIDOR_LIMITS = ('peak_g', 'peak_heat_flux', 'peak_temperature')  # g, W, K
+DEFAULT_LIMITS = {'peak_g': 10.0}
+
+# candidate outcomes, ordered from steep to shallow
+STEEP, INSIDE, SHALLOW = -1, 0, 1
+
+
+class CorridorResult:
+    '''
+    Corridor bounds per entry speed and the candidates evaluated to find them
+    '''
+    def __init__(self, velocities, steep, shallow, samples, propagations, rounds, tol, unordered):
+        self.velocities = velocities  # (n_v,) entry speeds, m/s
+        self.steep = steep  # (n_v, 2) bracket of the steep boundary in deg: (last too steep, first inside)
+        self.shallow = shallow  # (n_v, 2) bracket of the shallow boundary in deg: (last inside, first too shallow)
+        self.unordered = unordered  # (n_v,) outcomes not monotonic in gamma: the bounds are those of the widest inside run found
+        self.samples = samples  # DataFrame of every candidate: v, gamma, outcome, status, peak_g, peak_heat_flux, peak_temperature
+        self.propagations = propagations
+        self.rounds = rounds
+        self.tol = tol
+
+    @property
+    def bounds(self):
+        '''
+        (n_v, 2) flight path angles inside the corridor at both boundaries, NaN where no candidate was inside
+        '''
+        bounds = np.column_stack((self.steep[:, 1], self.shallow[:, 0]))
+        bounds[~(bounds[:, 0] <= bounds[:, 1])] = np.nan
+        return bounds
+
+    @property
+    def width(self):
+        return self.bounds[:, 1] - self.bounds[:, 0]
+
+    def to_dataframe(self):
+        bounds = self.bounds
+        return pd.DataFrame({'v': self.velocities, 'gamma_steep': bounds[:, 0], 'gamma_shallow': bounds[:, 1], 'width': bounds[:, 1] - bounds[:, 0],
+                             'unordered': self.unordered})
+
+
+class CorridorEvaluator:
+    '''
+    Classifies entry candidates (v, gamma) of one scenario as STEEP, INSIDE or SHALLOW
+    '''
+    def __init__(self, scenario=None, limits=None, skip_altitude=KARMAN_LINE):
+        '''
+        :param scenario: scenario dict (see scenario.SCENARIO_DEFAULTS), everything but v and gamma stays fixed
+        :param limits: dict of CORRIDOR_LIMITS -> maximum
+        :param skip_altitude: a candidate that climbs back above this altitude (m) after going below skipped out
+        '''
+        self.scenario = make_scenario(**(scenario or {}))
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        unknown = set(self.limits) - set(CORRIDOR_LIMITS)
+        if unknown:
+            raise ValueError(f"Unknown corridor limits {sorted(unknown)}, expected some of {list(CORRIDOR_LIMITS)}")
+        epoch, self.gmst0 = scenario_epoch(self.scenario['calendar'], self.scenario['clock'])
+        self.model = scenario_model(self.scenario, epoch, self.gmst0)
+        self.skip_altitude = skip_altitude
+        # the temperature model needs sampled trajectories, the other limits are checked while integrating
+        self.t_eval = np.arange(0.0, self.scenario['tf'], self.model.dt) if 'peak_temperature' in self.limits else None
+        material = self.scenario['material']
+        self.heat_shield = material_cases({material: MATERIALS[material]}, self.model.m, self.model.height)[1]
+        self.propagations = 0
+
+    def evaluate(self, v, gamma):
+        '''
+        :param v: (n,) entry speeds in m/s
+        :param gamma: (n,) flight path angles in deg
+        :return: DataFrame with one row per candidate
+        '''
+        s = self.scenario
+        model = self.model
+        y0s = np.array([model.get_initial_state(v=v_i, lat=s['lat'], lon=s['lon'], alt=s['alt_init'] * 1000, azimuth=s['azimuth'], gamma=gamma_i, gmst=self.gmst0)
+                        for v_i, gamma_i in zip(v, gamma)])
+        max_drag_power = self.limits.get('peak_heat_flux', np.inf) / (model.ablation_efficiency * model.m)
+        result = propagate_ensemble(y0s, model.params, (0.0, s['tf']), self.t_eval, rtol=model.rtol, atol=model.atol, stop_altitude=TOUCHDOWN_ALTITUDE,
+                                    skip_altitude=self.skip_altitude, max_deceleration=self.limits.get('peak_g', np.inf) * EARTH_GRAVITY,
+                                    max_drag_power=max_drag_power, track_peaks=True)
+        self.propagations += len(result)
+        if (result.status == FAILED).any():
+            raise RuntimeError(f"Corridor candidates failed to propagate at gamma={np.asarray(gamma)[result.status == FAILED]}")
+
+        peak_temperature = np.full(len(result), np.nan)
+        if self.t_eval is not None:
+            for i in np.flatnonzero(result.status == TOUCHDOWN):
+                alive = ~np.isnan(result.y[i, :, 0])
+                environment = thermal_environment_numba(self.t_eval[alive], np.ascontiguousarray(result.y[i, alive].T), model.params)
+                T_s = heat_balance_numba(*environment, model.dt, model.iter_fact, self.heat_shield)[4]
+                peak_temperature[i] = T_s.max() if T_s.shape[1] else np.nan
+
+        # skipped out or still in orbit at tf: too shallow
+        outcome = np.full(len(result), SHALLOW)
+        outcome[result.status == TOUCHDOWN] = INSIDE
+        outcome[(result.status == LIMIT_EXCEEDED) | (peak_temperature > self.limits.get('peak_temperature', np.inf))] = STEEP
+        return pd.DataFrame({
+            'v': v,
+            'gamma': gamma,
+            'outcome': outcome,
+            'status': result.status,
+            'peak_g': result.peak_deceleration / EARTH_GRAVITY,
+            'peak_heat_flux': result.peak_drag_power * model.ablation_efficiency * model.m,
+            'peak_temperature': peak_temperature,
+        })
+
+
+def _brackets(gamma, outcome):
+    '''
+    Steep and shallow brackets of one entry speed from its candidates
+    :return: steep bracket, shallow bracket, whether the outcomes are not monotonic in gamma
+    '''
+    order = np.argsort(gamma)
+    gamma, outcome = gamma[order], outcome[order]
+    unordered = bool((np.diff(outcome) < 0).any())
+    inside = np.flatnonzero(outcome == INSIDE)
+    if not len(inside):
+        # no candidate inside yet: one bracket between the steep and shallow candidates, shared by both boundaries
+        steep = outcome == STEEP
+        shallow = outcome == SHALLOW
+        last_steep = gamma[steep].max() if steep.any() else -np.inf
+        first_shallow = gamma[shallow].min() if shallow.any() else np.inf
+        after_steep = gamma[(gamma > last_steep) & ~steep]
+        before_shallow = gamma[(gamma < first_shallow) & ~shallow]
+        return (last_steep, after_steep.min() if len(after_steep) else np.inf), (before_shallow.max() if len(before_shallow) else -np.inf, first_shallow), unordered
+    # the widest run of consecutive inside candidates, the only one when the outcomes are monotonic
+    runs = np.split(inside, np.flatnonzero(np.diff(inside) > 1) + 1)
+    run = max(runs, key=lambda run: gamma[run[-1]] - gamma[run[0]])
+    first, last = run[0], run[-1]
+    steep = (gamma[first - 1] if first > 0 else -np.inf, gamma[first])
+    shallow = (gamma[last], gamma[last + 1] if last + 1 < len(gamma) else np.inf)
+    return steep, shallow, unordered
+
+
+def corridor_search(scenario=None, limits=None, gamma_range=(-20.0, 0.0), velocities=None, tol=0.01, candidates=8, skip_altitude=KARMAN_LINE,
+                    max_rounds=20, evaluator=None):
+    '''
+    Brackets both corridor boundaries in flight path angle for one or more entry speeds
+    :param scenario: scenario dict, the entry point, vehicle and tf (which bounds every run)
+    :param limits: dict of CORRIDOR_LIMITS -> maximum, DEFAULT_LIMITS if None
+    :param gamma_range: (steepest, shallowest) flight path angles searched, deg
+    :param velocities: entry speeds in m/s, the scenario's v if None
+    :param tol: width of the final brackets, deg
+    :param candidates: candidates per open bracket and round
+    :param skip_altitude: see CorridorEvaluator
+    :param max_rounds: bracketing rounds after the initial sweep
+    :param evaluator: CorridorEvaluator to reuse, built from the arguments above if None
+    :return: CorridorResult
+    '''
+    evaluator = evaluator or CorridorEvaluator(scenario, limits, skip_altitude)
+    velocities = np.atleast_1d(np.asarray(evaluator.scenario['v'] if velocities is None else velocities, dtype=np.float64))
+    start = evaluator.propagations
+
+    # initial sweep over the whole range, both ends included
+    sweep = np.linspace(gamma_range[0], gamma_range[1], 2 * candidates)
+    samples = evaluator.evaluate(np.repeat(velocities, len(sweep)), np.tile(sweep, len(velocities)))
+    rounds = 0
+    while True:
+        steep = np.empty((len(velocities), 2))
+        shallow = np.empty((len(velocities), 2))
+        unordered = np.zeros(len(velocities), dtype=bool)
+        v_next, gamma_next = [], []
+        for k, v in enumerate(velocities):
+            rows = samples[samples['v'] == v]
+            steep[k], shallow[k], unordered[k] = _brackets(rows['gamma'].to_numpy(), rows['outcome'].to_numpy())
+            # a bracket reaching past the range has found no boundary there; a shared bracket (no candidate inside yet) is split once
+            open_brackets = {tuple(bracket) for bracket in (steep[k], shallow[k]) if np.isfinite(bracket).all() and bracket[1] - bracket[0] > tol}
+            for lo, hi in open_brackets:
+                n = candidates if len(open_brackets) == 2 else 2 * candidates
+                gamma_next.extend(np.linspace(lo, hi, n + 2)[1:-1])
+                v_next.extend([v] * n)
+        if not gamma_next or rounds == max_rounds:
+            break
+        samples = pd.concat((samples, evaluator.evaluate(np.array(v_next), np.array(gamma_next))), ignore_index=True)
+        rounds += 1
+    if unordered.any():
+        warnings.warn(f"Corridor outcomes are not monotonic in flight path angle at v={velocities[unordered]} m/s: "
+                      f"the bounds there are those of the widest run of inside candidates found")
+    return CorridorResult(velocities, steep, shallow, samples, evaluator.propagations - start, rounds, tol, unordered)
@@ -0,0 +1,297 @@
+import math
+import numpy as np
+import pandas as pd
+from constants import EARTH_R, EARTH_OMEGA, EARTH_GRAVITY, DEG_TO_RAD, RAD_TO_DEG, TOUCHDOWN_ALTITUDE, MATERIALS, PI
+from coordinate_converter import eci_to_ecef, ecef_to_geodetic
+from ensemble import propagate_ensemble, TOUCHDOWN
+from scenario import make_scenario, scenario_epoch, scenario_model
+from spacecraft_model import state_derivative_numba, force_model_params, thermal_environment_numba, heat_balance_numba, material_cases
+from targeting import local_miss
+
+# Dispersion of a scenario's entry interface and impact point from the uncertainty of its entry state.
+# Linear covariance: run_simulation(stm=True) integrates the state transition matrix Phi along the
+# nominal trajectory, and an initial state covariance P0 maps to Phi P0 Phi^T at any time. At an
+# altitude crossing the perturbed trajectories arrive earlier or later, so the map is taken onto the
+# crossing surface: with c = -(dh/dy) / (dh/dy . f) the arrival time shift of a state perturbation,
+# dy on the surface is (I + f c^T) Phi dy0. One trajectory of 42 states gives the first order footprint
+# a Monte Carlo needs thousands of trajectories for.
+#
+# Unscented transform: 2n + 1 sigma points of a covariance over n scenario inputs, vehicle inputs
+# included, are propagated together in one ensemble call and their outcomes weighted back into a mean
+# and covariance. About twenty trajectories, and the drag nonlinearity that bends a linear footprint is
+# captured to second order.
+ENTRY_INPUTS = ('v', 'gamma', 'azimuth', 'lat', 'lon', 'alt_init')  # m/s, deg, deg, deg, deg, km
+UNSCENTED_INPUTS = ENTRY_INPUTS + ('mass', 'area', 'codrag')  # kg, m^2, -
+UNSCENTED_OUTPUTS = ('impact_north', 'impact_east', 'time_of_flight', 'peak_g', 'peak_temperature')  # m, m, s, g, K
+
+
+def error_ellipse(covariance, probability=0.99):
+    '''
+    :param covariance: (2, 2) covariance of the (north, east) position in m^2
+    :param probability: probability contained in the ellipse
+    :return: semi-major and semi-minor axes in m, and the azimuth of the major axis in deg (clockwise from north, 0-180)
+    '''
+    scale = math.sqrt(-2.0 * math.log(1.0 - probability))  # chi-square quantile with two degrees of freedom
+    values, vectors = np.linalg.eigh(covariance)
+    values = np.maximum(values, 0.0)
+    azimuth = RAD_TO_DEG * math.atan2(vectors[1, 1], vectors[0, 1]) % 180.0
+    return scale * math.sqrt(values[1]), scale * math.sqrt(values[0]), azimuth
+
+
+def entry_state_covariance(model, sigma, entry, gmst=0.0):
+    '''
+    Covariance of the ECI entry state from independent uncertainties of the entry inputs, by central
+    differences of SpacecraftModel.get_initial_state
+    :param model: SpacecraftModel
+    :param sigma: dict of ENTRY_INPUTS -> standard deviation
+    :param entry: dict of every ENTRY_INPUTS nominal value
+    :param gmst: greenwich mean sidereal time of the entry state in rad
+    :return: (6, 6) covariance
+    '''
+    unknown = set(sigma) - set(ENTRY_INPUTS)
+    if unknown:
+        raise ValueError(f"Only the entry state maps linearly, got {sorted(unknown)}, expected some of {list(ENTRY_INPUTS)}")
+
+    def state(values):
+        return model.get_initial_state(v=values['v'], lat=values['lat'], lon=values['lon'], alt=values['alt_init'] * 1000,
+                                       azimuth=values['azimuth'], gamma=values['gamma'], gmst=gmst)
+
+    J = np.empty((6, len(sigma)))
+    for j, (name, s) in enumerate(sigma.items()):
+        J[:, j] = (state(dict(entry, **{name: entry[name] + s})) - state(dict(entry, **{name: entry[name] - s}))) / 2.0
+    # columns are already scaled by the standard deviations
+    return J @ J.T
+
+
+class SurfaceCrossing:
+    '''
+    First order statistics of the trajectories' crossing of an altitude
+    '''
+    def __init__(self, t, state, covariance, time_variance, point, footprint):
+        self.t = t  # nominal crossing time, s
+        self.state = state  # nominal ECI state
+        self.covariance = covariance  # (6, 6) ECI state covariance on the crossing surface
+        self.time_variance = time_variance  # variance of the crossing time, s^2
+        self.point = point  # nominal (latitude, longitude) in deg
+        self.footprint = footprint  # (2, 2) covariance of the (north, east) ground position in m^2
+
+    def ellipse(self, probability=0.99):
+        '''
+        :return: semi-major and semi-minor axes in m and azimuth of the major axis in deg, see error_ellipse
+        '''
+        return error_ellipse(self.footprint, probability)
+
+
+def surface_crossing(model, t, z, P0):
+    '''
+    Maps an initial state covariance onto the crossing of the altitude at which the trajectory reached z
+    :param model: SpacecraftModel the trajectory was run with
+    :param t: crossing time, s
+    :param z: STM_STATE_SIZE row of an event record: state followed by the row-major state transition matrix
+    :param P0: (6, 6) initial state covariance
+    :return: SurfaceCrossing
+    '''
+    y = np.ascontiguousarray(z[0:6])
+    Phi = np.reshape(z[6:], (6, 6))
+    f = state_derivative_numba(t, y, model.params)
+    dh = np.concatenate((y[0:3] / np.linalg.norm(y[0:3]), np.zeros(3)))
+    c = -(dh @ Phi) / (dh @ f)  # crossing time shift per initial state perturbation
+    M = Phi + np.outer(f, c)
+
+    # the ground point also moves by the Earth's rotation over the time shift
+    gmst = model.gmst0 + EARTH_OMEGA * t
+    rotation = np.column_stack([eci_to_ecef(np.ascontiguousarray(e), gmst) for e in np.eye(3)])
+    omega_r = np.array([-EARTH_OMEGA * y[1], EARTH_OMEGA * y[0], 0.0])
+    latitude, longitude, _ = ecef_to_geodetic(*eci_to_ecef(y[0:3], gmst))
+    lat, lon = DEG_TO_RAD * latitude, DEG_TO_RAD * longitude
+    north_east = np.array([[-math.sin(lat) * math.cos(lon), -math.sin(lat) * math.sin(lon), math.cos(lat)],
+                           [-math.sin(lon), math.cos(lon), 0.0]])
+    H = north_east @ rotation @ (M[0:3] - np.outer(omega_r, c))
+    return SurfaceCrossing(t, y, M @ P0 @ M.T, float(c @ P0 @ c), (latitude, longitude), H @ P0 @ H.T)
+
+
+class LinearDispersion:
+    '''
+    Entry interface and impact point covariance of one nominal trajectory
+    '''
+    def __init__(self, trajectory, P0, entry, impact):
+        self.trajectory = trajectory  # nominal Trajectory, run with stm=True
+        self.P0 = P0  # (6, 6) initial state covariance
+        self.entry = entry  # SurfaceCrossing of the first descent through KARMAN_LINE, None if there is none
+        self.impact = impact  # SurfaceCrossing at touchdown, None without touchdown
+
+    @property
+    def final_covariance(self):
+        '''
+        (6, 6) state covariance at the end of the run (touchdown or t_span[1]), at fixed time
+        '''
+        Phi = np.reshape(self.trajectory.checkpoint.y[6:], (6, 6))
+        return Phi @ self.P0 @ Phi.T
+
+
+def linear_covariance(model, y0, P0, t_span, t_eval=None, store_path=None):
+    '''
+    Propagates a state covariance to the entry interface and the impact point with one run of the
+    variational equations
+    :param model: SpacecraftModel
+    :param y0: ECI initial state
+    :param P0: (6, 6) covariance of y0
+    :param t_span: (ts, tf) in seconds
+    :param t_eval: output sample times of the nominal trajectory, the crossings do not depend on them
+    :param store_path: optional .npy path for a memory-mapped trajectory store
+    :return: LinearDispersion
+    '''
+    P0 = np.asarray(P0, dtype=np.float64)
+    trajectory = model.run_simulation(t_span, y0, t_eval, store_path=store_path, diagnostics=t_eval is not None, stm=True)
+    entry = None
+    karman = trajectory.events['karman_line']
+    for t, z in zip(karman.t, karman.y):
+        if np.dot(z[0:3], z[3:6]) < 0.0:
+            entry = surface_crossing(model, t, z, P0)
+            break
+    touchdown = trajectory.events['touchdown']
+    impact = surface_crossing(model, touchdown.t[0], touchdown.y[0], P0) if len(touchdown) else None
+    return LinearDispersion(trajectory, P0, entry, impact)
+
+
+def scenario_dispersion(scenario, sigma, t_eval=None):
+    '''
+    Linear covariance of a scenario from the uncertainty of its entry inputs
+    :param scenario: scenario dict (see scenario.SCENARIO_DEFAULTS)
+    :param sigma: dict of ENTRY_INPUTS -> standard deviation, e.g. {'v': 5.0, 'gamma': 0.05}
+    :param t_eval: output sample times of the nominal trajectory
+    :return: LinearDispersion
+    '''
+    scenario = make_scenario(**scenario)
+    epoch, gmst0 = scenario_epoch(scenario['calendar'], scenario['clock'])
+    model = scenario_model(scenario, epoch, gmst0)
+    entry = {name: scenario[name] for name in ENTRY_INPUTS}
+    y0 = model.get_initial_state(v=entry['v'], lat=entry['lat'], lon=entry['lon'], alt=entry['alt_init'] * 1000,
+                                 azimuth=entry['azimuth'], gamma=entry['gamma'], gmst=gmst0)
+    P0 = entry_state_covariance(model, sigma, entry, gmst0)
+    return linear_covariance(model, y0, P0, (0.0, scenario['tf']), t_eval)
+
+
+def _outcomes(scenario, model, gmst0, inputs, points):
+    # impact latitude and longitude, time of flight, peak g and peak heat shield temperature of each row of inputs, propagated in parallel
+    values = {name: np.full(len(points), scenario[name], dtype=np.float64) for name in UNSCENTED_INPUTS}
+    values.update({name: points[:, j] for j, name in enumerate(inputs)})
+    y0s = np.array([model.get_initial_state(v=values['v'][i], lat=values['lat'][i], lon=values['lon'][i], alt=values['alt_init'][i] * 1000,
+                                            azimuth=values['azimuth'][i], gamma=values['gamma'][i], gmst=gmst0) for i in range(len(points))])
+    params = force_model_params(model.epoch, gmst0, values['codrag'], values['area'], values['mass'], model.gravity, model.space_weather, model.duration)
+    # the temperature model needs sampled trajectories
+    t_eval = np.arange(0.0, scenario['tf'], model.dt)
+    result = propagate_ensemble(y0s, params, (0.0, scenario['tf']), t_eval, rtol=model.rtol, atol=model.atol, stop_altitude=TOUCHDOWN_ALTITUDE, track_peaks=True)
+
+    material = MATERIALS[scenario['material']]
+    impacts = np.full((len(points), 2), np.nan)
+    peak_temperature = np.full(len(points), np.nan)
+    for i in np.flatnonzero(result.status == TOUCHDOWN):
+        latitude, longitude, _ = ecef_to_geodetic(*eci_to_ecef(result.y_end[i, 0:3], gmst0 + EARTH_OMEGA * result.t_end[i]))
+        impacts[i] = latitude, longitude
+        alive = ~np.isnan(result.y[i, :, 0])
+        environment = thermal_environment_numba(t_eval[alive], np.ascontiguousarray(result.y[i, alive].T), params[i])
+        # heat shield of this point's mass and size
+        heat_shield = material_cases({scenario['material']: material}, values['mass'][i], np.sqrt(values['area'][i] / PI) * 1.315)[1]
+        T_s = heat_balance_numba(*environment, model.dt, model.iter_fact, heat_shield)[4]
+        peak_temperature[i] = T_s.max() if T_s.shape[1] else np.nan
+
+    touchdown = result.status == TOUCHDOWN
+    return np.column_stack((impacts, np.where(touchdown, result.t_end, np.nan), result.peak_deceleration / EARTH_GRAVITY, peak_temperature))
+
+
+def sigma_points(mean, covariance, alpha=1.0, beta=2.0, kappa=0.0):
+    '''
+    Scaled sigma points of the unscented transform
+    :param mean: (n,) mean
+    :param covariance: (n, n) covariance
+    :param alpha: spread of the points around the mean
+    :param beta: prior knowledge of the distribution, 2 is optimal for a Gaussian
+    :param kappa: secondary scaling, the points lie sqrt(n + kappa) alpha standard deviations out
+    :return: (2n + 1, n) points, the mean first, and their mean and covariance weights
+    '''
+    n = len(mean)
+    lam = alpha**2 * (n + kappa) - n
+    L = np.linalg.cholesky((n + lam) * np.asarray(covariance, dtype=np.float64))
+    points = np.vstack((mean, mean + L.T, mean - L.T))
+    w_mean = np.full(2 * n + 1, 0.5 / (n + lam))
+    w_mean[0] = lam / (n + lam)
+    w_cov = w_mean.copy()
+    w_cov[0] += 1.0 - alpha**2 + beta
+    return points, w_mean, w_cov
+
+
+class UnscentedDispersion:
+    '''
+    Mean and covariance of UNSCENTED_OUTPUTS reconstructed from sigma points
+    '''
+    def __init__(self, inputs, points, outputs, w_mean, w_cov, nominal_impact):
+        self.inputs = inputs  # names of the uncertain inputs, the columns of points
+        self.points = points  # (2n + 1, n) sigma points
+        self.outputs = outputs  # (2n + 1, len(UNSCENTED_OUTPUTS)) outcome of each point
+        self.mean = w_mean @ outputs
+        deviation = outputs - self.mean
+        self.covariance = (w_cov[:, None] * deviation).T @ deviation
+        self.nominal_impact = nominal_impact  # (latitude, longitude) in deg of the mean inputs, origin of impact_north and impact_east
+
+    @property
+    def std(self):
+        return np.sqrt(np.diag(self.covariance))
+
+    @property
+    def impact(self):
+        '''
+        Mean impact (latitude, longitude) in deg
+        '''
+        latitude, longitude = self.nominal_impact
+        return (latitude + RAD_TO_DEG * self.mean[0] / EARTH_R,
+                longitude + RAD_TO_DEG * self.mean[1] / (EARTH_R * math.cos(DEG_TO_RAD * latitude)))
+
+    @property
+    def footprint(self):
+        '''
+        (2, 2) covariance of the (north, east) impact position in m^2
+        '''
+        return self.covariance[0:2, 0:2]
+
+    def ellipse(self, probability=0.99):
+        '''
+        :return: semi-major and semi-minor axes in m and azimuth of the major axis in deg, see error_ellipse
+        '''
+        return error_ellipse(self.footprint, probability)
+
+    def to_dataframe(self):
+        return pd.DataFrame({'mean': self.mean, 'std': self.std}, index=list(UNSCENTED_OUTPUTS))
+
+
+def unscented_dispersion(scenario, sigma, correlation=None, alpha=1.0, beta=2.0, kappa=0.0):
+    '''
+    Dispersion of a scenario's impact point, peak g and peak heat shield temperature by the unscented transform
+    :param scenario: scenario dict (see scenario.SCENARIO_DEFAULTS), the mean of the inputs
+    :param sigma: dict of UNSCENTED_INPUTS -> standard deviation, e.g. {'mass': 100.0, 'codrag': 0.05, 'gamma': 0.05}
+    :param correlation: optional (n, n) correlation matrix of the sigma inputs in their order, independent if None
+    :param alpha: see sigma_points
+    :param beta: see sigma_points
+    :param kappa: see sigma_points
+    :return: UnscentedDispersion
+    '''
+    unknown = set(sigma) - set(UNSCENTED_INPUTS)
+    if unknown:
+        raise ValueError(f"Unknown dispersion inputs {sorted(unknown)}, expected some of {list(UNSCENTED_INPUTS)}")
+    scenario = make_scenario(**scenario)
+    epoch, gmst0 = scenario_epoch(scenario['calendar'], scenario['clock'])
+    model = scenario_model(scenario, epoch, gmst0)
+    inputs = tuple(sigma)
+    std = np.array([sigma[name] for name in inputs], dtype=np.float64)
+    correlation = np.eye(len(inputs)) if correlation is None else np.asarray(correlation, dtype=np.float64)
+    points, w_mean, w_cov = sigma_points(np.array([scenario[name] for name in inputs], dtype=np.float64), correlation * np.outer(std, std), alpha, beta, kappa)
+
+    outcomes = _outcomes(scenario, model, gmst0, inputs, points)
+    # a point without touchdown has no outcome to weight in, and would turn every mean into NaN
+    flying = np.flatnonzero(np.isnan(outcomes[:, 2]))
+    if len(flying):
+        described = '; '.join(f"{i}: " + ', '.join(f"{name}={points[i, j]:.6g}" for j, name in enumerate(inputs)) for i in flying)
+        raise ValueError(f"{len(flying)} of {len(points)} sigma points don't touch down before tf={scenario['tf']} s ({described}), "
+                         f"increase tf or reduce sigma")
+    outputs = np.column_stack((local_miss(outcomes[:, 0], outcomes[:, 1], *outcomes[0, 0:2]), outcomes[:, 2:]))
+    return UnscentedDispersion(inputs, points, outputs, w_mean, w_cov, tuple(outcomes[0, 0:2]))
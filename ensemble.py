@@ -0,0 +1,246 @@
+import numpy as np
+from numba import njit, prange
+from constants import EARTH_R
+from spacecraft_model import state_derivative_numba, drag_numba, euclidean_norm
+
+# Dormand-Prince 5(4) tableau (same pair as scipy's RK45)
+DP_C = np.array([0.0, 1.0 / 5.0, 3.0 / 10.0, 4.0 / 5.0, 8.0 / 9.0, 1.0, 1.0])
+DP_A = np.array([
+    [0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
+    [1.0 / 5.0, 0.0, 0.0, 0.0, 0.0, 0.0],
+    [3.0 / 40.0, 9.0 / 40.0, 0.0, 0.0, 0.0, 0.0],
+    [44.0 / 45.0, -56.0 / 15.0, 32.0 / 9.0, 0.0, 0.0, 0.0],
+    [19372.0 / 6561.0, -25360.0 / 2187.0, 64448.0 / 6561.0, -212.0 / 729.0, 0.0, 0.0],
+    [9017.0 / 3168.0, -355.0 / 33.0, 46732.0 / 5247.0, 49.0 / 176.0, -5103.0 / 18656.0, 0.0],
+    [35.0 / 384.0, 0.0, 500.0 / 1113.0, 125.0 / 192.0, -2187.0 / 6784.0, 11.0 / 84.0],
+])
+DP_B = np.array([35.0 / 384.0, 0.0, 500.0 / 1113.0, 125.0 / 192.0, -2187.0 / 6784.0, 11.0 / 84.0, 0.0])
+DP_E = np.array([-71.0 / 57600.0, 0.0, 71.0 / 16695.0, -71.0 / 1920.0, 17253.0 / 339200.0, -22.0 / 525.0, 1.0 / 40.0])
+# 4th order continuous extension, y(t + theta h) = y + h K^T P [theta, theta^2, theta^3, theta^4]
+DP_P = np.array([
+    [1.0, -8048581381.0 / 2820520608.0, 8663915743.0 / 2820520608.0, -12715105075.0 / 11282082432.0],
+    [0.0, 0.0, 0.0, 0.0],
+    [0.0, 131558114200.0 / 32700410799.0, -68118460800.0 / 10900136933.0, 87487479700.0 / 32700410799.0],
+    [0.0, -1754552775.0 / 470086768.0, 14199869525.0 / 1410260304.0, -10690763975.0 / 1880347072.0],
+    [0.0, 127303824393.0 / 49829197408.0, -318862633887.0 / 49829197408.0, 701980252875.0 / 199316789632.0],
+    [0.0, -282668133.0 / 205662961.0, 2019193451.0 / 616988883.0, -1453857185.0 / 822651844.0],
+    [0.0, 40617522.0 / 29380423.0, -110615467.0 / 29380423.0, 69997945.0 / 29380423.0],
+])
+
+SAFETY = 0.9
+MIN_FACTOR = 0.2
+MAX_FACTOR = 10.0
+
+# member status codes
+RUNNING, REACHED_END, TOUCHDOWN, FAILED, LIMIT_EXCEEDED, SKIPPED = -2, 0, 1, -1, 2, 3
+
+
+class EnsembleResult:
+    def __init__(self, t_eval, y, t_end, y_end, status, n_steps, peaks):
+        self.t_eval = t_eval  # (n_t,) sample times shared by all members
+        self.y = y  # (N, n_t, 6) sampled states, NaN after a member terminates
+        self.t_end = t_end  # (N,) final time of each member
+        self.y_end = y_end  # (N, 6) final state of each member
+        self.status = status  # (N,) 0 reached tf, 1 altitude event, 2 deceleration or drag power limit, 3 skipped out, -1 failed
+        self.n_steps = n_steps  # (N,) accepted steps per member
+        self.peak_deceleration = peaks[:, 0]  # (N,) largest drag acceleration at the accepted steps (m/s^2), NaN if not tracked
+        self.peak_drag_power = peaks[:, 1]  # (N,) largest |a_drag| |v_rel| at the accepted steps (W/kg), NaN if not tracked
+
+    def __len__(self):
+        return self.y_end.shape[0]
+
+
+@njit(cache=True)
+def _error_norm(err, y, y_new, rtol, atol):
+    total = 0.0
+    for j in range(6):
+        scale = atol[j] + rtol * max(abs(y[j]), abs(y_new[j]))
+        total += (err[j] / scale) ** 2
+    return np.sqrt(total / 6.0)
+
+
+@njit(cache=True)
+def _dense_output(y, K, h, theta):
+    # dense output inside an accepted step, theta in [0, 1]
+    out = y.copy()
+    for s in range(7):
+        weight = 0.0
+        power = 1.0
+        for p in range(4):
+            power *= theta
+            weight += DP_P[s, p] * power
+        out += h * weight * K[s]
+    return out
+
+
+@njit(cache=True)
+def _initial_step(t, y, f, params, direction, rtol, atol):
+    # Hairer's starting step heuristic, as in scipy's select_initial_step
+    scale = atol + np.abs(y) * rtol
+    d0 = np.sqrt(np.mean((y / scale) ** 2))
+    d1 = np.sqrt(np.mean((f / scale) ** 2))
+    h0 = 1e-6 if d0 < 1e-5 or d1 < 1e-5 else 0.01 * d0 / d1
+    f1 = state_derivative_numba(t + h0 * direction, y + h0 * direction * f, params)
+    d2 = np.sqrt(np.mean(((f1 - f) / scale) ** 2)) / h0
+    if d1 <= 1e-15 and d2 <= 1e-15:
+        h1 = max(1e-6, h0 * 1e-3)
+    else:
+        h1 = (0.01 / max(d1, d2)) ** (1.0 / 5.0)
+    return min(100 * h0, h1)
+
+
+@njit(cache=True)
+def _propagate_member(y0, params, t0, tf, t_eval, rtol, atol, stop_altitude, max_steps, out_y, y_end, skip_altitude, max_deceleration,
+                      max_drag_power, track_peaks, peaks):
+    t = t0
+    y = y0.copy()
+    f = state_derivative_numba(t, y, params)
+    h = _initial_step(t, y, f, params, 1.0, rtol, atol)
+    K = np.empty((7, 6))
+    n_eval = t_eval.shape[0]
+    k_eval = 0
+    while k_eval < n_eval and t_eval[k_eval] < t0:
+        k_eval += 1
+    if k_eval < n_eval and t_eval[k_eval] == t0:
+        out_y[k_eval] = y
+        k_eval += 1
+    altitude = euclidean_norm(y[0:3]) - EARTH_R - stop_altitude
+    # a member skips out when it climbs back above skip_altitude after going below it
+    entered = altitude + stop_altitude < skip_altitude
+    peaks[:] = np.nan
+
+    n_steps = 0
+    while t < tf:
+        if n_steps >= max_steps:
+            y_end[:] = y
+            return t, FAILED, n_steps
+        h = min(h, tf - t)
+        if h < 1e-12 * max(1.0, abs(t)):
+            y_end[:] = y
+            return t, FAILED, n_steps
+
+        K[0] = f
+        for s in range(1, 7):
+            dy = np.zeros(6)
+            for j in range(s):
+                dy += DP_A[s, j] * K[j]
+            K[s] = state_derivative_numba(t + DP_C[s] * h, y + h * dy, params)
+        y_new = y.copy()
+        err = np.zeros(6)
+        for s in range(7):
+            y_new += h * DP_B[s] * K[s]
+            err += h * DP_E[s] * K[s]
+        f_new = K[6].copy()  # first same as last: the 7th stage is f(t + h, y_new)
+        err_norm = _error_norm(err, y, y_new, rtol, atol)
+
+        if err_norm > 1.0:
+            h *= max(MIN_FACTOR, SAFETY * err_norm ** -0.2)
+            continue
+
+        n_steps += 1
+        t_new = t + h
+        status = RUNNING
+        altitude_new = euclidean_norm(y_new[0:3]) - EARTH_R - stop_altitude
+        if altitude >= 0.0 and altitude_new < 0.0:
+            # locate the altitude crossing on the interpolant by bisection and stop there
+            lo, hi = 0.0, 1.0
+            for _ in range(60):
+                mid = 0.5 * (lo + hi)
+                y_mid = _dense_output(y, K, h, mid)
+                if euclidean_norm(y_mid[0:3]) - EARTH_R - stop_altitude >= 0.0:
+                    lo = mid
+                else:
+                    hi = mid
+            theta_end = hi
+            t_new = t + theta_end * h
+            status = TOUCHDOWN
+        else:
+            theta_end = 1.0
+
+        while k_eval < n_eval and t_eval[k_eval] <= t_new:
+            out_y[k_eval] = _dense_output(y, K, h, (t_eval[k_eval] - t) / h)
+            k_eval += 1
+
+        if status == TOUCHDOWN:
+            y_end[:] = _dense_output(y, K, h, theta_end)
+            return t_new, TOUCHDOWN, n_steps
+
+        if track_peaks:
+            # checked at the accepted steps: enough to tell a limit was exceeded, the run stops right after
+            a_drag, v_rel = drag_numba(t_new, y_new, params)
+            deceleration = euclidean_norm(a_drag)
+            drag_power = deceleration * euclidean_norm(v_rel)
+            if not deceleration <= peaks[0]:
+                peaks[0] = deceleration
+            if not drag_power <= peaks[1]:
+                peaks[1] = drag_power
+            if deceleration > max_deceleration or drag_power > max_drag_power:
+                y_end[:] = y_new
+                return t_new, LIMIT_EXCEEDED, n_steps
+        if altitude_new + stop_altitude < skip_altitude:
+            entered = True
+        elif entered:
+            y_end[:] = y_new
+            return t_new, SKIPPED, n_steps
+
+        t, y, f, altitude = t_new, y_new, f_new, altitude_new
+        if err_norm == 0.0:
+            h *= MAX_FACTOR
+        else:
+            h *= min(MAX_FACTOR, SAFETY * err_norm ** -0.2)
+
+    y_end[:] = y
+    return t, REACHED_END, n_steps
+
+
+# cached on disk: the parallel kernel takes tens of seconds to compile, and quick looks and output
+# sampling run it before every full run
+@njit(parallel=True, cache=True)
+def _propagate_ensemble(y0s, params, t0, tf, t_eval, rtol, atol, stop_altitude, max_steps, out_y, t_end, y_end, status, n_steps,
+                        skip_altitude, max_deceleration, max_drag_power, track_peaks, peaks):
+    for i in prange(y0s.shape[0]):
+        # rows of a parallel loop are typed as non-contiguous, the gravity field kernel needs a contiguous one
+        t_end[i], status[i], n_steps[i] = _propagate_member(
+            y0s[i], np.ascontiguousarray(params[i]), t0, tf, t_eval, rtol, atol, stop_altitude, max_steps, out_y[i], y_end[i],
+            skip_altitude, max_deceleration, max_drag_power, track_peaks, peaks[i]
+        )
+
+
+def propagate_ensemble(y0s, params, t_span, t_eval=None, rtol=1e-8, atol=1e-10, stop_altitude=1000.0, max_steps=1000000,
+                       skip_altitude=None, max_deceleration=np.inf, max_drag_power=np.inf, track_peaks=False):
+    '''
+    Propagates N vehicles at once with a compiled Dormand-Prince 5(4) integrator. Every member has
+    its own step size control and stops on its own when it crosses stop_altitude; members run in
+    parallel across cores and share the force model kernel of SpacecraftModel.run_simulation.
+    :param y0s: (N, 6) initial ECI states
+    :param params: (N, n) force model parameters from force_model_params (n > N_PARAMS with a gravity field)
+    :param t_span: (t0, tf) in seconds
+    :param t_eval: optional sample times shared by all members
+    :param rtol: relative tolerance
+    :param atol: absolute tolerance, scalar or per state component
+    :param stop_altitude: terminal altitude (m), same as the run_simulation altitude event
+    :param max_steps: step limit per member
+    :param skip_altitude: optional altitude (m): a member that climbs back above it after going below stops as SKIPPED
+    :param max_deceleration: drag acceleration (m/s^2) past which a member stops as LIMIT_EXCEEDED
+    :param max_drag_power: |a_drag| |v_rel| (W/kg, heat flux per unit mass and ablation efficiency) past which a member stops as LIMIT_EXCEEDED
+    :param track_peaks: record peak deceleration and drag power, implied by a finite limit
+    :return: EnsembleResult
+    '''
+    y0s = np.ascontiguousarray(np.atleast_2d(y0s), dtype=np.float64)
+    n = y0s.shape[0]
+    # always a copy: each member owns its row, including the scratch of a gravity field
+    params = np.array(np.broadcast_to(params, (n, params.shape[-1])), dtype=np.float64)
+    t_eval = np.empty(0) if t_eval is None else np.ascontiguousarray(t_eval, dtype=np.float64)
+    atol = np.ascontiguousarray(np.broadcast_to(atol, (6,)), dtype=np.float64)
+
+    out_y = np.full((n, t_eval.shape[0], 6), np.nan)
+    t_end = np.empty(n)
+    y_end = np.empty((n, 6))
+    status = np.empty(n, dtype=np.int64)
+    n_steps = np.empty(n, dtype=np.int64)
+    peaks = np.empty((n, 2))
+    track_peaks = bool(track_peaks or np.isfinite(max_deceleration) or np.isfinite(max_drag_power))
+    _propagate_ensemble(y0s, params, float(t_span[0]), float(t_span[1]), t_eval, float(rtol), atol,
+                        float(stop_altitude), int(max_steps), out_y, t_end, y_end, status, n_steps,
+                        -np.inf if skip_altitude is None else float(skip_altitude), float(max_deceleration), float(max_drag_power), track_peaks, peaks)
+    return EnsembleResult(t_eval, out_y, t_end, y_end, status, n_steps, peaks)
@@ -0,0 +1,229 @@
+import numpy as np
+from scipy.optimize import brentq, minimize_scalar
+
+EPS = np.finfo(float).eps
+
+
+class ThresholdEvent:
+    '''
+    Fires when quantity(t, y) crosses threshold. Follows the solve_ivp event conventions, so it can
+    be passed anywhere a plain event function is accepted.
+    '''
+    def __init__(self, name, quantity, threshold=0.0, direction=0, terminal=False, after=None):
+        '''
+        :param name: key of the event in Trajectory.events
+        :param quantity: scalar function q(t, y)
+        :param threshold: crossing value
+        :param direction: > 0 rising crossings only, < 0 falling crossings only, 0 both
+        :param terminal: stop the integration at the first crossing
+        :param after: optional name of another threshold event of the same run: crossings before its first one are ignored
+        '''
+        self.name = name
+        self.quantity = quantity
+        self.threshold = threshold
+        self.direction = direction
+        self.terminal = terminal
+        self.after = after
+
+    def __call__(self, t, y):
+        return self.quantity(t, y) - self.threshold
+
+
+class ExtremumEvent:
+    '''
+    Records the global maximum (or minimum) of quantity(t, y) over the whole run. The peak is
+    bracketed by the step end points and refined on the solver's dense output, so its time and
+    value do not depend on the output sampling.
+    '''
+    terminal = False
+
+    def __init__(self, name, quantity, kind='max'):
+        '''
+        :param name: key of the event in Trajectory.events
+        :param quantity: scalar function q(t, y)
+        :param kind: 'max' or 'min'
+        '''
+        if kind not in ('max', 'min'):
+            raise ValueError(f"Unknown extremum kind {kind}, expected 'max' or 'min'")
+        self.name = name
+        self.quantity = quantity
+        self.kind = kind
+        self.sign = 1.0 if kind == 'max' else -1.0
+
+
+class EventRecord:
+    def __init__(self, t, y, value):
+        self.t = t  # (n,) event times
+        self.y = y  # (n, 6) states at the events
+        self.value = value  # (n,) quantity at the events
+
+    def __len__(self):
+        return len(self.t)
+
+
+def event_name(event, i):
+    return getattr(event, 'name', None) or getattr(event, '__name__', f'event_{i}')
+
+
+def find_active_events(g, g_new, direction):
+    # same convention as solve_ivp: direction > 0 rising, < 0 falling, 0 both
+    g, g_new = np.asarray(g), np.asarray(g_new)
+    up = (g <= 0) & (g_new >= 0)
+    down = (g >= 0) & (g_new <= 0)
+    either = up | down
+    mask = up & (direction > 0) | down & (direction < 0) | either & (direction == 0)
+    return np.nonzero(mask)[0]
+
+
+class _ExtremumTracker:
+    # running state of one ExtremumEvent: the last two step end points and the best peak so far
+    def __init__(self, event, t0, y0):
+        self.event = event
+        self.q_before = -np.inf
+        self.t_before = t0
+        self.sol_before = None
+        self.t_last, self.y_last = t0, y0
+        self.q_last = self.value(t0, y0)
+        self.best = (self.q_last, t0, y0)
+
+    def value(self, t, y):
+        return self.event.sign * self.event.quantity(t, y)
+
+    def refine(self, t_start, t_end, sol):
+        result = minimize_scalar(lambda s: -self.value(s, sol(s)), bounds=(min(t_start, t_end), max(t_start, t_end)), method='bounded',
+                                 options={'xatol': 1e-6 * max(1.0, abs(t_end - t_start))})
+        return -result.fun, result.x, sol(result.x)
+
+    def step(self, t, y, sol):
+        q = self.value(t, y)
+        if self.q_last >= self.q_before and self.q_last >= q and (self.q_last > self.q_before or self.q_last > q):
+            # the step end points peak at t_last: a local extremum lies in one of the two adjacent steps
+            candidates = [self.refine(self.t_last, t, sol)]
+            if self.sol_before is not None:
+                candidates.append(self.refine(self.t_before, self.t_last, self.sol_before))
+            candidates.append((self.q_last, self.t_last, self.y_last))
+            candidates.append(self.best)
+            self.best = max(candidates, key=lambda candidate: candidate[0])
+        self.q_before, self.t_before, self.sol_before = self.q_last, self.t_last, sol
+        self.q_last, self.t_last, self.y_last = q, t, y
+
+    def current(self):
+        # an extremum still growing at the end of the run is the end point itself
+        value, t, y = max(self.best, (self.q_last, self.t_last, self.y_last), key=lambda candidate: candidate[0])
+        return t, y, self.event.sign * value
+
+    def finish(self):
+        return self.current()
+
+
+class EventEngine:
+    '''
+    Locates threshold and extremum events while a propagation runs, using the dense output of every
+    accepted step. Plain solve_ivp style event functions are treated as thresholds at zero.
+    A propagation resumed from a checkpoint passes the records found so far as previous: threshold
+    crossings are appended to them and extrema compete with the previous peak.
+    '''
+    def __init__(self, events, previous=None):
+        self.events = list(events)
+        self.previous = previous or {}
+        self.names = [event_name(event, i) for i, event in enumerate(self.events)]
+        self.thresholds = [i for i, event in enumerate(self.events) if not isinstance(event, ExtremumEvent)]
+        self.extrema = [i for i, event in enumerate(self.events) if isinstance(event, ExtremumEvent)]
+        self.terminal = np.array([getattr(self.events[i], 'terminal', False) for i in self.thresholds], dtype=bool)
+        self.direction = np.array([getattr(self.events[i], 'direction', 0) for i in self.thresholds], dtype=float)
+        # index of the event each threshold waits for, or None
+        self.after = []
+        for i in self.thresholds:
+            after = getattr(self.events[i], 'after', None)
+            if after is not None and after not in [self.names[j] for j in self.thresholds]:
+                raise ValueError(f"Event {self.names[i]} waits for {after}, which is not a threshold event of the run")
+            self.after.append(None if after is None else self.names.index(after))
+        self.t_events = [[] for _ in self.events]
+        self.y_events = [[] for _ in self.events]
+        self.values = [[] for _ in self.events]
+
+    def start(self, t0, y0):
+        self.n_state = len(y0)
+        self.t0 = t0
+        self.g = [self.events[i](t0, y0) for i in self.thresholds]
+        self.trackers = [_ExtremumTracker(self.events[i], t0, y0) for i in self.extrema]
+        for i, name in enumerate(self.names):
+            record = self.previous.get(name)
+            if record is None or len(record) == 0:
+                continue
+            if i in self.thresholds:
+                self.t_events[i], self.y_events[i], self.values[i] = list(record.t), list(record.y), list(record.value)
+            else:
+                tracker = self.trackers[self.extrema.index(i)]
+                tracker.best = max(tracker.best, (tracker.event.sign * record.value[0], record.t[0], record.y[0]), key=lambda candidate: candidate[0])
+
+    def step(self, t_old, t, y, dense_output):
+        '''
+        Checks one accepted step for events
+        :param t_old: start of the step
+        :param t: end of the step
+        :param y: state at t
+        :param dense_output: callable building the step interpolant (OdeSolver.dense_output)
+        :return: the interpolant if it was built (or None), and the time of a terminal event (or None)
+        '''
+        sol = None
+        t_terminal = None
+        if self.thresholds:
+            g_new = [self.events[i](t, y) for i in self.thresholds]
+            active = find_active_events(self.g, g_new, self.direction)
+            if active.size > 0:
+                sol = dense_output()
+                roots = [brentq(lambda s, e=self.events[self.thresholds[k]]: e(s, sol(s)), t_old, t, xtol=4 * EPS, rtol=4 * EPS) for k in active]
+                order = np.argsort(roots) if t > t_old else np.argsort(roots)[::-1]
+                active, roots = active[order], np.asarray(roots)[order]
+                if np.any(self.terminal[active]):
+                    first = np.argmax(self.terminal[active])
+                    active, roots = active[:first + 1], roots[:first + 1]
+                    t_terminal = roots[-1]
+                for k, root in zip(active, roots):
+                    i = self.thresholds[k]
+                    if root == self.t0 and self.t_events[i] and self.t_events[i][-1] == root:
+                        continue  # the crossing a resumed run stopped at, already recorded
+                    if self.after[k] is not None and not self.t_events[self.after[k]]:
+                        continue  # the event it waits for has not happened yet (earlier crossings of this step are recorded first)
+                    y_root = sol(root)
+                    self.t_events[i].append(root)
+                    self.y_events[i].append(y_root)
+                    self.values[i].append(self.events[i].threshold if isinstance(self.events[i], ThresholdEvent) else 0.0)
+            self.g = g_new
+
+        if self.extrema:
+            if sol is None:
+                sol = dense_output()
+            if t_terminal is not None:
+                t, y = t_terminal, sol(t_terminal)
+            for tracker in self.trackers:
+                tracker.step(t, y, sol)
+        return sol, t_terminal
+
+    def finish(self):
+        for i, tracker in zip(self.extrema, self.trackers):
+            t, y, value = tracker.finish()
+            self.t_events[i].append(t)
+            self.y_events[i].append(y)
+            self.values[i].append(value)
+
+    def records(self):
+        '''
+        :return: dict of EventRecord by event name, including previous records of events no longer tracked
+        '''
+        records = dict(self.previous)
+        for name, t, y, value in zip(self.names, self.t_events, self.y_events, self.values):
+            records[name] = EventRecord(np.asarray(t, dtype=float), np.asarray(y, dtype=float).reshape(len(t), self.n_state), np.asarray(value, dtype=float))
+        return records
+
+    def snapshot(self):
+        '''
+        Records found so far, with the extrema as they stand now, for a checkpoint
+        :return: dict of EventRecord by event name
+        '''
+        records = self.records()
+        for i, tracker in zip(self.extrema, self.trackers):
+            t, y, value = tracker.current()
+            records[self.names[i]] = EventRecord(np.array([t]), np.reshape(y, (1, self.n_state)), np.array([value]))
+        return records
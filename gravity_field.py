@@ -0,0 +1,214 @@
+import math
+from functools import lru_cache
+import numpy as np
+from numba import njit
+from constants import EARTH_MU, EARTH_R, EARTH_J2
+
+# Spherical harmonic gravity field, evaluated with the Cunningham recursion of the fully normalized
+# V_nm, W_nm terms (Montenbruck & Gill, Satellite Orbits, 3.2.4). The field is packed into one float
+# array that is appended to the force model parameters (see spacecraft_model.force_model_params):
+#
+#   [degree, order, mu, R, C, S, A, B, K_PLUS, K_MINUS, K_Z, V, W]
+#
+# every block is a (degree + 2)^2 matrix. C, S are the coefficients; A, B, K_* the recursion and
+# acceleration factors, computed once per field; V, W the recursion scratch, so an evaluation does not
+# allocate. Each ensemble member gets its own copy of the parameters, so scratch is never shared.
+FIELD_HEADER = 4
+FIELD_BLOCKS = 9
+F_C, F_S, F_A, F_B, F_K_PLUS, F_K_MINUS, F_K_Z, F_V, F_W = range(FIELD_BLOCKS)
+
+
+def _log_norm(n, m):
+    # log of the normalization P_nm(fully normalized) / P_nm
+    return 0.5 * (math.log(1.0 if m == 0 else 2.0) + math.log(2 * n + 1) + math.lgamma(n - m + 1) - math.lgamma(n + m + 1))
+
+
+class GravityField:
+    '''
+    Fully normalized spherical harmonic coefficients, truncated to a degree and order
+    '''
+    def __init__(self, C, S, mu, R, degree=None, order=None, name=''):
+        '''
+        :param C: (n_max + 1, n_max + 1) fully normalized C_nm, C[n, m]
+        :param S: (n_max + 1, n_max + 1) fully normalized S_nm
+        :param mu: gravitational parameter of the field in m^3/s^2
+        :param R: reference radius of the field in m
+        :param degree: maximum degree used, all of C by default
+        :param order: maximum order used, degree by default
+        '''
+        n_max = C.shape[0] - 1
+        self.degree = n_max if degree is None else degree
+        self.order = self.degree if order is None else order
+        if not 2 <= self.degree <= n_max:
+            raise ValueError(f"Gravity field degree must be between 2 and {n_max}, got {self.degree}")
+        if not 0 <= self.order <= self.degree:
+            raise ValueError(f"Gravity field order must be between 0 and the degree {self.degree}, got {self.order}")
+        self.C = np.array(C[:self.degree + 1, :self.degree + 1], dtype=np.float64)
+        self.S = np.array(S[:self.degree + 1, :self.degree + 1], dtype=np.float64)
+        self.C[:, self.order + 1:] = 0.0
+        self.S[:, self.order + 1:] = 0.0
+        self.mu = mu
+        self.R = R
+        self.name = name
+
+    @classmethod
+    def from_j2(cls, mu=EARTH_MU, R=EARTH_R, J2=EARTH_J2):
+        '''
+        Degree 2 zonal field equivalent to the default point mass + J2 model
+        '''
+        C = np.zeros((3, 3))
+        S = np.zeros((3, 3))
+        C[0, 0] = 1.0
+        C[2, 0] = -J2 / math.sqrt(5.0)
+        return cls(C, S, mu, R, name='J2')
+
+    def pack(self):
+        '''
+        :return: float array of the field, coefficients, recursion factors and scratch (see FIELD_BLOCKS)
+        '''
+        size = self.degree + 2
+        blocks = np.zeros((FIELD_BLOCKS, size, size))
+        blocks[F_C, :self.degree + 1, :self.degree + 1] = self.C
+        blocks[F_S, :self.degree + 1, :self.degree + 1] = self.S
+
+        A, B = blocks[F_A], blocks[F_B]
+        for m in range(1, size):
+            # sectorial terms, stored on the diagonal of A
+            A[m, m] = math.sqrt(3.0) if m == 1 else math.sqrt((2 * m + 1) / (2 * m))
+        for m in range(size):
+            for n in range(m + 1, size):
+                A[n, m] = math.sqrt((2 * n + 1) * (2 * n - 1) / ((n - m) * (n + m)))
+                if n > m + 1:
+                    B[n, m] = math.sqrt((2 * n + 1) * (n + m - 1) * (n - m - 1) / ((2 * n - 3) * (n + m) * (n - m)))
+
+        # the unnormalized acceleration terms (M&G 3.33) rewritten for normalized V, W
+        for n in range(self.degree + 1):
+            for m in range(n + 1):
+                blocks[F_K_PLUS, n, m] = math.exp(_log_norm(n, m) - _log_norm(n + 1, m + 1))
+                blocks[F_K_Z, n, m] = (n - m + 1) * math.exp(_log_norm(n, m) - _log_norm(n + 1, m))
+                if m > 0:
+                    blocks[F_K_MINUS, n, m] = (n - m + 2) * (n - m + 1) * math.exp(_log_norm(n, m) - _log_norm(n + 1, m - 1))
+        return np.concatenate((np.array([self.degree, self.order, self.mu, self.R], dtype=np.float64), blocks.ravel()))
+
+    def acceleration(self, r_ecef):
+        '''
+        :param r_ecef: Earth-fixed position in m
+        :return: Earth-fixed acceleration in m/s^2, central term included
+        '''
+        return spherical_harmonic_acceleration(np.asarray(r_ecef, dtype=np.float64), self.pack())
+
+
+@njit
+def spherical_harmonic_acceleration(r, field):
+    '''
+    Acceleration of a packed field (GravityField.pack) at an Earth-fixed position, central term included
+    '''
+    degree = int(field[0])
+    order = int(field[1])
+    mu = field[2]
+    R = field[3]
+    size = degree + 2
+    block = size * size
+    blocks = field[FIELD_HEADER:FIELD_HEADER + FIELD_BLOCKS * block]
+    C = blocks[F_C * block:(F_C + 1) * block].reshape((size, size))
+    S = blocks[F_S * block:(F_S + 1) * block].reshape((size, size))
+    A = blocks[F_A * block:(F_A + 1) * block].reshape((size, size))
+    B = blocks[F_B * block:(F_B + 1) * block].reshape((size, size))
+    K_PLUS = blocks[F_K_PLUS * block:(F_K_PLUS + 1) * block].reshape((size, size))
+    K_MINUS = blocks[F_K_MINUS * block:(F_K_MINUS + 1) * block].reshape((size, size))
+    K_Z = blocks[F_K_Z * block:(F_K_Z + 1) * block].reshape((size, size))
+    V = blocks[F_V * block:(F_V + 1) * block].reshape((size, size))
+    W = blocks[F_W * block:(F_W + 1) * block].reshape((size, size))
+
+    x, y, z = r[0], r[1], r[2]
+    r2 = x * x + y * y + z * z
+    rho = R / r2
+    x0, y0, z0, rho2 = x * rho, y * rho, z * rho, R * rho
+
+    # V_nm, W_nm up to degree + 1 and order + 1: zonal/tesseral terms from the sectorial ones
+    V[0, 0] = R / math.sqrt(r2)
+    W[0, 0] = 0.0
+    for m in range(order + 2):
+        if m > 0:
+            V[m, m] = A[m, m] * (x0 * V[m - 1, m - 1] - y0 * W[m - 1, m - 1])
+            W[m, m] = A[m, m] * (x0 * W[m - 1, m - 1] + y0 * V[m - 1, m - 1])
+        if m + 1 < size:
+            V[m + 1, m] = A[m + 1, m] * z0 * V[m, m]
+            W[m + 1, m] = A[m + 1, m] * z0 * W[m, m]
+        for n in range(m + 2, size):
+            V[n, m] = A[n, m] * z0 * V[n - 1, m] - B[n, m] * rho2 * V[n - 2, m]
+            W[n, m] = A[n, m] * z0 * W[n - 1, m] - B[n, m] * rho2 * W[n - 2, m]
+
+    # smallest terms first
+    ax = ay = az = 0.0
+    for n in range(degree, -1, -1):
+        for m in range(min(n, order), -1, -1):
+            c = C[n, m]
+            s = S[n, m]
+            if m == 0:
+                ax -= K_PLUS[n, 0] * c * V[n + 1, 1]
+                ay -= K_PLUS[n, 0] * c * W[n + 1, 1]
+            else:
+                ax += 0.5 * (K_PLUS[n, m] * (-c * V[n + 1, m + 1] - s * W[n + 1, m + 1])
+                             + K_MINUS[n, m] * (c * V[n + 1, m - 1] + s * W[n + 1, m - 1]))
+                ay += 0.5 * (K_PLUS[n, m] * (-c * W[n + 1, m + 1] + s * V[n + 1, m + 1])
+                             + K_MINUS[n, m] * (-c * W[n + 1, m - 1] + s * V[n + 1, m - 1]))
+            az += K_Z[n, m] * (-c * V[n + 1, m] - s * W[n + 1, m])
+    scale = mu / (R * R)
+    return np.array([ax * scale, ay * scale, az * scale])
+
+
+@njit
+def field_j2(field):
+    # J2 of a packed field, in the units of the default J2 model
+    size = int(field[0]) + 2
+    return -math.sqrt(5.0) * field[FIELD_HEADER + F_C * size * size + 2 * size]
+
+
+def _icgem_float(text):
+    # ICGEM files may use Fortran exponents (0.1D+01)
+    return float(text.replace('D', 'E').replace('d', 'e'))
+
+
+@lru_cache(maxsize=8)
+def load_icgem(path, degree, order=None):
+    '''
+    Reads a static gravity field in the ICGEM format (.gfc, e.g. EGM2008 or GGM05C from
+    http://icgem.gfz-potsdam.de). Only the coefficients up to degree are kept.
+    :param path: coefficient file
+    :param degree: maximum degree
+    :param order: maximum order, degree by default
+    :return: GravityField
+    '''
+    header = {}
+    C = np.zeros((degree + 1, degree + 1))
+    S = np.zeros((degree + 1, degree + 1))
+    with open(path) as file:
+        for line in file:
+            fields = line.split()
+            if not fields:
+                continue
+            if fields[0] == 'end_of_head':
+                break
+            header[fields[0]] = fields[1] if len(fields) > 1 else ''
+        else:
+            raise ValueError(f"{path} is not an ICGEM file: no end_of_head line")
+        if header.get('norm', 'fully_normalized') != 'fully_normalized':
+            raise ValueError(f"{path}: only fully normalized coefficients are supported, got norm {header['norm']}")
+        n_max = 0
+        for line in file:
+            fields = line.split()
+            # static coefficients; time variable models (gfct + trnd/acos/asin) are read at their reference epoch
+            if not fields or fields[0] not in ('gfc', 'gfct'):
+                continue
+            n, m = int(fields[1]), int(fields[2])
+            if n <= degree and m <= degree:
+                C[n, m] = _icgem_float(fields[3])
+                S[n, m] = _icgem_float(fields[4])
+                n_max = max(n_max, n)
+    if n_max < degree:
+        raise ValueError(f"{path} only has coefficients up to degree {n_max}, {degree} requested")
+    if C[0, 0] == 0.0:
+        C[0, 0] = 1.0  # some files leave out the central term
+    name = header.get('modelname', path)
+    return GravityField(C, S, _icgem_float(header['earth_gravity_constant']), _icgem_float(header['radius']), degree, order, name)
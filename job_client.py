@@ -0,0 +1,102 @@
+import io
+import json
+import urllib.error
+import urllib.request
+import uuid
+import numpy as np
+from jobs import JobLimitError, QueueFullError, FINISHED
+from trajectory import trajectory_from_metadata
+
+
+class JobServiceClient:
+    '''
+    Thin client of job_service.py. Jobs it returns behave like jobs.Job (status, progress, elapsed,
+    error, done, result, touch(), cancel()), so a front end can switch between local and remote runs.
+    '''
+    def __init__(self, url='http://localhost:8503', client_id=None, timeout=10.0):
+        self.url = url.rstrip('/')
+        self.client_id = client_id or uuid.uuid4().hex
+        self.timeout = timeout
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.url + path, data=data, method=method,
+                                         headers={'Content-Type': 'application/json', 'X-Client-Id': self.client_id})
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as error:
+            message = json.loads(error.read() or b'{}').get('error', error.reason)
+            if error.code == 429:
+                raise JobLimitError(message) from None
+            if error.code == 503:
+                raise QueueFullError(f"{message}, retry in {error.headers.get('Retry-After', '?')} s") from None
+            if error.code == 400:
+                raise ValueError(message) from None
+            raise
+
+    def json(self, method, path, body=None):
+        with self.request(method, path, body) as response:
+            return json.load(response)
+
+    def submit(self, scenario, diagnostics=True, resume=None):
+        '''
+        :param scenario: dict of scenario.SCENARIO_DEFAULTS inputs
+        :param diagnostics: let the worker also compute the thermal diagnostic columns
+        :param resume: id of a finished job of the same scenario with a shorter tf to continue
+        :return: RemoteJob
+        '''
+        return RemoteJob(self, self.json('POST', '/jobs', {'scenario': scenario, 'diagnostics': diagnostics, 'resume': resume}))
+
+    def health(self):
+        return self.json('GET', '/health')
+
+
+class RemoteJob:
+    def __init__(self, client, status):
+        self.client = client
+        self.id = status['id']
+        self._result = None
+        self.update(status)
+
+    def update(self, status):
+        self.status = status['status']
+        self.progress = status['progress']
+        self.elapsed = status['elapsed']
+        self.error = status['error']
+
+    @property
+    def done(self):
+        return self.status in FINISHED
+
+    def touch(self):
+        # polling is what keeps a job alive on the service
+        self.update(self.client.json('GET', f'/jobs/{self.id}'))
+
+    def cancel(self):
+        self.update(self.client.json('DELETE', f'/jobs/{self.id}'))
+
+    def events(self):
+        '''
+        Follows the job's server-sent events until it finishes, updating the job on the way
+        :return: generator of (event, status dict)
+        '''
+        with self.client.request('GET', f'/jobs/{self.id}/events') as response:
+            event = None
+            for line in response:
+                line = line.decode().rstrip('\n')
+                if line.startswith('event: '):
+                    event = line[7:]
+                elif line.startswith('data: '):
+                    status = json.loads(line[6:])
+                    self.update(status)
+                    yield event, status
+
+    @property
+    def result(self):
+        # the finished trajectory, downloaded once
+        if self._result is None and self.status == 'done':
+            metadata = self.client.json('GET', f'/jobs/{self.id}/result')
+            with self.client.request('GET', f'/jobs/{self.id}/trajectory.npy') as response:
+                buffer = np.load(io.BytesIO(response.read()))
+            self._result = trajectory_from_metadata(buffer, metadata)
+        return self._result
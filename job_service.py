@@ -0,0 +1,456 @@
+'''
+Local simulation job service. Scenarios are submitted over HTTP, wait in a bounded queue and run on
+a pool of worker processes that import and JIT-compile the force model once at start-up, so the
+front ends (Streamlit, Electron) stay thin clients and heavy runs never share their process.
+
+    python job_service.py --port 8503 --workers 2 --max-queue 8
+
+POST   /jobs                      {"scenario": {...}, "diagnostics": true, "resume": null} -> 202 {"id": ...}
+                                  resume: id of a finished job of the same scenario with a shorter tf,
+                                  which is continued from its checkpoint instead of starting at t=0
+                                  429 when the client already has its maximum of unfinished jobs,
+                                  503 (with Retry-After) when the queue is full
+GET    /jobs/<id>                 status and progress (also keeps the job alive)
+GET    /jobs/<id>/events          server-sent events: progress, then done / failed / cancelled
+GET    /jobs/<id>/result          trajectory metadata and events as JSON
+GET    /jobs/<id>/trajectory.npy  trajectory buffer (n_columns, n_samples) as a .npy file
+GET    /jobs/<id>/trajectory.csv  trajectory as CSV
+DELETE /jobs/<id>                 cancel (stops the integrator at its next step)
+GET    /health                    worker and queue state
+
+Clients identify themselves with an X-Client-Id header for the per-client limit. Scenario inputs naming
+a data file (DATA_FILE_INPUTS) take a plain file name in the service's --data-dir, and are refused when
+the service has none.
+'''
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing.connection import wait
+from urllib.parse import urlparse
+from jobs import Job, JobCancelled, JobLimitError, QueueFullError, QUEUED, RUNNING, DONE, FAILED, CANCELLED
+
+PROGRESS_INTERVAL = 0.1  # seconds between progress messages from a worker
+EVENTS_INTERVAL = 0.25  # seconds between server-sent progress events
+# compile the explicit and implicit kernels, and the ensemble kernel of the max_points pilot (see sampling.py)
+WARMUP_SCENARIOS = ({'tf': 60, 'dt': 10, 'sim_type': 'RK45', 'max_points': 20}, {'tf': 60, 'dt': 10, 'sim_type': 'Radau'})
+# scenario inputs the workers open as files (a space weather file also gets its parsed .npy written next to it)
+DATA_FILE_INPUTS = ('gravity_file', 'space_weather_file')
+
+
+# ------------------
+# WORKER PROCESS
+# ------------------
+
+def worker_main(conn):
+    '''
+    Worker process loop. Messages from the service: ('run', job_id, scenario, store_path, diagnostics, resume_path),
+    ('cancel', job_id) and ('stop',). Messages to it: ('ready',), ('progress', job_id, progress, elapsed),
+    ('done', job_id), ('failed', job_id, message) and ('cancelled', job_id).
+    '''
+    # pre-warm: imports and numba compilation happen once per worker, not once per job
+    from scenario import run_scenario
+    from trajectory import TrajectoryStore
+    for scenario in WARMUP_SCENARIOS:
+        run_scenario(scenario, diagnostics=True)
+    conn.send(('ready',))
+
+    stopping = False
+    while not stopping:
+        message = conn.recv()
+        if message[0] == 'stop':
+            return
+        if message[0] != 'run':
+            continue  # a cancel for a job that already finished
+        _, job_id, scenario, store_path, diagnostics, resume_path = message
+        last_sent = 0.0
+
+        def report(progress, elapsed_time):
+            nonlocal last_sent, stopping
+            while conn.poll():
+                control = conn.recv()
+                stopping = stopping or control[0] == 'stop'
+                if stopping or control == ('cancel', job_id):
+                    raise JobCancelled(job_id)
+            now = time.time()
+            if now - last_sent > PROGRESS_INTERVAL:
+                conn.send(('progress', job_id, progress, elapsed_time))
+                last_sent = now
+
+        try:
+            resume = TrajectoryStore.load(resume_path) if resume_path is not None else None
+            run_scenario(scenario, progress_callback=report, store_path=store_path, diagnostics=diagnostics, resume=resume)
+            conn.send(('done', job_id))
+        except JobCancelled:
+            conn.send(('cancelled', job_id))
+        except Exception as error:
+            conn.send(('failed', job_id, f'{type(error).__name__}: {error}'))
+
+
+class Worker:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+        self.job = None
+
+
+# ------------------
+# SERVICE
+# ------------------
+
+def resolve_data_files(scenario, data_dir):
+    '''
+    Replaces the DATA_FILE_INPUTS of a client's scenario by paths in data_dir, so clients can't make a
+    worker read, or write next to, files anywhere else
+    :param scenario: scenario dict
+    :param data_dir: directory of the data files, None to accept none
+    :return: scenario dict
+    '''
+    resolved = dict(scenario)
+    for name in DATA_FILE_INPUTS:
+        value = scenario[name]
+        if value is None:
+            continue
+        if data_dir is None:
+            raise ValueError(f"{name} is not accepted: the service has no data directory")
+        directory = os.path.realpath(data_dir)
+        path = os.path.realpath(os.path.join(directory, str(value)))
+        # a plain file name, not a path, and no symbolic link out of the directory either
+        if str(value) != os.path.basename(str(value)) or os.path.dirname(path) != directory or not os.path.isfile(path):
+            raise ValueError(f"{name} must be the name of a file in the service's data directory, got {value!r}")
+        resolved[name] = path
+    return resolved
+
+
+class JobService:
+    '''
+    Queue and worker pool behind the HTTP API. One scheduler thread owns the workers: it reads their
+    messages, hands queued jobs to idle workers, and cancels jobs nobody has polled for abandon_after.
+    '''
+    def __init__(self, workers=2, max_queue=8, max_jobs_per_client=2, abandon_after=60.0, keep_finished=300.0, results_dir=None, data_dir=None):
+        '''
+        :param workers: number of worker processes
+        :param max_queue: queued (not yet running) jobs accepted before submissions are refused
+        :param max_jobs_per_client: unfinished jobs allowed per X-Client-Id
+        :param abandon_after: seconds without a poll after which a job is cancelled, None to never
+        :param keep_finished: seconds a finished job and its result are kept
+        :param results_dir: directory for the memory-mapped results, a temporary one by default
+        :param data_dir: directory of the data files scenarios may name (see resolve_data_files), None to accept none
+        '''
+        self.context = multiprocessing.get_context('spawn')  # the service process runs threads, never fork it
+        self.workers = [Worker(self.context) for _ in range(workers)]
+        self.max_queue = max_queue
+        self.max_jobs_per_client = max_jobs_per_client
+        self.abandon_after = abandon_after
+        self.keep_finished = keep_finished
+        self.results_dir = results_dir or tempfile.mkdtemp(prefix='reentry_jobs_')
+        self.data_dir = data_dir
+        self.jobs = {}
+        self.queue = collections.deque()
+        self.lock = threading.Lock()
+        self.ids = 0
+        self.running = True
+        self.scheduler = threading.Thread(target=self._schedule, name='scheduler', daemon=True)
+        self.scheduler.start()
+
+    def submit(self, client, scenario, diagnostics=True, resume=None):
+        from scenario import make_scenario, can_extend
+        scenario = resolve_data_files(make_scenario(**scenario), self.data_dir)  # reject bad input here rather than in a worker
+        with self.lock:
+            base = self.jobs.get(resume) if resume is not None else None
+            if resume is not None and (base is None or base.status != DONE or not can_extend(base.scenario, scenario)):
+                raise ValueError(f"Job {resume} cannot be resumed: it must be a finished job of the same scenario with a shorter tf")
+            if sum(1 for job in self.jobs.values() if job.user == client and not job.done) >= self.max_jobs_per_client:
+                raise JobLimitError(f"Client {client} already has {self.max_jobs_per_client} unfinished jobs")
+            if len(self.queue) >= self.max_queue:
+                raise QueueFullError(f"The queue is full ({self.max_queue} jobs waiting)")
+            self.ids += 1
+            job = Job(f'job-{self.ids}', client, self.abandon_after)
+            job.scenario = scenario
+            job.diagnostics = diagnostics
+            job.store_path = os.path.join(self.results_dir, f'{job.id}.npy')
+            job.resume_path = base.store_path if base is not None else None
+            job.finished = None
+            if base is not None:
+                base.finished = time.time()  # keep the resumed result until this job has read it
+            self.jobs[job.id] = job
+            self.queue.append(job)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is not None and not job.done:
+                self._cancel(job)
+        return job
+
+    def _cancel(self, job):
+        job.cancel()
+        if job.status == QUEUED:
+            self.queue.remove(job)
+            self._finish(job, CANCELLED)
+        else:
+            # the worker stops at its next solver step and answers 'cancelled'
+            for worker in self.workers:
+                if worker.job is job:
+                    worker.conn.send(('cancel', job.id))
+
+    def retry_after(self):
+        # rough wait until a queue slot frees up, for the Retry-After header
+        with self.lock:
+            running = [job for job in self.jobs.values() if job.status == RUNNING]
+        remaining = [job.elapsed * (1 - job.progress) / job.progress for job in running if job.progress > 0]
+        return max(1, int(min(remaining, default=5)))
+
+    def health(self):
+        with self.lock:
+            return {
+                'workers': len(self.workers),
+                'ready': sum(worker.ready for worker in self.workers),
+                'busy': sum(worker.job is not None for worker in self.workers),
+                'queued': len(self.queue),
+                'max_queue': self.max_queue,
+            }
+
+    def _finish(self, job, status, error=None):
+        job.status = status
+        job.error = error
+        job.finished = time.time()
+
+    def _schedule(self):
+        while self.running:
+            conns = {worker.conn: worker for worker in self.workers}
+            for conn in wait(list(conns), timeout=0.1):
+                worker = conns[conn]
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    self._replace(worker)
+                    continue
+                self._handle(worker, message)
+            with self.lock:
+                self._dispatch()
+                self._reap()
+
+    def _handle(self, worker, message):
+        kind = message[0]
+        with self.lock:
+            if kind == 'ready':
+                worker.ready = True
+                return
+            job = worker.job
+            if job is None or job.id != message[1]:
+                return
+            if kind == 'progress':
+                job.progress, job.elapsed = message[2], message[3]
+                return
+            worker.job = None
+            if kind == 'done':
+                job.progress = 1.0
+                self._finish(job, DONE)
+            elif kind == 'cancelled':
+                self._finish(job, CANCELLED)
+            else:
+                self._finish(job, FAILED, message[2])
+
+    def _replace(self, worker):
+        # a worker died (e.g. out of memory): fail its job and start a fresh process
+        with self.lock:
+            if worker.job is not None:
+                self._finish(worker.job, FAILED, f'Worker process exited with code {worker.process.exitcode}')
+                worker.job = None
+            if self.running:
+                self.workers[self.workers.index(worker)] = Worker(self.context)
+
+    def _dispatch(self):
+        for worker in self.workers:
+            if not self.queue:
+                return
+            if worker.ready and worker.job is None:
+                job = self.queue.popleft()
+                job.status = RUNNING
+                worker.job = job
+                worker.conn.send(('run', job.id, job.scenario, job.store_path, job.diagnostics, job.resume_path))
+
+    def _reap(self):
+        now = time.time()
+        for job in list(self.jobs.values()):
+            if not job.done and job.abandoned and not job._cancel.is_set():
+                self._cancel(job)
+            elif job.done and now - job.finished > self.keep_finished:
+                del self.jobs[job.id]
+                for path in (job.store_path, job.store_path + '.json'):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+    def shutdown(self):
+        self.running = False
+        self.scheduler.join()
+        for worker in self.workers:
+            try:
+                worker.conn.send(('stop',))
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in self.workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        shutil.rmtree(self.results_dir, ignore_errors=True)
+
+
+def job_status(job):
+    return {'id': job.id, 'status': job.status, 'progress': job.progress, 'elapsed': job.elapsed, 'error': job.error}
+
+
+# ------------------
+# HTTP API
+# ------------------
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    service = None  # set by serve()
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def route(self):
+        # -> (job or None, sub-resource); sends the 404 itself
+        parts = urlparse(self.path).path.strip('/').split('/')
+        if parts[0] != 'jobs' or len(parts) < 2:
+            self.send_json(404, {'error': 'Not found'})
+            return None, None
+        job = self.service.get(parts[1])
+        if job is None:
+            self.send_json(404, {'error': f'Unknown job {parts[1]}'})
+            return None, None
+        job.touch()
+        return job, '/'.join(parts[2:])
+
+    def do_POST(self):
+        if urlparse(self.path).path.rstrip('/') != '/jobs':
+            return self.send_json(404, {'error': 'Not found'})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            job = self.service.submit(self.headers.get('X-Client-Id', self.client_address[0]), body.get('scenario', {}), body.get('diagnostics', True),
+                                      body.get('resume'))
+        except JobLimitError as error:
+            return self.send_json(429, {'error': str(error)})
+        except QueueFullError as error:
+            return self.send_json(503, {'error': str(error)}, {'Retry-After': str(self.service.retry_after())})
+        except (ValueError, TypeError) as error:
+            return self.send_json(400, {'error': str(error)})
+        self.send_json(202, job_status(job), {'Location': f'/jobs/{job.id}'})
+
+    def do_DELETE(self):
+        job, resource = self.route()
+        if job is not None:
+            self.send_json(200, job_status(self.service.cancel(job.id)))
+
+    def do_GET(self):
+        if urlparse(self.path).path.rstrip('/') == '/health':
+            return self.send_json(200, self.service.health())
+        job, resource = self.route()
+        if job is None:
+            return
+        if resource == '':
+            return self.send_json(200, job_status(job))
+        if resource == 'events':
+            return self.stream_events(job)
+        if job.status != DONE:
+            return self.send_json(409, {'error': f'Job {job.id} is {job.status}', **job_status(job)})
+        if resource == 'result':
+            with open(job.store_path + '.json') as f:
+                return self.send_json(200, json.load(f))
+        if resource == 'trajectory.npy':
+            return self.send_file(job.store_path, 'application/octet-stream')
+        if resource == 'trajectory.csv':
+            from trajectory import TrajectoryStore
+            data = TrajectoryStore.load(job.store_path).to_dataframe().to_csv(index=False).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/csv')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            return self.wfile.write(data)
+        self.send_json(404, {'error': 'Not found'})
+
+    def send_file(self, path, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        self.end_headers()
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, self.wfile)
+
+    def stream_events(self, job):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        last = None
+        try:
+            while True:
+                job.touch()  # an open stream keeps the job alive
+                status = job_status(job)
+                if status != last:
+                    event = job.status if job.done else 'progress'
+                    self.wfile.write(f'event: {event}\ndata: {json.dumps(status)}\n\n'.encode())
+                    self.wfile.flush()
+                    last = status
+                if job.done:
+                    return
+                time.sleep(EVENTS_INTERVAL)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client went away; the job is reaped once it stops being polled
+
+
+def serve(host='localhost', port=8503, **options):
+    service = JobService(**options)
+    handler = type('Handler', (JobRequestHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server, service
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local simulation job service')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8503)
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument('--max-queue', type=int, default=8)
+    parser.add_argument('--max-jobs-per-client', type=int, default=2)
+    parser.add_argument('--abandon-after', type=float, default=60.0)
+    parser.add_argument('--data-dir', default=None, help='directory of the data files (gravity fields, space weather) scenarios may name')
+    args = parser.parse_args()
+
+    server, service = serve(args.host, args.port, workers=args.workers, max_queue=args.max_queue,
+                            max_jobs_per_client=args.max_jobs_per_client, abandon_after=args.abandon_after, data_dir=args.data_dir)
+    print(f'Job service listening on http://{args.host}:{args.port} with {args.workers} workers')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
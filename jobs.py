@@ -0,0 +1,148 @@
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobLimitError(Exception):
+    pass
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Job:
+    '''
+    A simulation running in the background. The worker reports progress through report(), which is
+    also where a cancelled or abandoned job stops: it raises JobCancelled inside the integrator's
+    step callback, so the integration itself ends instead of running on unobserved.
+    '''
+    def __init__(self, job_id, user, abandon_after):
+        self.id = job_id
+        self.user = user
+        self.status = QUEUED
+        self.progress = 0.0
+        self.elapsed = 0.0
+        self.result = None
+        self.error = None
+        self.future = None
+        self.abandon_after = abandon_after
+        self.submitted = time.time()
+        self.last_seen = self.submitted
+        self._cancel = threading.Event()
+
+    @property
+    def done(self):
+        return self.status in FINISHED
+
+    @property
+    def abandoned(self):
+        return self.abandon_after is not None and time.time() - self.last_seen > self.abandon_after
+
+    def touch(self):
+        '''
+        Marks the job as still watched; front ends call it whenever they poll
+        '''
+        self.last_seen = time.time()
+
+    def cancel(self):
+        # a queued job ends as soon as a worker picks it up, a running one at its next solver step
+        self._cancel.set()
+
+    def report(self, progress, elapsed_time):
+        '''
+        Progress callback handed to run_simulation
+        :param progress: fraction of the time span integrated
+        :param elapsed_time: seconds since the run started
+        '''
+        if self._cancel.is_set() or self.abandoned:
+            raise JobCancelled(self.id)
+        self.progress = progress
+        self.elapsed = elapsed_time
+
+
+class JobManager:
+    '''
+    Runs simulations on a shared pool of worker threads so that the Streamlit script thread only
+    submits and polls. Each user may have at most max_jobs_per_user unfinished jobs, and a job
+    nobody has polled for abandon_after seconds cancels itself.
+    '''
+    def __init__(self, max_workers=2, max_jobs_per_user=1, abandon_after=30.0):
+        '''
+        :param max_workers: number of simulations running at the same time
+        :param max_jobs_per_user: unfinished (queued or running) jobs allowed per user
+        :param abandon_after: seconds without touch() after which a job cancels itself, None to never
+        '''
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='simulation')
+        self.max_jobs_per_user = max_jobs_per_user
+        self.abandon_after = abandon_after
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+
+    def submit(self, user, function, *args, **kwargs):
+        '''
+        Queues function(*args, progress_callback=job.report, **kwargs)
+        :param user: key the concurrency limit is counted on (e.g. the Streamlit session)
+        :return: Job
+        '''
+        with self.lock:
+            if len(self.active_jobs(user)) >= self.max_jobs_per_user:
+                raise JobLimitError(f"Only {self.max_jobs_per_user} simulation(s) can run at a time, cancel one or wait for it to finish")
+            job = Job(f'job-{next(self.ids)}', user, self.abandon_after)
+            self.jobs[job.id] = job
+            job.future = self.executor.submit(self._run, job, function, args, kwargs)
+        return job
+
+    def _run(self, job, function, args, kwargs):
+        if job._cancel.is_set() or job.abandoned:
+            job.status = CANCELLED
+            with self.lock:
+                self.jobs.pop(job.id, None)
+            return
+        job.status = RUNNING
+        try:
+            job.result = function(*args, progress_callback=job.report, **kwargs)
+            job.progress = 1.0
+            job.status = DONE
+        except JobCancelled:
+            job.status = CANCELLED
+        except Exception as error:
+            job.error = error
+            job.status = FAILED
+        finally:
+            with self.lock:
+                self.jobs.pop(job.id, None)
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def active_jobs(self, user):
+        return [job for job in self.jobs.values() if job.user == user and not job.done and not job._cancel.is_set()]
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def cancel_user(self, user):
+        for job in self.active_jobs(user):
+            job.cancel()
+
+    def shutdown(self):
+        for job in list(self.jobs.values()):
+            job.cancel()
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,69 @@
+import numpy as np
+
+
+def freeze(value):
+    '''
+    Turns an input value into something that can be compared with == to detect changes
+    '''
+    if isinstance(value, np.ndarray):
+        return (value.shape, value.dtype.str, value.tobytes())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    return value
+
+
+class Pipeline:
+    '''
+    Dependency-tracked recompute graph. Every stage declares the input values it reads and the
+    upstream stages it consumes, and its last output is memoized under the key of exactly those
+    inputs (plus the keys of its upstream stages), so an edit recomputes only the stages downstream
+    of the inputs it touches.
+
+    pipeline = Pipeline()
+
+    @pipeline.stage('initial_state', inputs=('v', 'lat'), after=('epoch',))
+    def initial_state(epoch, v, lat):
+        ...
+
+    pipeline.get('initial_state', values)
+    '''
+    def __init__(self):
+        self.stages = {}
+        self.memo = {}  # stage name -> (key, output)
+
+    def stage(self, name, inputs=(), after=()):
+        '''
+        Registers (or replaces) a stage; registering again keeps its memoized output
+        :param name: stage name
+        :param inputs: names of the input values passed as keyword arguments
+        :param after: names of the upstream stages whose outputs are passed as positional arguments
+        '''
+        def register(function):
+            self.stages[name] = (function, tuple(inputs), tuple(after))
+            return function
+        return register
+
+    def get(self, name, values):
+        '''
+        Returns the output of a stage, recomputing it and its upstream stages only when their inputs changed
+        :param name: stage name
+        :param values: dict of all input values
+        :return: stage output
+        '''
+        function, inputs, after = self.stages[name]
+        upstream = [self.get(dependency, values) for dependency in after]
+        key = (tuple(freeze(values[i]) for i in inputs), tuple(self.memo[dependency][0] for dependency in after))
+        if name in self.memo and self.memo[name][0] == key:
+            return self.memo[name][1]
+        output = function(*upstream, **{i: values[i] for i in inputs})
+        self.memo[name] = (key, output)
+        return output
+
+    def invalidate(self, name=None):
+        if name is None:
+            self.memo.clear()
+        else:
+            self.memo.pop(name, None)
+
@@ -0,0 +1,218 @@
+import time
+import numpy as np
+from scipy import integrate
+from events import EventEngine
+
+SOLVER_METHODS = ('RK45', 'RK23', 'DOP853', 'Radau', 'BDF', 'LSODA')
+IMPLICIT_METHODS = ('Radau', 'BDF', 'LSODA')
+
+
+class Checkpoint:
+    '''
+    Everything needed to continue a propagation where it stopped: the solver's time, state, next
+    step size and method. Output samples and events up to t are kept by the caller.
+    '''
+    def __init__(self, t, y, step_size, method, status=None):
+        self.t = t
+        self.y = y
+        self.step_size = step_size
+        self.method = method
+        self.status = status  # status of the run when the checkpoint was taken, None while running
+
+    def to_dict(self):
+        return {'t': float(self.t), 'y': np.asarray(self.y).tolist(), 'step_size': self.step_size, 'method': self.method, 'status': self.status}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['t'], np.asarray(data['y'], dtype=np.float64), data['step_size'], data['method'], data['status'])
+
+
+class PropagationResult:
+    def __init__(self, t, y, status, message, t_events, y_events, nfev, njev, nlu, phases=None, events=None, checkpoint=None):
+        self.t = t  # final time
+        self.y = y  # final state
+        self.status = status  # -1 failed, 0 reached t_bound, 1 terminal event
+        self.message = message
+        self.t_events = t_events
+        self.y_events = y_events
+        self.nfev = nfev
+        self.njev = njev
+        self.nlu = nlu
+        self.phases = phases if phases is not None else []  # (t_start, method) of every integrator phase
+        self.events = events if events is not None else {}  # EventRecord by event name
+        self.checkpoint = checkpoint  # Checkpoint at the end of the run
+        self.success = status >= 0
+
+
+def get_solver_class(method):
+    if method not in SOLVER_METHODS:
+        raise ValueError(f"Unknown solver method {method}, expected one of {SOLVER_METHODS}")
+    return getattr(integrate, method)
+
+
+class StiffnessSwitch:
+    '''
+    Picks the integrator for the next phase of a propagation. The stiffness indicator is the step
+    size times the fastest decay rate of the problem (for reentry the inverse drag timescale):
+    an explicit method whose steps are pinned near its stability limit hands over to the implicit
+    one, and the implicit one hands back once accuracy, not stability, limits the step again.
+    '''
+    def __init__(self, rate, explicit='RK45', implicit='Radau', to_implicit=2.0, to_explicit=0.5, min_steps=10):
+        '''
+        :param rate: rate(t, y) returning the stiff eigenvalue magnitude in 1/s
+        :param to_implicit: switch to the implicit method above this step * rate. RK45 is stable up to
+                            about 3.3 on the negative real axis, and its controller keeps a step near
+                            2 only when stability, not accuracy, limits it
+        :param to_explicit: switch back below this step * rate, a factor 4 of hysteresis
+        :param min_steps: minimum number of steps between two switches
+        '''
+        self.rate = rate
+        self.explicit = explicit
+        self.implicit = implicit
+        self.to_implicit = to_implicit
+        self.to_explicit = to_explicit
+        self.min_steps = min_steps
+        self.steps = 0
+
+    def __call__(self, solver):
+        self.steps += 1
+        if self.steps < self.min_steps:
+            return None
+        stiffness = solver.step_size * self.rate(solver.t, solver.y)
+        method = type(solver).__name__
+        if method == self.explicit and stiffness > self.to_implicit:
+            self.steps = 0
+            return self.implicit
+        if method == self.implicit and stiffness < self.to_explicit:
+            self.steps = 0
+            return self.explicit
+        return None
+
+
+def propagate(fun, t_span, y0, t_eval=None, method='RK45', rtol=1e-8, atol=1e-10, events=(), on_samples=None, on_step=None, chunk_size=4096,
+              jac=None, switch_method=None, first_step=None, previous_events=None, on_checkpoint=None, checkpoint_interval=10.0, **options):
+    '''
+    Integrates dy/dt = fun(t, y) step by step with a scipy OdeSolver, handing output samples to
+    on_samples(t_chunk, y_chunk) in chunks of at most chunk_size instead of keeping them all.
+    t_eval and events follow the solve_ivp conventions.
+    :param fun: right hand side
+    :param t_span: (t0, tf)
+    :param y0: initial state
+    :param t_eval: sample times, or None to emit every solver step
+    :param method: one of SOLVER_METHODS
+    :param events: ThresholdEvent / ExtremumEvent instances, or plain event functions with optional
+                   terminal and direction attributes
+    :param on_samples: callback receiving (t_chunk, y_chunk) with y_chunk of shape (n, k)
+    :param on_step: callback receiving the solver after every accepted step
+    :param chunk_size: maximum number of samples buffered before on_samples is called
+    :param jac: Jacobian callable, only handed to the implicit methods
+    :param switch_method: callable receiving the solver after every step and returning the method
+                          to continue with (or None), e.g. a StiffnessSwitch
+    :param first_step: initial step size, e.g. Checkpoint.step_size when resuming
+    :param previous_events: EventRecord dict of the run being resumed, which new events extend
+    :param on_checkpoint: callback receiving (Checkpoint, events so far) at most every checkpoint_interval
+                          seconds of wall time, after all samples up to the checkpoint went to on_samples
+    :return: PropagationResult
+    '''
+    t0, tf = float(t_span[0]), float(t_span[1])
+    y0 = np.asarray(y0, dtype=np.float64)
+
+    def make_solver(method, t, y, first_step=None):
+        method_options = dict(options)
+        if jac is not None and method in IMPLICIT_METHODS:
+            method_options['jac'] = jac
+        if first_step is not None:
+            method_options['first_step'] = min(first_step, abs(tf - t))
+        return get_solver_class(method)(fun, t, y, tf, rtol=rtol, atol=atol, **method_options)
+
+    solver = make_solver(method, t0, y0, first_step=first_step)
+    phases = [(t0, method)]
+    counts = np.zeros(3, dtype=int)  # nfev, njev, nlu of finished phases
+
+    if t_eval is not None:
+        t_eval = np.asarray(t_eval, dtype=np.float64)
+        t_eval_i = np.searchsorted(t_eval, t0, side='left')
+
+    chunk_t = np.empty(chunk_size)
+    chunk_y = np.empty((y0.size, chunk_size))
+    n_chunk = 0
+
+    def emit(ts, ys):
+        nonlocal n_chunk
+        start = 0
+        while start < len(ts):
+            k = min(chunk_size - n_chunk, len(ts) - start)
+            chunk_t[n_chunk:n_chunk + k] = ts[start:start + k]
+            chunk_y[:, n_chunk:n_chunk + k] = ys[:, start:start + k]
+            n_chunk += k
+            start += k
+            if n_chunk == chunk_size:
+                flush()
+
+    def flush():
+        nonlocal n_chunk
+        if n_chunk and on_samples is not None:
+            on_samples(chunk_t[:n_chunk], chunk_y[:, :n_chunk])
+        n_chunk = 0
+
+    engine = EventEngine(events, previous=previous_events)
+    engine.start(t0, y0)
+
+    if t_eval is None:
+        emit(np.array([t0]), y0[:, None])
+
+    t, y = t0, y0
+    status = None
+    last_checkpoint = time.time()
+    while status is None:
+        message = solver.step()
+        if solver.status == 'finished':
+            status = 0
+        elif solver.status == 'failed':
+            status = -1
+            break
+
+        t_old, t, y = solver.t_old, solver.t, solver.y
+        sol, t_terminal = engine.step(t_old, t, y, solver.dense_output)
+        if t_terminal is not None:
+            status = 1
+            t = t_terminal
+            y = sol(t)
+
+        if t_eval is None:
+            emit(np.array([t]), y[:, None])
+        else:
+            t_eval_i_new = np.searchsorted(t_eval, t, side='right')
+            t_eval_step = t_eval[t_eval_i:t_eval_i_new]
+            if t_eval_step.size > 0:
+                if sol is None:
+                    sol = solver.dense_output()
+                emit(t_eval_step, sol(t_eval_step))
+                t_eval_i = t_eval_i_new
+
+        if on_step is not None:
+            on_step(solver)
+
+        if on_checkpoint is not None and status is None and time.time() - last_checkpoint > checkpoint_interval:
+            flush()
+            on_checkpoint(Checkpoint(t, y.copy(), solver.step_size, type(solver).__name__), engine.snapshot())
+            last_checkpoint = time.time()
+
+        if switch_method is not None and status is None:
+            new_method = switch_method(solver)
+            if new_method is not None and new_method != type(solver).__name__:
+                # hand the current state over to the other integrator; the step size carries over
+                counts += (solver.nfev, solver.njev, solver.nlu)
+                solver = make_solver(new_method, solver.t, solver.y, first_step=solver.step_size)
+                phases.append((float(solver.t), new_method))
+
+    flush()
+    engine.finish()
+    message = 'The solver successfully reached the end of the integration interval.' if status == 0 else \
+              'A termination event occurred.' if status == 1 else message
+    return PropagationResult(
+        t, y, status, message,
+        [np.asarray(te) for te in engine.t_events], [np.asarray(ye) for ye in engine.y_events],
+        counts[0] + solver.nfev, counts[1] + solver.njev, counts[2] + solver.nlu, phases, engine.records(),
+        Checkpoint(t, np.array(y), solver.step_size, type(solver).__name__, status),
+    )
@@ -0,0 +1,71 @@
+import time
+import numpy as np
+from constants import EARTH_R, EARTH_OMEGA, EARTH_GRAVITY, TOUCHDOWN_ALTITUDE
+from coordinate_converter import eci_to_ecef, ecef_to_geodetic
+from ensemble import propagate_ensemble, TOUCHDOWN
+from scenario import make_scenario, scenario_epoch, scenario_model
+from spacecraft_model import fidelity_tolerances
+
+# Quick look at a scenario before its full run: the same force model propagated by the compiled
+# ensemble integrator as a single member, at the loose 'preview' tolerances and without the thermal
+# diagnostics, sampled coarsely for a ground track. Peak deceleration and heat flux are taken at the
+# accepted steps. Where the vehicle comes down and when lands within a few km and seconds of the full
+# run for a small fraction of its time (once the ensemble kernel is compiled).
+QUICKLOOK_FIDELITY = 'preview'
+QUICKLOOK_POINTS = 500  # ground track samples
+
+
+class QuickLook:
+    '''
+    Approximate outcome of a scenario
+    '''
+    def __init__(self, t, y, latitude, longitude, altitude, impact, t_end, peak_g, peak_heat_flux, elapsed):
+        self.t = t  # (n,) sample times, s
+        self.y = y  # (n, 6) ECI states
+        self.latitude = latitude  # (n,) ground track, deg
+        self.longitude = longitude  # (n,) deg
+        self.altitude = altitude  # (n,) m
+        self.impact = impact  # (latitude, longitude) of touchdown in deg, None if still flying at tf
+        self.t_end = t_end  # touchdown time, or tf, s
+        self.peak_g = peak_g  # largest drag deceleration, g
+        self.peak_heat_flux = peak_heat_flux  # largest heat flux into the vehicle, W (the max_heat_flux event quantity)
+        self.elapsed = elapsed  # wall time of the estimate, s
+
+
+def quicklook(model, y0, t_span, points=QUICKLOOK_POINTS, fidelity=QUICKLOOK_FIDELITY):
+    '''
+    :param model: SpacecraftModel
+    :param y0: ECI initial state
+    :param t_span: (ts, tf) in seconds
+    :param points: ground track samples over t_span, the track ends at touchdown
+    :param fidelity: FIDELITY_PRESETS entry of the tolerances
+    :return: QuickLook
+    '''
+    start = time.perf_counter()
+    rtol, atol = fidelity_tolerances(fidelity)
+    t_eval = np.linspace(t_span[0], t_span[1], points)
+    result = propagate_ensemble(y0, model.params, t_span, t_eval, rtol=rtol, atol=atol, stop_altitude=TOUCHDOWN_ALTITUDE, track_peaks=True)
+
+    alive = ~np.isnan(result.y[0, :, 0])
+    t, y = t_eval[alive], result.y[0, alive]
+    if not alive.all():
+        # the track ends at touchdown
+        t, y = np.append(t, result.t_end[0]), np.vstack((y, result.y_end[0]))
+    track = np.array([ecef_to_geodetic(*eci_to_ecef(np.ascontiguousarray(y_k[0:3]), model.gmst0 + EARTH_OMEGA * t_k)) for t_k, y_k in zip(t, y)])
+    impact = tuple(track[-1, 0:2]) if result.status[0] == TOUCHDOWN else None
+    return QuickLook(t, y, track[:, 0], track[:, 1], np.linalg.norm(y[:, 0:3], axis=1) - EARTH_R, impact, result.t_end[0],
+                     result.peak_deceleration[0] / EARTH_GRAVITY, result.peak_drag_power[0] * model.ablation_efficiency * model.m,
+                     time.perf_counter() - start)
+
+
+def scenario_quicklook(scenario, points=QUICKLOOK_POINTS):
+    '''
+    :param scenario: scenario dict (see scenario.SCENARIO_DEFAULTS), its fidelity and dt are not used
+    :return: QuickLook
+    '''
+    scenario = make_scenario(**scenario)
+    epoch, gmst0 = scenario_epoch(scenario['calendar'], scenario['clock'])
+    model = scenario_model(scenario, epoch, gmst0)
+    y0 = model.get_initial_state(v=scenario['v'], lat=scenario['lat'], lon=scenario['lon'], alt=scenario['alt_init'] * 1000,
+                                 azimuth=scenario['azimuth'], gamma=scenario['gamma'], gmst=gmst0)
+    return quicklook(model, y0, (0.0, scenario['tf']), points)
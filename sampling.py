@@ -0,0 +1,61 @@
+import numpy as np
+from constants import EARTH_GRAVITY
+from quicklook import quicklook
+from spacecraft_model import thermal_environment_numba, heat_balance_numba, material_cases
+
+# Adaptive output sampling within a point budget. A uniform t_eval spends most of its points on vacuum
+# coast and leaves the peak heating window coarse. Instead, a quick look propagation gives altitude,
+# g-load and heat shield temperature on a fine uniform pilot grid, and the budget is spread evenly along
+# the arc length of their curves, each normalized by its range (equidistribution). A share of the budget
+# stays uniform in time so that coasts keep some samples. The full run emits at those times like any t_eval.
+SAMPLING_MONITORS = ('altitude', 'g_load', 'temperature')
+PILOT_POINTS = 4000
+UNIFORM_SHARE = 0.2
+TOUCHDOWN_MARGIN = 0.01  # sampled span past the pilot's touchdown, relative to its duration
+
+
+def equidistribute(t, monitors, budget, uniform_share=UNIFORM_SHARE):
+    '''
+    :param t: (n,) increasing pilot times
+    :param monitors: (k, n) monitored quantities at t
+    :param budget: number of sample times
+    :param uniform_share: share of the budget spread uniformly in time, in (0, 1]
+    :return: (budget,) increasing times from t[0] to t[-1], dense where the monitors change quickly
+    '''
+    if not 0.0 < uniform_share <= 1.0:
+        raise ValueError(f"uniform_share must be in (0, 1], got {uniform_share}")
+    monitors = np.atleast_2d(monitors)
+    scale = np.ptp(monitors, axis=1)
+    change = np.diff(monitors[scale > 0] / scale[scale > 0, None], axis=1)
+    arc = np.concatenate(([0.0], np.cumsum(np.sqrt(np.sum(change**2, axis=0)))))
+    s = (t - t[0]) / (t[-1] - t[0])
+    if arc[-1] > 0:
+        s = uniform_share * s + (1.0 - uniform_share) * arc / arc[-1]
+        s /= s[-1]  # exactly 1 at the end, or the last time falls short of t[-1] by rounding
+    return np.interp(np.linspace(0.0, 1.0, budget), s, t)
+
+
+def adaptive_sample_times(model, y0, t_span, budget, pilot_points=PILOT_POINTS, uniform_share=UNIFORM_SHARE):
+    '''
+    Output sample times for run_simulation within a point budget, see equidistribute
+    :param model: SpacecraftModel, its heat shield gives the temperature monitor
+    :param y0: ECI initial state
+    :param t_span: (ts, tf) in seconds
+    :param budget: number of sample times
+    :param pilot_points: uniform samples of the quick look the monitors are taken from
+    :param uniform_share: share of the budget spread uniformly in time
+    :return: (budget,) sample times
+    '''
+    look = quicklook(model, y0, t_span, pilot_points)
+    t = look.t
+    v_norm, a_drag_norm, atmo_T = thermal_environment_numba(t, np.ascontiguousarray(look.y.T), model.params)
+    heat_shield = material_cases({'heat_shield': [model.thermal_conductivity, model.specific_heat_capacity, model.emissivity, model.ablation_efficiency]},
+                                 model.m, model.height)[1]
+    temperature = heat_balance_numba(v_norm, a_drag_norm, atmo_T, model.dt, model.iter_fact, heat_shield)[4][0]
+    monitors = np.vstack((look.altitude, a_drag_norm / EARTH_GRAVITY, temperature))
+    if look.impact is not None:
+        # the full run touches down a little before or after the pilot: keep sampling for a margin past it
+        end = min(t_span[1], t[-1] + TOUCHDOWN_MARGIN * (t[-1] - t_span[0]))
+        if end > t[-1]:
+            t, monitors = np.append(t, end), np.column_stack((monitors, monitors[:, -1]))
+    return equidistribute(t, monitors, budget, uniform_share)
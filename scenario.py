@@ -0,0 +1,117 @@
+import datetime
+import numpy as np
+from astropy import units as u
+from astropy.time import Time
+from constants import MATERIALS
+from spacecraft_model import SpacecraftModel
+from gravity_field import load_icgem
+from space_weather import load_space_weather
+
+# Inputs of one simulation run, with the app's defaults. Scenarios are plain JSON-compatible dicts so
+# that they can be sent to the job service and handed to worker processes.
+SCENARIO_DEFAULTS = {
+    'mass': 5000.0,  # kg
+    'area': 14.0,  # m^2
+    'codrag': 1.3,
+    'material': [*MATERIALS][2],  # key of MATERIALS
+    'v': 7540.0,  # m/s
+    'azimuth': 90.0,  # deg
+    'gamma': -2.0,  # deg
+    'lat': 45.0,  # deg
+    'lon': -75.0,  # deg
+    'alt_init': 500.0,  # km
+    'calendar': None,  # ISO date, today if None
+    'clock': '20:00:00',  # ISO time
+    'tf': 3700,  # s
+    'dt': 10,  # s
+    'max_points': None,  # adaptive output sampling within this many points (see sampling.py), every dt if None
+    'sim_type': 'Auto',
+    'fidelity': 'standard',
+    'iter_fact': 3.0,
+    'gravity_file': None,  # ICGEM coefficient file, point mass + J2 gravity if None
+    'gravity_degree': 8,
+    'gravity_order': None,  # gravity_degree if None
+    'space_weather_file': None,  # CelesTrak space weather CSV, sinusoidal solar cycle if None
+}
+
+
+def make_scenario(**inputs):
+    '''
+    Fills in the defaults and checks the input names
+    :return: scenario dict
+    '''
+    unknown = set(inputs) - set(SCENARIO_DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown scenario inputs {sorted(unknown)}, expected some of {sorted(SCENARIO_DEFAULTS)}")
+    scenario = dict(SCENARIO_DEFAULTS, **inputs)
+    if scenario['material'] not in MATERIALS:
+        raise ValueError(f"Unknown material {scenario['material']}, expected one of {[*MATERIALS]}")
+    return scenario
+
+
+def scenario_epoch(calendar, clock):
+    '''
+    :param calendar: datetime.date or ISO date string, today if None
+    :param clock: datetime.time or ISO time string
+    :return: astropy Time epoch and the greenwich mean sidereal time at it in rad
+    '''
+    if calendar is None:
+        calendar = datetime.date.today()
+    if isinstance(calendar, str):
+        calendar = datetime.date.fromisoformat(calendar)
+    if isinstance(clock, str):
+        clock = datetime.time.fromisoformat(clock)
+    # convert datetime to astropy time
+    epoch = Time(f"{calendar} {clock.hour}:{clock.minute}:{clock.second}", format="iso", scale='tdb')
+    gmst0 = epoch.sidereal_time('mean', 'greenwich').to_value(u.rad) # get the greenwich mean sidereal time
+    return epoch, gmst0
+
+
+def scenario_model(scenario, epoch, gmst0):
+    material = MATERIALS[scenario['material']]
+    gravity = None
+    if scenario['gravity_file']:
+        gravity = load_icgem(scenario['gravity_file'], scenario['gravity_degree'], scenario['gravity_order'])
+    space_weather = load_space_weather(scenario['space_weather_file']) if scenario['space_weather_file'] else None
+    return SpacecraftModel(Cd=scenario['codrag'], A=scenario['area'], m=scenario['mass'], epoch=epoch, gmst0=gmst0, sim_type=scenario['sim_type'],
+                           material=list(material.values()), dt=scenario['dt'], iter_fact=scenario['iter_fact'], fidelity=scenario['fidelity'],
+                           gravity=gravity, space_weather=space_weather, duration=scenario['tf'])
+
+
+def can_extend(previous, scenario):
+    '''
+    True when scenario only differs from previous by a longer tf, so its run can resume the previous one.
+    Never with max_points: its sample times are spread over the whole of [0, tf] and depend on tf.
+    '''
+    previous, scenario = make_scenario(**previous), make_scenario(**scenario)
+    if scenario['max_points'] or previous['max_points']:
+        return False
+    return scenario['tf'] > previous['tf'] and all(previous[key] == scenario[key] for key in scenario if key != 'tf')
+
+
+def run_scenario(scenario, progress_callback=None, store_path=None, diagnostics=True, resume=None):
+    '''
+    Runs one scenario from t=0 to tf. A module level function of a plain dict, so it can run in a
+    worker thread or process.
+    :param scenario: dict of SCENARIO_DEFAULTS inputs (missing ones take the default)
+    :param progress_callback: called with (progress, elapsed_time) after every solver step
+    :param store_path: optional .npy path for a memory-mapped trajectory store
+    :param diagnostics: also compute the thermal diagnostic columns
+    :param resume: Trajectory of the same scenario with a shorter tf to continue (see can_extend)
+    :return: Trajectory
+    '''
+    scenario = make_scenario(**scenario)
+    if resume is not None and scenario['max_points']:
+        raise ValueError("A max_points scenario can't resume a run, its sample times depend on tf (see can_extend)")
+    epoch, gmst0 = scenario_epoch(scenario['calendar'], scenario['clock'])
+    model = scenario_model(scenario, epoch, gmst0)
+    y0 = model.get_initial_state(v=scenario['v'], lat=scenario['lat'], lon=scenario['lon'], alt=scenario['alt_init'] * 1000,
+                                 azimuth=scenario['azimuth'], gamma=scenario['gamma'], gmst=gmst0)
+    t_span = (0, scenario['tf'])
+    if scenario['max_points']:
+        from sampling import adaptive_sample_times  # sampling imports quicklook, which imports this module
+        t_eval = adaptive_sample_times(model, y0, t_span, scenario['max_points'])
+    else:
+        t_eval = np.arange(0, scenario['tf'], scenario['dt'])
+    return model.run_simulation(t_span, y0, t_eval, progress_callback=progress_callback, store_path=store_path, diagnostics=diagnostics,
+                                resume=resume)
@@ -0,0 +1,237 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import qmc
+from constants import EARTH_GRAVITY, EARTH_OMEGA, TOUCHDOWN_ALTITUDE, MATERIALS, PI
+from coordinate_converter import eci_to_ecef, ecef_to_geodetic, haversine_distance
+from ensemble import propagate_ensemble, TOUCHDOWN
+from scenario import make_scenario, scenario_epoch, scenario_model
+from spacecraft_model import force_model_params, thermal_environment_numba, heat_balance_numba, THERMAL_CASE_COLUMNS
+
+# Global sensitivity of a scenario's outcome to its vehicle and entry inputs. The first five inputs
+# change the trajectory, the material properties only the thermal post-processing, so samples that
+# differ in material properties alone share one propagation.
+DYNAMIC_INPUTS = ('mass', 'area', 'codrag', 'v', 'gamma')
+MATERIAL_INPUTS = THERMAL_CASE_COLUMNS[:4]
+SENSITIVITY_INPUTS = DYNAMIC_INPUTS + MATERIAL_INPUTS
+SENSITIVITY_OUTPUTS = ('impact_latitude', 'impact_longitude', 'downrange', 'peak_g', 'peak_temperature')
+
+# default half-width of the input ranges, relative to the scenario value
+DEFAULT_SPREAD = {
+    'mass': 0.1,
+    'area': 0.1,
+    'codrag': 0.1,
+    'v': 0.005,
+    'gamma': 0.1,
+    'thermal_conductivity': 0.2,
+    'specific_heat_capacity': 0.2,
+    'emissivity': 0.2,
+    'ablation_efficiency': 0.2,
+}
+
+
+def default_bounds(scenario, spread=DEFAULT_SPREAD):
+    '''
+    :param scenario: scenario dict, its material gives the nominal material properties
+    :return: dict of SENSITIVITY_INPUTS -> (low, high)
+    '''
+    scenario = make_scenario(**scenario)
+    nominal = dict(scenario, **MATERIALS[scenario['material']])
+    return {name: tuple(sorted((nominal[name] * (1 - spread[name]), nominal[name] * (1 + spread[name])))) for name in SENSITIVITY_INPUTS}
+
+
+class SensitivityEvaluator:
+    '''
+    Computes SENSITIVITY_OUTPUTS for rows of SENSITIVITY_INPUTS around one scenario. Trajectories are
+    propagated in parallel batches with ensemble.propagate_ensemble and cached by their dynamic
+    inputs, so repeated points (Saltelli matrices, Morris grids, several analyses) are integrated once.
+    '''
+    def __init__(self, scenario=None, sample_dt=1.0, batch_size=256):
+        '''
+        :param scenario: scenario dict (see scenario.SCENARIO_DEFAULTS), the point the inputs vary around
+        :param sample_dt: output sampling of each trajectory in s, where peak g and temperature are taken
+        :param batch_size: members propagated per ensemble call, bounds the memory of the sampled states
+        '''
+        self.scenario = make_scenario(**(scenario or {}))
+        epoch, self.gmst0 = scenario_epoch(self.scenario['calendar'], self.scenario['clock'])
+        self.model = scenario_model(self.scenario, epoch, self.gmst0)
+        self.t_eval = np.arange(0.0, self.scenario['tf'], sample_dt)
+        self.batch_size = batch_size
+        self.cache = {}
+        self.propagations = 0
+
+    def _propagate(self, dynamic):
+        # impact point, peak g and the thermal environment of each row of dynamic inputs
+        s = self.scenario
+        y0s = np.array([self.model.get_initial_state(v=v, lat=s['lat'], lon=s['lon'], alt=s['alt_init'] * 1000, azimuth=s['azimuth'], gamma=gamma, gmst=self.gmst0)
+                        for _, _, _, v, gamma in dynamic])
+        mass, area, codrag = dynamic[:, 0], dynamic[:, 1], dynamic[:, 2]
+        params = force_model_params(self.model.epoch, self.gmst0, codrag, area, mass, self.model.gravity, self.model.space_weather, self.model.duration)
+        for start in range(0, len(dynamic), self.batch_size):
+            batch = slice(start, start + self.batch_size)
+            result = propagate_ensemble(y0s[batch], params[batch], (0.0, s['tf']), self.t_eval, rtol=self.model.rtol, atol=self.model.atol,
+                                        stop_altitude=TOUCHDOWN_ALTITUDE)
+            self.propagations += len(result)
+            for i in range(len(result)):
+                alive = ~np.isnan(result.y[i, :, 0])
+                environment = thermal_environment_numba(self.t_eval[alive], np.ascontiguousarray(result.y[i, alive].T), params[start + i])
+                impact = (np.nan, np.nan, np.nan)
+                if result.status[i] == TOUCHDOWN:
+                    r_ecef = eci_to_ecef(result.y_end[i, 0:3], self.gmst0 + EARTH_OMEGA * result.t_end[i])
+                    latitude, longitude, _ = ecef_to_geodetic(*r_ecef)
+                    impact = (latitude, longitude, haversine_distance(s['lat'], s['lon'], latitude, longitude))
+                peak_g = environment[1].max() / EARTH_GRAVITY if alive.any() else np.nan
+                self.cache[tuple(dynamic[start + i])] = impact + (peak_g, environment)
+
+    def evaluate(self, X):
+        '''
+        :param X: (n, len(SENSITIVITY_INPUTS)) input rows in physical units
+        :return: (n, len(SENSITIVITY_OUTPUTS)) outputs, NaN where undefined (no touchdown before tf)
+        '''
+        X = np.asarray(X, dtype=np.float64)
+        dynamic, inverse = np.unique(X[:, :len(DYNAMIC_INPUTS)], axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        missing = np.array([key not in self.cache for key in map(tuple, dynamic)], dtype=bool)
+        if missing.any():
+            self._propagate(dynamic[missing])
+
+        Y = np.empty((len(X), len(SENSITIVITY_OUTPUTS)))
+        for j, key in enumerate(map(tuple, dynamic)):
+            rows = np.flatnonzero(inverse == j)
+            latitude, longitude, downrange, peak_g, environment = self.cache[key]
+            v_norm, a_drag_norm, atmo_T = environment
+            # one heat shield case per row: material properties, mass and capsule length of that row
+            cases = np.column_stack((X[rows, len(DYNAMIC_INPUTS):], X[rows, 0], np.sqrt(X[rows, 1] / PI) * 1.315))
+            T_s = heat_balance_numba(v_norm, a_drag_norm, atmo_T, self.model.dt, self.model.iter_fact, cases)[4]
+            Y[rows, 0:4] = latitude, longitude, downrange, peak_g
+            Y[rows, 4] = T_s.max(axis=1) if T_s.shape[1] else np.nan
+        return Y
+
+
+def scale_samples(unit, bounds):
+    low, high = np.array([bounds[name] for name in SENSITIVITY_INPUTS]).T
+    return low + unit * (high - low)
+
+
+def saltelli_design(n, d, seed=None):
+    '''
+    Saltelli's radial design on a scrambled Sobol' sequence
+    :param n: base samples, a power of 2
+    :return: A, B (n, d) and AB (d, n, d) in the unit hypercube, AB[i] is A with column i taken from B
+    '''
+    base = qmc.Sobol(d=2 * d, scramble=True, seed=seed).random_base2(int(np.log2(n)))
+    A, B = base[:, :d], base[:, d:]
+    AB = np.repeat(A[None], d, axis=0)
+    for i in range(d):
+        AB[i, :, i] = B[:, i]
+    return A, B, AB
+
+
+def _sobol_estimates(fA, fB, fAB):
+    # Saltelli (2010) first order and Jansen total effect estimators, fAB is (d, n)
+    variance = np.var(np.concatenate((fA, fB), axis=-1), axis=-1)
+    S1 = np.mean(fB * (fAB - fA), axis=-1) / variance
+    ST = 0.5 * np.mean((fA - fAB) ** 2, axis=-1) / variance
+    return S1, ST
+
+
+def sobol_indices(fA, fB, fAB, n_bootstrap=1000, confidence=0.95, seed=None):
+    '''
+    First order and total Sobol' indices of one output, with bootstrap confidence intervals. Base rows
+    where the output is undefined (NaN or infinite in A, B or any AB) are left out.
+    :param fA: (n,) outputs at A
+    :param fB: (n,) outputs at B
+    :param fAB: (d, n) outputs at AB
+    :return: DataFrame with S1, S1_low, S1_high, ST, ST_low, ST_high per input
+    '''
+    valid = np.isfinite(fA) & np.isfinite(fB) & np.isfinite(fAB).all(axis=0)
+    fA, fB, fAB = fA[valid], fB[valid], fAB[:, valid]
+    S1, ST = _sobol_estimates(fA, fB, fAB)
+
+    # the bootstrap resamples the base rows, so it needs no further model runs
+    resample = np.random.default_rng(seed).integers(0, len(fA), size=(n_bootstrap, len(fA)))
+    S1_boot, ST_boot = _sobol_estimates(fA[resample][:, None], fB[resample][:, None], np.moveaxis(fAB[:, resample], 0, 1))
+    tail = 100 * (1 - confidence) / 2
+    S1_low, S1_high = np.percentile(S1_boot, [tail, 100 - tail], axis=0)
+    ST_low, ST_high = np.percentile(ST_boot, [tail, 100 - tail], axis=0)
+    return pd.DataFrame({'S1': S1, 'S1_low': S1_low, 'S1_high': S1_high, 'ST': ST, 'ST_low': ST_low, 'ST_high': ST_high}, index=list(SENSITIVITY_INPUTS))
+
+
+class SensitivityResult:
+    def __init__(self, indices, X, Y, propagations):
+        self.indices = indices  # dict of SENSITIVITY_OUTPUTS -> DataFrame of indices per input
+        self.X = X  # (n_runs, d) evaluated inputs
+        self.Y = Y  # (n_runs, len(SENSITIVITY_OUTPUTS)) outputs
+        self.propagations = propagations  # trajectories actually integrated
+
+    def __getitem__(self, output):
+        return self.indices[output]
+
+
+def sobol_analysis(scenario=None, bounds=None, n=256, n_bootstrap=1000, confidence=0.95, seed=None, evaluator=None):
+    '''
+    Sobol' global sensitivity of SENSITIVITY_OUTPUTS to SENSITIVITY_INPUTS, uniform within bounds.
+    All indices of all outputs come from the same n * (d + 2) evaluations.
+    :param scenario: scenario dict the inputs vary around
+    :param bounds: dict of input -> (low, high), default_bounds(scenario) by default
+    :param n: base samples (power of 2)
+    :param evaluator: SensitivityEvaluator to reuse trajectories from an earlier analysis
+    :return: SensitivityResult
+    '''
+    evaluator = evaluator or SensitivityEvaluator(scenario)
+    bounds = bounds or default_bounds(evaluator.scenario)
+    d = len(SENSITIVITY_INPUTS)
+    A, B, AB = saltelli_design(n, d, seed)
+    X = scale_samples(np.concatenate((A, B, AB.reshape(-1, d))), bounds)
+    Y = evaluator.evaluate(X)
+    fA, fB, fAB = Y[:n], Y[n:2 * n], Y[2 * n:].reshape(d, n, -1)
+    indices = {output: sobol_indices(fA[:, k], fB[:, k], fAB[:, :, k], n_bootstrap, confidence, seed) for k, output in enumerate(SENSITIVITY_OUTPUTS)}
+    return SensitivityResult(indices, X, Y, evaluator.propagations)
+
+
+def morris_design(r, d, levels=4, seed=None):
+    '''
+    Morris one-at-a-time trajectories on a grid of levels in the unit hypercube
+    :param r: number of trajectories
+    :return: (r, d + 1, d) points, consecutive points differ in one input by +-delta
+    '''
+    rng = np.random.default_rng(seed)
+    delta = levels / (2 * (levels - 1))
+    start_levels = np.arange(levels // 2) / (levels - 1)  # starting values from which +delta stays in [0, 1]
+    points = np.empty((r, d + 1, d))
+    for k in range(r):
+        x = rng.choice(start_levels, size=d)
+        # the trajectory starts from a random corner of the step so steps go both up and down
+        down = rng.random(d) < 0.5
+        x[down] += delta
+        points[k, 0] = x
+        for step, i in enumerate(rng.permutation(d)):
+            x = x.copy()
+            x[i] += -delta if down[i] else delta
+            points[k, step + 1] = x
+    return points
+
+
+def morris_analysis(scenario=None, bounds=None, r=20, levels=4, seed=None, evaluator=None):
+    '''
+    Morris elementary effects screening, r * (d + 1) evaluations. Effects are per unit of the normalized
+    input range, so mu_star ranks inputs on a common scale.
+    :return: SensitivityResult, each DataFrame has mu, mu_star and sigma per input
+    '''
+    evaluator = evaluator or SensitivityEvaluator(scenario)
+    bounds = bounds or default_bounds(evaluator.scenario)
+    d = len(SENSITIVITY_INPUTS)
+    points = morris_design(r, d, levels, seed)
+    X = scale_samples(points.reshape(-1, d), bounds)
+    Y = evaluator.evaluate(X).reshape(r, d + 1, -1)
+
+    steps = np.diff(points, axis=1)  # (r, d, d), one nonzero input per step
+    moved = np.argmax(np.abs(steps), axis=2)
+    effects = np.empty((r, d, len(SENSITIVITY_OUTPUTS)))
+    for k in range(r):
+        effects[k, moved[k]] = np.diff(Y[k], axis=0) / steps[k, np.arange(d), moved[k]][:, None]
+    indices = {}
+    for j, output in enumerate(SENSITIVITY_OUTPUTS):
+        effect = np.ma.masked_invalid(effects[:, :, j])
+        indices[output] = pd.DataFrame({'mu': effect.mean(axis=0).filled(np.nan), 'mu_star': np.abs(effect).mean(axis=0).filled(np.nan),
+                                        'sigma': effect.std(axis=0, ddof=1).filled(np.nan)}, index=list(SENSITIVITY_INPUTS))
+    return SensitivityResult(indices, X, Y.reshape(-1, len(SENSITIVITY_OUTPUTS)), evaluator.propagations)
@@ -0,0 +1,132 @@
+import math
+import os
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from numba import njit
+from coordinate_converter import JD_UNIX_EPOCH
+
+# Observed and predicted solar flux (F10.7) and geomagnetic activity (Ap) driving the atmosphere model in
+# place of the sinusoidal solar cycle of solar_activity_factor. Tables come from CelesTrak's space
+# weather files (https://celestrak.org/SpaceData/SW-All.csv), parsed once into a sorted .npy next to the
+# source and memory-mapped from then on.
+#
+# A run packs the part of the table it can reach into the force model parameters
+# (spacecraft_model.force_model_params):
+#
+#   [n, hint, jd (n), f107 (n), f107_81 (n), ap (n)]
+#
+# hint is the row of the last lookup: consecutive right hand side evaluations fall in the same or the
+# next row, so a lookup is a bracket check, and a binary search only when the bracket is missed.
+SW_HEADER = 2
+SW_COLUMNS = ('jd', 'f107', 'f107_81', 'ap')
+SPACE_WEATHER_WINDOW = 3660.0  # days after the epoch packed when the runs' duration is not given, past it the last row holds
+
+# Jacchia (1970) exospheric temperature: 379 + 3.24 F81 + 1.3 (F - F81) + 28 Kp + 0.03 exp(Kp) K. The
+# atmosphere model scales density with F10.7, so flux and geomagnetic terms enter as the F10.7 that
+# gives the same temperature.
+JACCHIA_F81_SLOPE = 3.24  # K per solar flux unit
+JACCHIA_DAILY_SLOPE = 1.3  # K per solar flux unit
+JACCHIA_KP_SLOPE = 28.0  # K
+JACCHIA_KP_EXP = 0.03  # K
+# 3-hourly ap equivalent of each Kp step (0, 0+, 1-, 1o, ..., 9o)
+AP_TO_KP_AP = np.array([0, 2, 3, 4, 5, 6, 7, 9, 12, 15, 18, 22, 27, 32, 39, 48, 56, 67, 80, 94, 111, 132, 154, 179, 207, 236, 300, 400], dtype=np.float64)
+AP_TO_KP_KP = np.arange(28) / 3.0
+
+
+class SpaceWeather:
+    '''
+    Sorted space weather table, rows of SW_COLUMNS, usually a read-only memory map
+    '''
+    def __init__(self, table, name=''):
+        self.table = table  # (n, 4)
+        self.name = name
+
+    @property
+    def jd(self):
+        return self.table[:, 0]
+
+    def __len__(self):
+        return self.table.shape[0]
+
+    def pack(self, jd_start, jd_end):
+        '''
+        :return: float array of the rows covering [jd_start, jd_end] (see SW_HEADER)
+        '''
+        first = max(np.searchsorted(self.jd, jd_start, side='right') - 1, 0)
+        last = min(np.searchsorted(self.jd, jd_end, side='left') + 1, len(self))
+        if jd_start > self.jd[-1] or last - first < 2:
+            raise ValueError(f"Space weather table {self.name} covers JD {self.jd[0]} to {self.jd[-1]}, not the run starting at JD {jd_start}")
+        rows = np.asarray(self.table[first:last], dtype=np.float64)
+        return np.concatenate((np.array([last - first, 0.0]), rows.T.ravel()))
+
+    def effective_f107(self, jd):
+        '''
+        :param jd: julian dates, scalar or array
+        :return: F10.7 equivalent of flux and geomagnetic activity at jd (see space_weather_f107)
+        '''
+        table = self.pack(np.min(jd), np.max(jd))
+        return np.vectorize(lambda value: space_weather_f107(value, table))(jd)
+
+
+@njit
+def space_weather_f107(jd, table):
+    '''
+    Effective F10.7 of a packed table at jd, interpolated between rows and clamped to the first and last
+    '''
+    n = int(table[0])
+    i = int(table[1])
+    jds = table[SW_HEADER:SW_HEADER + n]
+    if not (jds[i] <= jd < jds[i + 1]):
+        if jd < jds[0]:
+            i = 0
+        elif jd >= jds[n - 1]:
+            i = n - 2
+        else:
+            i = np.searchsorted(jds, jd, side='right') - 1
+        table[1] = i
+    w = min(max((jd - jds[i]) / (jds[i + 1] - jds[i]), 0.0), 1.0)
+    f107 = table[SW_HEADER + n + i] * (1.0 - w) + table[SW_HEADER + n + i + 1] * w
+    f107_81 = table[SW_HEADER + 2 * n + i] * (1.0 - w) + table[SW_HEADER + 2 * n + i + 1] * w
+    ap = table[SW_HEADER + 3 * n + i] * (1.0 - w) + table[SW_HEADER + 3 * n + i + 1] * w
+    kp = np.interp(ap, AP_TO_KP_AP, AP_TO_KP_KP)
+    return f107_81 + (JACCHIA_DAILY_SLOPE * (f107 - f107_81) + JACCHIA_KP_SLOPE * kp + JACCHIA_KP_EXP * math.exp(kp)) / JACCHIA_F81_SLOPE
+
+
+def parse_celestrak(path):
+    '''
+    :param path: CelesTrak space weather CSV (SW-All.csv, SW-Last5Years.csv)
+    :return: (n, 4) array of SW_COLUMNS sorted by julian date, rows without flux or Ap left out
+    '''
+    data = pd.read_csv(path, usecols=['DATE', 'AP_AVG', 'F10.7_OBS', 'F10.7_OBS_CENTER81'])
+    data = data.dropna()
+    # daily values, placed at noon
+    jd = (pd.to_datetime(data['DATE']).to_numpy().astype('datetime64[s]').astype(np.int64) / 86400.0) + JD_UNIX_EPOCH + 0.5
+    table = np.column_stack((jd, data['F10.7_OBS'], data['F10.7_OBS_CENTER81'], data['AP_AVG'])).astype(np.float64)
+    table = table[np.argsort(table[:, 0], kind='stable')]
+    return table[np.concatenate(([True], np.diff(table[:, 0]) > 0))]
+
+
+def load_space_weather(path):
+    '''
+    Space weather table of a CelesTrak CSV. The parsed table is kept as <path>.npy and memory-mapped;
+    it is rebuilt when the CSV is newer, and parsed in memory if the directory is read-only.
+    :return: SpaceWeather
+    '''
+    # cached per modification time, so a long-lived process picks up a re-downloaded file
+    return _load_space_weather(path, os.path.getmtime(path))
+
+
+@lru_cache(maxsize=4)
+def _load_space_weather(path, mtime):
+    cache = path + '.npy'
+    if not os.path.exists(cache) or os.path.getmtime(cache) < mtime:
+        table = parse_celestrak(path)
+        try:
+            # written under a temporary name, so worker processes never map a partial file
+            temporary = f'{cache}.{os.getpid()}.npy'
+            np.save(temporary, table)
+            os.replace(temporary, cache)
+        except OSError:
+            return SpaceWeather(table, os.path.basename(path))
+    return SpaceWeather(np.load(cache, mmap_mode='r'), os.path.basename(path))
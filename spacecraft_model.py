@@ -5,32 +5,18 @@ from astropy.time import Time
 from coordinate_converter import *
 import numpy as np
 import matplotlib.colors as mcolors
-from scipy.integrate import solve_ivp
 import time
-from numba import jit, njit
-from copy import deepcopy
+from numba import jit, njit, vectorize
 from poliastro.twobody import Orbit
 import base64
 from constants import *
-
-def match_array_length(array, target_length):
-    if len(array) > target_length:
-        return array[:target_length]
-    elif len(array) < target_length:
-        return np.pad(array, (0, target_length - len(array)), mode='constant')
-    else:
-        return array
+from trajectory import Trajectory, TrajectoryStore
+from propagator import propagate, StiffnessSwitch
+from events import ThresholdEvent, ExtremumEvent
+from gravity_field import spherical_harmonic_acceleration, field_j2
+from space_weather import space_weather_f107, SPACE_WEATHER_WINDOW
 
 #special functions
-@jit(nopython=True)
-def filter_results_by_altitude(sol, altitude):
-    valid_indices = [i for i, alt in enumerate(altitude) if alt >= 0]
-    sol = deepcopy(sol)
-    sol.y = sol.y[:, valid_indices]
-    sol.t = sol.t[valid_indices]
-    sol.additional_data = [sol.additional_data[i] for i in valid_indices]
-    return sol
-
 def make_download_link(df, filename, text):
     csv = df.to_csv(index=False)
     b64 = base64.b64encode(csv.encode()).decode()
@@ -70,8 +56,10 @@ def euclidean_norm(vec):
 
 @jit(nopython=True)
 def simplified_nrlmsise_00(altitude, latitude, jd_epoch):
-    factor = solar_activity_factor(jd_epoch, altitude)
-    
+    return scaled_nrlmsise_00(altitude, latitude, solar_activity_factor(jd_epoch, altitude))
+
+@jit(nopython=True)
+def scaled_nrlmsise_00(altitude, latitude, factor):
     # Latitude factor (simplified)
     latitude_factor = 1 + 0.01 * np.abs(latitude) / 90.0
 
@@ -154,7 +142,10 @@ def solar_activity_factor(jd_epoch, altitude, jd_solar_min=2454833.0, f107_avera
 
     # Estimate the F10.7 value based on a simple sinusoidal model
     f107 = f107_average + F107_AMPLITUDE * np.sin(months_since_cycle_start)
-    
+    return solar_flux_factor(f107, altitude, f107_average)
+
+@jit(nopython=True)
+def solar_flux_factor(f107, altitude, f107_average=150.0):
     # Calculate the solar activity factor
     factor = 1 + (f107 - f107_average) / f107_average
 
@@ -177,7 +168,7 @@ def solar_activity_factor(jd_epoch, altitude, jd_solar_min=2454833.0, f107_avera
 # factor = solar_activity_factor(jd_epoch, jd_solar_min, f107_average, solar_cycle_months)
 # print(factor)
 
-#@jit(nopython=True)
+@jit(nopython=True)
 def atmosphere_model(altitude, latitude, jd_epoch):
     if altitude <= 0:
         return 1.225, 288.15
@@ -199,6 +190,42 @@ def atmosphere_model(altitude, latitude, jd_epoch):
 # rho, T, solar_factor = atmosphere_model(altitude, latitude, jd_epoch, jd_solar_min, f107_average, solar_cycle_months)
 # print(rho, T)
 
+# array versions
+# ---------------------------
+# Array in, array out: the inputs broadcast against each other like numpy arguments and the loop over
+# them runs compiled, for curves and tables (the atmospheric model tab, thermal post-processing).
+
+@vectorize(['float64(float64, float64)'])
+def solar_activity_factor_array(jd_epoch, altitude):
+    return solar_activity_factor(jd_epoch, altitude)
+
+@njit
+def _nrlmsise_00_loop(altitude, latitude, jd_epoch, clamp_ground, rho, T):
+    for i in range(altitude.size):
+        if clamp_ground:
+            rho[i], T[i] = atmosphere_model(altitude[i], latitude[i], jd_epoch[i])
+        else:
+            rho[i], T[i] = simplified_nrlmsise_00(altitude[i], latitude[i], jd_epoch[i])
+
+def _broadcast_nrlmsise_00(altitude, latitude, jd_epoch, clamp_ground):
+    altitude, latitude, jd_epoch = np.broadcast_arrays(*(np.asarray(value, dtype=np.float64) for value in (altitude, latitude, jd_epoch)))
+    rho = np.empty(altitude.shape)
+    T = np.empty(altitude.shape)
+    _nrlmsise_00_loop(altitude.ravel(), latitude.ravel(), jd_epoch.ravel(), clamp_ground, rho.reshape(-1), T.reshape(-1))
+    return rho, T
+
+def simplified_nrlmsise_00_array(altitude, latitude, jd_epoch):
+    '''
+    :return: density and temperature arrays of the broadcast shape of the inputs
+    '''
+    return _broadcast_nrlmsise_00(altitude, latitude, jd_epoch, False)
+
+def atmosphere_model_array(altitude, latitude, jd_epoch):
+    '''
+    :return: density and temperature arrays of the broadcast shape of the inputs
+    '''
+    return _broadcast_nrlmsise_00(altitude, latitude, jd_epoch, True)
+
 @jit(nopython=True)
 def atmospheric_drag(Cd, A, atmospheric_rho, v, mass):
     F_d = 0.5 * atmospheric_rho * Cd * A * euclidean_norm(v)**2
@@ -267,6 +294,86 @@ def spacecraft_temperature(v, atmo_T, a_drag, capsule_length, dt, thermal_conduc
 # print(T_surface)
 
 
+# vectorized heat balance
+# ---------------------------
+# The thermal model does not feed back into the dynamics, so it can be evaluated after the fact for any
+# number of heat shields over the same trajectory. Each row of cases describes one heat shield:
+THERMAL_CASE_COLUMNS = ('thermal_conductivity', 'specific_heat_capacity', 'emissivity', 'ablation_efficiency', 'spacecraft_m', 'capsule_length')
+
+@njit
+def thermal_environment_numba(t, y, params):
+    '''
+    Inputs of the heat balance along a trajectory
+    :param t: (n,) sample times
+    :param y: (6, n) states
+    :return: relative speed, drag acceleration magnitude and atmospheric temperature, each (n,)
+    '''
+    n = t.shape[0]
+    v_norm = np.empty(n)
+    a_drag_norm = np.empty(n)
+    atmo_T = np.empty(n)
+    for i in range(n):
+        a_drag, v_rel, _, T = drag_environment_numba(t[i], y[:, i], params)
+        v_norm[i] = euclidean_norm(v_rel)
+        a_drag_norm[i] = euclidean_norm(a_drag)
+        atmo_T[i] = T
+    return v_norm, a_drag_norm, atmo_T
+
+@njit
+def heat_balance_numba(v_norm, a_drag_norm, atmo_T, dt, iter_fact, cases):
+    '''
+    spacecraft_temperature for every sample and every heat shield in one compiled pass
+    :param v_norm: (n,) speed relative to the atmosphere
+    :param a_drag_norm: (n,) drag acceleration magnitude
+    :param atmo_T: (n,) atmospheric temperature
+    :param cases: (k, 6) heat shields, columns as in THERMAL_CASE_COLUMNS
+    :return: (6, k, n) array of Qc, Qr, Q_net, Q, T_s, dT (same order as spacecraft_temperature)
+    '''
+    n = v_norm.shape[0]
+    k = cases.shape[0]
+    out = np.empty((6, k, n))
+    iterations = int(dt / iter_fact)
+    step = iterations  # spacecraft_temperature reuses the iteration count as its time step
+    for c in range(k):
+        thermal_conductivity, specific_heat_capacity, emissivity, ablation_efficiency, spacecraft_m, capsule_length = cases[c]
+        for i in range(n):
+            T_s = atmo_T[i]
+            Q = ablation_efficiency * spacecraft_m * a_drag_norm[i] * v_norm[i]
+            Qc = 0.0
+            Qr = 0.0
+            Q_net = 0.0
+            dT = 0.0
+            for _ in range(iterations):
+                Qc = thermal_conductivity * (T_s - atmo_T[i]) / capsule_length
+                Qr = emissivity * STEFAN_BOLTZMANN_CONSTANT * (T_s**4 - atmo_T[i]**4)
+                Q_net = Q - Qc - Qr
+                dT = Q_net / (spacecraft_m * specific_heat_capacity) * step
+                T_s += dT
+            out[0, c, i] = Qc
+            out[1, c, i] = Qr
+            out[2, c, i] = Q_net
+            out[3, c, i] = Q
+            out[4, c, i] = T_s
+            out[5, c, i] = dT
+    return out
+
+def material_cases(materials, spacecraft_m, capsule_length):
+    '''
+    :param materials: dict of name -> properties dict (like MATERIALS) or [conductivity, heat capacity, emissivity, ablation efficiency]
+    :return: names and (k, 6) cases for heat_balance_numba
+    '''
+    names = list(materials)
+    cases = np.empty((len(names), len(THERMAL_CASE_COLUMNS)))
+    for c, name in enumerate(names):
+        properties = materials[name]
+        if isinstance(properties, dict):
+            properties = [properties[column] for column in THERMAL_CASE_COLUMNS[:4]]
+        cases[c, :4] = properties
+        cases[c, 4] = spacecraft_m
+        cases[c, 5] = capsule_length
+    return names, cases
+
+
 @jit(nopython=True)
 def moon_position_vector(jd):
     # Time since J2000 (in days)
@@ -387,10 +494,248 @@ def J2_perturbation_numba(r, k, J2, R):
     a_z = 5.0 * z ** 2 / r**2 - 3
     return np.array([a_x, a_y, a_z]) * r_vec * factor
 
+# force model parameters are packed in one float array so every compiled kernel
+# (single run, ensemble members, Jacobians) shares the same signature. Optional packed blocks follow
+# the N_PARAMS entries: a spherical harmonic gravity field (gravity_field.GravityField.pack) and a
+# space weather table (space_weather.SpaceWeather.pack); P_GRAVITY and P_SPACE_WEATHER hold their
+# offsets, 0 when absent.
+P_JD_EPOCH, P_GMST0, P_CD, P_AREA, P_MASS, P_GRAVITY, P_SPACE_WEATHER = 0, 1, 2, 3, 4, 5, 6
+N_PARAMS = 7
+
+@njit
+def atmosphere_numba(altitude, latitude, jd_epoch, params):
+    # atmosphere_model, driven by the space weather table of params when there is one
+    offset = int(params[P_SPACE_WEATHER])
+    if offset == 0:
+        return atmosphere_model(altitude, latitude, jd_epoch)
+    if altitude <= 0:
+        return 1.225, 288.15
+    factor = solar_flux_factor(space_weather_f107(jd_epoch, params[offset:]), altitude)
+    return scaled_nrlmsise_00(altitude, latitude, factor)
+
+@njit
+def drag_environment_numba(t, y, params):
+    # drag acceleration (ECI), velocity relative to the rotating atmosphere (ECEF), and the atmospheric density and temperature
+    r_eci = y[0:3].copy()
+    v_eci = y[3:6].copy()
+
+    epoch = params[P_JD_EPOCH] + t / 86400.0 # convert seconds to days
+    gmst = params[P_GMST0] + EARTH_OMEGA * t
+
+    r_ecef = eci_to_ecef(r_eci, gmst)
+    v_ground = eci_to_ecef(v_eci, gmst)
+    v_rel = v_ground - np.array([-EARTH_OMEGA * r_ecef[1], EARTH_OMEGA * r_ecef[0], 0.0])
+
+    altitude = euclidean_norm(r_eci) - EARTH_R
+    latitude, _, _ = ecef_to_geodetic(r_ecef[0], r_ecef[1], r_ecef[2])
+    rho, T = atmosphere_numba(altitude, latitude, epoch, params)
+    a_drag_ecef = atmospheric_drag(params[P_CD], params[P_AREA], rho, v_rel, params[P_MASS])
+    return ecef_to_eci(a_drag_ecef, gmst), v_rel, rho, T
+
+@njit
+def drag_numba(t, y, params):
+    # drag acceleration (ECI) and the velocity relative to the rotating atmosphere (ECEF)
+    a_drag, v_rel, _, _ = drag_environment_numba(t, y, params)
+    return a_drag, v_rel
+
+@njit
+def acceleration_numba(t, y, params):
+    r_eci = y[0:3].copy()
+    r_norm = euclidean_norm(r_eci)
+    epoch = params[P_JD_EPOCH] + t / 86400.0 # convert seconds to days
+
+    a_moon = third_body_acceleration(r_eci, moon_position_vector(epoch), MOON_K)
+    a_sun = third_body_acceleration(r_eci, sun_position_vector(epoch), SUN_K)
+    a_drag, _ = drag_numba(t, y, params)
+
+    offset = int(params[P_GRAVITY])
+    if offset > 0:
+        # spherical harmonic field, central term included, evaluated in the Earth-fixed frame
+        gmst = params[P_GMST0] + EARTH_OMEGA * t
+        a_field = spherical_harmonic_acceleration(eci_to_ecef(r_eci, gmst), params[offset:])
+        return ecef_to_eci(a_field, gmst) + a_moon + a_sun + a_drag
+
+    a_grav = -EARTH_MU * r_eci / (r_norm ** 3)
+    a_J2 = J2_perturbation_numba(r_eci, EARTH_MU, EARTH_J2, EARTH_R)
+    return a_grav + a_J2 + a_moon + a_sun + a_drag
+
+@njit
+def state_derivative_numba(t, y, params):
+    dy = np.empty(6)
+    dy[0:3] = y[3:6]
+    dy[3:6] = acceleration_numba(t, y, params)
+    return dy
+
+# analytic partials of the force model
+# ----------------
+
+@njit
+def point_mass_gradient(r_vec, k):
+    # d(-k r / |r|^3)/dr = -k / |r|^3 (I - 3 r_hat r_hat^T)
+    r = euclidean_norm(r_vec)
+    r_hat = r_vec / r
+    return -k / r**3 * (np.eye(3) - 3.0 * np.outer(r_hat, r_hat))
+
+@njit
+def J2_gradient(r_vec, k, J2, R):
+    # partials of J2_perturbation_numba with respect to position
+    x, y, z = r_vec[0], r_vec[1], r_vec[2]
+    r = euclidean_norm(r_vec)
+    c = 1.5 * k * J2 * R**2
+    f = c / r**5
+    u = z**2 / r**2
+    df = -5.0 * c * r_vec / r**7
+    du = -2.0 * z**2 * r_vec / r**4
+    du[2] += 2.0 * z / r**2
+
+    G = np.empty((3, 3))
+    shape = np.array([5.0 * u - 1.0, 5.0 * u - 1.0, 5.0 * u - 3.0])
+    for i in range(3):
+        for j in range(3):
+            G[i, j] = df[j] * r_vec[i] * shape[i] + f * r_vec[i] * 5.0 * du[j]
+        G[i, i] += f * shape[i]
+    return G
+
+@njit
+def third_body_gradient(satellite_position, third_body_position, k_third):
+    # only the direct term depends on the satellite position
+    return point_mass_gradient(third_body_position - satellite_position, k_third)
+
+@njit
+def drag_gradients(r_eci, v_eci, rho, drho_dh, Cd, A, mass):
+    # drag written in ECI: a = -B rho |v_rel| v_rel with v_rel = v - omega x r
+    B = 0.5 * Cd * A / mass
+    v_rel = v_eci - np.array([-EARTH_OMEGA * r_eci[1], EARTH_OMEGA * r_eci[0], 0.0])
+    v_rel_norm = euclidean_norm(v_rel)
+    if v_rel_norm == 0.0:
+        return np.zeros((3, 3)), np.zeros((3, 3))
+    dv = -B * rho * (v_rel_norm * np.eye(3) + np.outer(v_rel, v_rel) / v_rel_norm)
+
+    omega_cross = np.zeros((3, 3))
+    omega_cross[0, 1] = -EARTH_OMEGA
+    omega_cross[1, 0] = EARTH_OMEGA
+    # density only varies with altitude, i.e. along r_hat
+    r_hat = r_eci / euclidean_norm(r_eci)
+    dr = -dv @ omega_cross - B * v_rel_norm * np.outer(v_rel, r_hat) * drho_dh
+    return dr, dv
+
+@njit
+def jacobian_numba(t, y, params):
+    '''
+    Analytic Jacobian of state_derivative_numba for the implicit solvers (Radau, BDF, LSODA)
+    '''
+    r_eci = y[0:3].copy()
+    v_eci = y[3:6].copy()
+    r_norm = euclidean_norm(r_eci)
+    epoch = params[P_JD_EPOCH] + t / 86400.0
+    gmst = params[P_GMST0] + EARTH_OMEGA * t
+
+    offset = int(params[P_GRAVITY])
+    if offset > 0:
+        # the implicit solvers only need an approximate Jacobian: a spherical harmonic field
+        # contributes its central and J2 terms
+        field = params[offset:]
+        da_dr = point_mass_gradient(r_eci, field[2])
+        da_dr += J2_gradient(r_eci, field[2], field_j2(field), field[3])
+    else:
+        da_dr = point_mass_gradient(r_eci, EARTH_MU)
+        da_dr += J2_gradient(r_eci, EARTH_MU, EARTH_J2, EARTH_R)
+    da_dr += third_body_gradient(r_eci, moon_position_vector(epoch), MOON_K)
+    da_dr += third_body_gradient(r_eci, sun_position_vector(epoch), SUN_K)
+
+    altitude = r_norm - EARTH_R
+    r_ecef = eci_to_ecef(r_eci, gmst)
+    latitude, _, _ = ecef_to_geodetic(r_ecef[0], r_ecef[1], r_ecef[2])
+    rho, _ = atmosphere_numba(altitude, latitude, epoch, params)
+    step = max(1.0, 1e-6 * altitude)
+    rho_up, _ = atmosphere_numba(altitude + step, latitude, epoch, params)
+    rho_down, _ = atmosphere_numba(altitude - step, latitude, epoch, params)
+    drho_dh = (rho_up - rho_down) / (2.0 * step)
+    drag_dr, drag_dv = drag_gradients(r_eci, v_eci, rho, drho_dh, params[P_CD], params[P_AREA], params[P_MASS])
+
+    jac = np.zeros((6, 6))
+    for i in range(3):
+        jac[i, i + 3] = 1.0
+    jac[3:6, 0:3] = da_dr + drag_dr
+    jac[3:6, 3:6] = drag_dv
+    return jac
+
+# state followed by the row-major 6x6 state transition matrix, integrated by run_simulation(stm=True)
+STM_STATE_SIZE = 42
+
+@njit
+def stm_derivative_numba(t, z, params):
+    # state derivative and the variational equations dPhi/dt = A(t) Phi, A the Jacobian of the force model
+    y = z[0:6].copy()
+    dz = np.empty(STM_STATE_SIZE)
+    dz[0:6] = state_derivative_numba(t, y, params)
+    dz[6:] = (jacobian_numba(t, y, params) @ z[6:].copy().reshape((6, 6))).ravel()
+    return dz
+
+@njit
+def stm_jacobian_numba(t, z, params):
+    # Jacobian of stm_derivative_numba for the implicit solvers without the second order terms (dA/dy Phi):
+    # the state block and A repeated over the columns of Phi
+    A = jacobian_numba(t, z[0:6].copy(), params)
+    jac = np.zeros((STM_STATE_SIZE, STM_STATE_SIZE))
+    jac[0:6, 0:6] = A
+    for i in range(6):
+        for j in range(6):
+            for k in range(6):
+                jac[6 + 6 * i + k, 6 + 6 * j + k] = A[i, j]
+    return jac
+
+@njit
+def drag_rate_numba(t, y, params):
+    # fastest decay rate of the dynamics, the largest eigenvalue of d(a_drag)/dv: 2 B rho |v_rel| (1/s)
+    r_eci = y[0:3].copy()
+    epoch = params[P_JD_EPOCH] + t / 86400.0
+    gmst = params[P_GMST0] + EARTH_OMEGA * t
+    v_rel = y[3:6] - np.array([-EARTH_OMEGA * r_eci[1], EARTH_OMEGA * r_eci[0], 0.0])
+    r_ecef = eci_to_ecef(r_eci, gmst)
+    latitude, _, _ = ecef_to_geodetic(r_ecef[0], r_ecef[1], r_ecef[2])
+    rho, _ = atmosphere_numba(euclidean_norm(r_eci) - EARTH_R, latitude, epoch, params)
+    return rho * params[P_CD] * params[P_AREA] / params[P_MASS] * euclidean_norm(v_rel)
+
+def fidelity_tolerances(fidelity):
+    '''
+    :param fidelity: name of a FIDELITY_PRESETS entry
+    :return: rtol and the per-component atol array for the (x, y, z, vx, vy, vz) state
+    '''
+    if fidelity not in FIDELITY_PRESETS:
+        raise ValueError(f"Unknown fidelity preset {fidelity}, expected one of {list(FIDELITY_PRESETS)}")
+    preset = FIDELITY_PRESETS[fidelity]
+    atol = np.array([preset['atol_position']] * 3 + [preset['atol_velocity']] * 3)
+    return preset['rtol'], atol
+
+def force_model_params(jd_epoch, gmst0, Cd, A, m, gravity=None, space_weather=None, duration=None):
+    '''
+    Packs force model parameters; any argument may be an array to build (N, n) ensemble parameters
+    :param gravity: optional gravity_field.GravityField replacing the point mass + J2 gravity
+    :param space_weather: optional space_weather.SpaceWeather replacing the sinusoidal solar cycle, the
+                          rows from the epoch to duration after it are packed
+    :param duration: seconds after the (latest) epoch the runs reach, SPACE_WEATHER_WINDOW days if None
+    '''
+    jd_epoch, gmst0, Cd, A, m = np.broadcast_arrays(*(np.asarray(p, dtype=np.float64) for p in (jd_epoch, gmst0, Cd, A, m)))
+    field = np.empty(0) if gravity is None else gravity.pack()
+    jd_end = jd_epoch.max() + (SPACE_WEATHER_WINDOW if duration is None else duration / 86400.0)
+    table = np.empty(0) if space_weather is None else space_weather.pack(jd_epoch.min(), jd_end)
+    params = np.empty(jd_epoch.shape + (N_PARAMS + field.shape[0] + table.shape[0],))
+    params[..., P_JD_EPOCH] = jd_epoch
+    params[..., P_GMST0] = gmst0
+    params[..., P_CD] = Cd
+    params[..., P_AREA] = A
+    params[..., P_MASS] = m
+    params[..., P_GRAVITY] = N_PARAMS if field.shape[0] else 0
+    params[..., P_SPACE_WEATHER] = N_PARAMS + field.shape[0] if table.shape[0] else 0
+    params[..., N_PARAMS:N_PARAMS + field.shape[0]] = field
+    params[..., N_PARAMS + field.shape[0]:] = table
+    return params
+
 # ----------------
 
 class SpacecraftModel:
-    def __init__(self, Cd=2.2, A=20.0, m=500.0, epoch=Time('2024-01-01 00:00:00'), gmst0=0.0, sim_type='RK45', material=[233, 1, 1, 0.1], dt=10, iter_fact=2):
+    def __init__(self, Cd=2.2, A=20.0, m=500.0, epoch=Time('2024-01-01 00:00:00'), gmst0=0.0, sim_type='RK45', material=[233, 1, 1, 0.1], dt=10, iter_fact=2, fidelity='standard', gravity=None, space_weather=None, duration=None):
         self.Cd = Cd  # drag coefficient
         self.A = A  # cross-sectional area of spacecraft in m^2
         self.height = np.sqrt(self.A / PI) * 1.315 # height of spacecraft in m, assuming orion capsule design
@@ -408,6 +753,18 @@ class SpacecraftModel:
         self.ablation_efficiency = material[3]
         self.dt = dt
         self.iter_fact = iter_fact
+        self.fidelity = fidelity
+        self.rtol, self.atol = fidelity_tolerances(fidelity)
+        self.gravity = gravity  # optional gravity_field.GravityField, point mass + J2 if None
+        self.space_weather = space_weather  # optional space_weather.SpaceWeather, sinusoidal solar cycle if None
+        self.duration = duration  # seconds after the epoch covered by the packed space weather, SPACE_WEATHER_WINDOW days if None
+        self.params = force_model_params(self.epoch, self.gmst0, self.Cd, self.A, self.m, gravity, space_weather, duration)
+
+    def _cover(self, t_end):
+        # repacks the space weather when a run reaches past the duration the model was built for
+        if self.space_weather is not None and self.duration is not None and t_end > self.duration:
+            self.duration = t_end
+            self.params = force_model_params(self.epoch, self.gmst0, self.Cd, self.A, self.m, self.gravity, self.space_weather, t_end)
 
     def get_initial_state(self, v, lat, lon, alt, azimuth, gamma, gmst=0.0):
         # Convert geodetic to ECEF
@@ -449,7 +806,11 @@ class SpacecraftModel:
 
         # Calculate accelerations
         a_grav = -EARTH_MU * r_eci / (r_norm ** 3)
-        a_J2 = J2_perturbation_numba(r_eci, k=EARTH_MU, J2=EARTH_J2, R=EARTH_R)
+        if self.gravity is not None:
+            # the J2 column holds everything the field adds to the point mass
+            a_J2 = ecef_to_eci(spherical_harmonic_acceleration(r_ecef, self.params[int(self.params[P_GRAVITY]):]), gmst) - a_grav
+        else:
+            a_J2 = J2_perturbation_numba(r_eci, k=EARTH_MU, J2=EARTH_J2, R=EARTH_R)
         moon_r = moon_position_vector(epoch)
         sun_r = sun_position_vector(epoch)
         a_moon = third_body_acceleration(r_eci, moon_r, MOON_K)
@@ -458,7 +819,7 @@ class SpacecraftModel:
         altitude = r_norm - EARTH_R
         x_ecef, y_ecef, z_ecef = r_ecef
         latitude, _, _ = ecef_to_geodetic(x_ecef, y_ecef, z_ecef)
-        rho, T = atmosphere_model(altitude, latitude, epoch)
+        rho, T = atmosphere_numba(altitude, latitude, epoch, self.params)
 
         # Calculate drag acceleration
         a_drag_ecef = atmospheric_drag(Cd=self.Cd, A=self.A, atmospheric_rho=rho, v=v_rel, mass=self.m)
@@ -487,34 +848,192 @@ class SpacecraftModel:
         }
 
     
-    def run_simulation(self, t_span, y0, t_eval, progress_callback=None):
+    def reentry_events(self):
+        '''
+        Events located by the integrator on every run, available as Trajectory.events[name]:
+        touchdown (terminal), Karman line crossings, apoapsis after a skip-out (none before the first Karman
+        line crossing), peak deceleration (drag, m/s^2) and peak heat flux (the spacecraft_heat_flux column, W)
+        '''
+        params = self.params
+
+        def altitude(t, y):
+            return euclidean_norm(y[0:3]) - EARTH_R
+
+        def radial_velocity(t, y):
+            return np.dot(y[0:3], y[3:6]) / euclidean_norm(y[0:3])
+
+        def deceleration(t, y):
+            a_drag, _ = drag_numba(t, y, params)
+            return euclidean_norm(a_drag)
+
+        def heat_flux(t, y):
+            a_drag, v_rel = drag_numba(t, y, params)
+            return self.ablation_efficiency * self.m * euclidean_norm(a_drag) * euclidean_norm(v_rel)
+
+        return [
+            ThresholdEvent('touchdown', altitude, TOUCHDOWN_ALTITUDE, direction=-1, terminal=True),
+            ThresholdEvent('karman_line', altitude, KARMAN_LINE),
+            # only once the vehicle has crossed the Karman line: not the apoapses of the orbit before entry
+            ThresholdEvent('apoapsis', radial_velocity, 0.0, direction=-1, after='karman_line'),
+            ExtremumEvent('max_deceleration', deceleration),
+            ExtremumEvent('max_heat_flux', heat_flux),
+        ]
+
+    def material_trade_study(self, trajectory, materials=MATERIALS):
+        '''
+        Evaluates the heat shield model of every material over one trajectory in a single vectorized pass,
+        instead of one simulation per material
+        :param trajectory: Trajectory of this model (only time and state are used)
+        :param materials: dict of name -> properties, MATERIALS by default; custom entries are welcome
+        :return: DataFrame with one row per material: peak temperature (K) and its time (s), peak net heat
+                 flux (W) and heat load (time integral of the net heat flux, J)
+        '''
+        import pandas as pd
+        names, cases = material_cases(materials, self.m, self.height)
+        t = np.ascontiguousarray(trajectory.t)
+        v_norm, a_drag_norm, atmo_T = thermal_environment_numba(t, np.ascontiguousarray(trajectory.y), self.params)
+        _, _, q_net, _, T_s, _ = heat_balance_numba(v_norm, a_drag_norm, atmo_T, self.dt, self.iter_fact, cases)
+        peak = np.argmax(T_s, axis=1)
+        return pd.DataFrame({
+            'material': names,
+            'peak_temperature': T_s[np.arange(len(names)), peak],
+            'peak_temperature_time': t[peak],
+            'peak_heat_flux': q_net.max(axis=1),
+            'heat_load': np.sum((q_net[:, 1:] + q_net[:, :-1]) / 2 * np.diff(t), axis=1),
+        }).set_index('material')
+
+    def write_diagnostics(self, block):
+        '''
+        Fills the diagnostic columns (acceleration breakdown and thermal model) of a Trajectory in place
+        :param block: Trajectory whose time and state rows are set
+        '''
+        for k, (t, y) in enumerate(zip(block.t, block.y.T)):
+            block.write_sample(k, self.equations_of_motion(t, y))
+
+    def diagnose(self, trajectory, store_path=None, chunk_size=4096):
+        '''
+        Recomputes the diagnostic columns of a trajectory without integrating again. The thermal model
+        does not feed back into the dynamics, so a new heat shield material only needs this pass.
+        :param trajectory: Trajectory from run_simulation
+        :param store_path: optional .npy path for a memory-mapped output store
+        :param chunk_size: number of samples processed at a time
+        :return: new Trajectory with the same samples and events
+        '''
+        store = TrajectoryStore(len(trajectory), path=store_path, columns=trajectory.columns)
+        for start in range(0, len(trajectory), chunk_size):
+            block = Trajectory(np.array(trajectory.buffer[:, start:start + chunk_size]), trajectory.columns)
+            self.write_diagnostics(block)
+            store.append(block.buffer)
+        metadata = dict(t_events=trajectory.t_events, y_events=trajectory.y_events, events=trajectory.events,
+                        status=trajectory.status, message=trajectory.message, nfev=trajectory.nfev, checkpoint=trajectory.checkpoint)
+        store.flush(**metadata)
+        return store.trajectory(**metadata)
+
+    def run_simulation(self, t_span, y0, t_eval, progress_callback=None, store_path=None, chunk_size=4096, events=None, diagnostics=True, resume=None, stm=False):
+        '''
+        Integrates the equations of motion and returns a Trajectory. Output samples and their
+        diagnostics are produced chunk by chunk, so with store_path the run streams into a
+        memory-mapped file and peak memory no longer grows with the number of samples.
+        :param t_span: (ts, tf) in seconds
+        :param y0: initial ECI state
+        :param t_eval: output sample times
+        :param progress_callback: called with (progress, elapsed_time) after every solver step
+        :param store_path: optional .npy path for a memory-mapped trajectory store
+        :param chunk_size: number of output samples processed at a time
+        :param events: additional ThresholdEvent / ExtremumEvent instances located during the run
+        :param diagnostics: fill the diagnostic columns while integrating; without them only time, state
+                            and events are produced and diagnose() can fill them later
+        :param resume: Trajectory of an earlier run of this model to continue from its checkpoint up to
+                       t_span[1] (y0 is then ignored); its samples and events are carried over and the
+                       new ones appended, so only the extension is integrated
+        :param stm: also integrate the variational equations, the 6x6 state transition matrix Phi(t, t0)
+                    from the compiled partials of the force model (see dispersion.py). The samples keep the
+                    state only; the event records and the checkpoint carry STM_STATE_SIZE rows, the state
+                    followed by Phi row-major. With a gravity field Phi has its central and J2 terms only.
+        :return: Trajectory
+        '''
+        self._cover(t_span[1])
+        params = self.params
+        state_size = STM_STATE_SIZE if stm else 6
+        if resume is not None:
+            checkpoint = resume.checkpoint
+            if checkpoint is None:
+                raise ValueError("The trajectory to resume has no checkpoint")
+            if t_span[1] <= checkpoint.t:
+                raise ValueError(f"The trajectory to resume already reaches t={checkpoint.t:.1f} s, beyond t_span[1]={t_span[1]} s")
+            if checkpoint.y.size != state_size:
+                raise ValueError(f"The trajectory to resume was run with stm={not stm}, it must be resumed the same way")
+            y0 = checkpoint.y
+            # samples already in the resumed trajectory are not emitted again
+            t_last = resume.t[-1] if len(resume) else -np.inf
+            if t_eval is not None:
+                t_eval = np.asarray(t_eval)[np.asarray(t_eval) > t_last]
+        elif stm:
+            y0 = np.concatenate((y0, np.eye(6).ravel()))
+
+        derivative, jacobian = (stm_derivative_numba, stm_jacobian_numba) if stm else (state_derivative_numba, jacobian_numba)
+        atol = self.atol
+        if stm:
+            # an error atol[j] in the initial state component j may grow into an error atol[i] in component i
+            atol = np.broadcast_to(np.asarray(self.atol, dtype=np.float64), 6)
+            atol = np.concatenate((atol, (atol[:, None] / atol[None, :]).ravel()))
+
         def rhs(t, y):
-            dy = self.equations_of_motion(t, y)
-            return np.concatenate((dy['velocity'], dy['acceleration']))
-
-        
-        def altitude_event(t, y):
-            r = y[0:3]
-            r_norm = euclidean_norm(r)
-            altitude = r_norm - EARTH_R
-            # Add a tolerance value to avoid triggering the event too close to the atmospheric boundary
-            return altitude - 1000.0
-        
-        altitude_event.terminal = True
-        altitude_event.direction = -1
-
-        def progress_event(t, y):
+            # thermal output does not feed back into the dynamics, so the solver only needs the compiled force model
+            return derivative(t, y, params)
+
+        def jac(t, y):
+            # implicit methods would otherwise build the Jacobian from 6+ extra RHS calls per update
+            return jacobian(t, y, params)
+
+        if self.sim_type == 'Auto':
+            # explicit in vacuum, implicit once the drag timescale pins the explicit step size
+            method = 'RK45'
+            switch_method = StiffnessSwitch(lambda t, y: drag_rate_numba(t, y, params), explicit='RK45', implicit='Radau')
+        else:
+            method = self.sim_type
+            switch_method = None
+        if resume is not None:
+            # continue with the integrator and step size the run stopped with
+            method = resume.checkpoint.method
+            t_span = (resume.checkpoint.t, t_span[1])
+
+        events = self.reentry_events() + list(events or [])
+
+        def on_step(solver):
             if progress_callback is not None:
-                progress = min((t - t_span[0]) / (t_span[1] - t_span[0]), 1.0)  # Make sure progress doesn't exceed 1.0
+                progress = min((solver.t - t_span[0]) / (t_span[1] - t_span[0]), 1.0)  # Make sure progress doesn't exceed 1.0
                 elapsed_time = time.time() - self.start_time
                 progress_callback(progress, elapsed_time)
-            return 0
 
-        progress_event.terminal = False
-        progress_event.direction = 0
-
-        sol = solve_ivp(rhs, t_span, y0, method=self.sim_type, t_eval=t_eval, rtol=1e-8, atol=1e-10, events=[altitude_event, progress_event])
-        additional_data_list = [self.equations_of_motion(t, y) for t, y in zip(sol.t, sol.y.T)]
-        sol.additional_data = {key: np.array([d[key] for d in additional_data_list]) for key in additional_data_list[0].keys()}
-        return sol
-    
+        capacity = len(t_eval) if t_eval is not None else chunk_size
+        store = TrajectoryStore(capacity + (len(resume) if resume is not None else 0), path=store_path)
+        nfev = 0
+        if resume is not None:
+            for start in range(0, len(resume), chunk_size):
+                store.append(np.asarray(resume.buffer[:, start:start + chunk_size]))
+            nfev = resume.nfev
+
+        def on_samples(t_chunk, y_chunk):
+            # Write the state and diagnostics of one chunk straight into the columnar store
+            block = Trajectory.empty(len(t_chunk))
+            block.t[:] = t_chunk
+            block.y[:] = y_chunk[0:6]
+            if diagnostics:
+                self.write_diagnostics(block)
+            store.append(block.buffer)
+
+        def on_checkpoint(checkpoint, events_so_far):
+            # a streamed run keeps a resumable sidecar on disk, so an interrupted run can be reopened
+            # with TrajectoryStore.load() and continued
+            store.flush(events=events_so_far, status=0, message='Running', nfev=nfev, checkpoint=checkpoint)
+
+        result = propagate(rhs, t_span, y0, t_eval=t_eval, method=method, rtol=self.rtol, atol=atol, events=events,
+                           on_samples=on_samples, on_step=on_step, chunk_size=chunk_size, jac=jac, switch_method=switch_method,
+                           first_step=resume.checkpoint.step_size if resume is not None else None,
+                           previous_events=resume.events if resume is not None else None,
+                           on_checkpoint=on_checkpoint if store_path is not None else None)
+        metadata = dict(t_events=result.t_events, y_events=result.y_events, events=result.events, status=result.status, message=result.message,
+                        nfev=nfev + result.nfev, checkpoint=result.checkpoint)
+        store.flush(**metadata)
+        return store.trajectory(**metadata)
@@ -5,6 +5,7 @@ from coordinate_converter import (ecef_to_eci, geodetic_to_spheroid)
 from spacecraft_model import *
 import astropy.units as u
 from astropy.coordinates import CartesianRepresentation
+from astropy.time import Time
 import shapely.geometry as sgeom
 import plotly.express as px
 import pvlib
@@ -29,6 +30,60 @@ heatshield_colorscale = [
     [1, "black"]
 ]
 
+GLOBE_EPOCH_BUCKET_S = 3600  # day/night shading of the cached globe is recomputed once per bucket
+
+@st.cache_resource(show_spinner=False)
+def cached_earth_mesh(mesh_resolution, epoch_bucket):
+    '''
+    Earth mesh vertices, triangles and day/night intensity, shared read-only across sessions
+    :param mesh_resolution: number of points per latitude and longitude line
+    :param epoch_bucket: epoch as a GLOBE_EPOCH_BUCKET_S bucket index since the unix epoch
+    :return: dict of numpy arrays for go.Mesh3d
+    '''
+    epoch = Time(epoch_bucket * GLOBE_EPOCH_BUCKET_S, format='unix')
+    mesh = SpacecraftVisualization.spheroid_mesh_data(epoch, mesh_resolution)
+    for array in mesh.values():
+        array.setflags(write=False)
+    return mesh
+
+@st.cache_resource(show_spinner=False)
+def cached_geo_lines(resolution):
+    '''
+    Country borders, coastlines and the 30 degree graticule in ECEF, merged into one polyline with
+    NaN separators and shared read-only across sessions
+    :param resolution: Natural Earth scale ('110m', '50m' or '10m')
+    :return: (3, n) array
+    '''
+    lines = []
+    for feature in (cfeature.BORDERS, cfeature.COASTLINE):
+        for geometry in feature.with_scale(resolution).geometries():
+            lines.extend(geometry.geoms if geometry.geom_type == 'MultiLineString' else [geometry])
+    lines = [np.asarray(line.xy) for line in lines]
+    lines += [np.array([np.arange(-180, 181, 1.0), np.full(361, lat)]) for lat in range(-90, 91, 30)]
+    lines += [np.array([np.full(181, lon), np.arange(-90, 91, 1.0)]) for lon in range(-180, 180, 30)]
+
+    segments = []
+    for lons, lats in lines:
+        x, y, z = geodetic_to_spheroid(np.ascontiguousarray(lats, dtype=np.float64), np.ascontiguousarray(lons, dtype=np.float64), 0.0)
+        segments.append(np.array([x, y, z]))
+        segments.append(np.full((3, 1), np.nan))  # break the polyline between geometries
+    xyz_ecef = np.concatenate(segments, axis=1)
+    xyz_ecef.setflags(write=False)
+    return xyz_ecef
+
+def earth_mesh_trace(epoch, mesh_resolution=50):
+    epoch_bucket = int(epoch.unix // GLOBE_EPOCH_BUCKET_S)
+    return SpacecraftVisualization.create_spheroid_mesh_trace(cached_earth_mesh(mesh_resolution, epoch_bucket))
+
+def geo_lines_trace(gmst, resolution='110m'):
+    # rotate the cached ECEF lines into ECI, the same rotation as ecef_to_eci for every vertex
+    x, y, z = cached_geo_lines(resolution)
+    cos_gmst, sin_gmst = np.cos(gmst), np.sin(gmst)
+    return go.Scatter3d(
+        x=cos_gmst * x - sin_gmst * y, y=sin_gmst * x + cos_gmst * y, z=z,
+        mode='lines', line=dict(color='blue', width=2), hoverinfo='none', showlegend=False, connectgaps=False,
+    )
+
 def visualize_orbit(
     x_pos, y_pos, z_pos,
     x_vel, y_vel, z_vel,
@@ -41,8 +96,8 @@ def visualize_orbit(
     crossing_points=None,
     impact_time=None,
     closest_indices=None,
-    country_feature=cfeature.BORDERS,
-    coastline_feature=cfeature.COASTLINE
+    resolution='110m',
+    mesh_resolution=50,
 ):
     scale_factor = 200  # Adjust this value to scale the velocity vector
     vel_arrow = SpacecraftVisualization.create_3d_arrow(x_pos, y_pos, z_pos, x_pos + x_vel * scale_factor, y_pos + y_vel * scale_factor, z_pos + z_vel * scale_factor, 'green', 'Velocity vector') # Velocity vector scaled
@@ -63,17 +118,9 @@ def visualize_orbit(
     else:
         gmst = gmst0
 
-    # Add the Earth and other geographical features
-    spheroid_mesh = SpacecraftVisualization.create_spheroid_mesh(epoch)
-    fig.add_trace(spheroid_mesh)
-    country_traces = SpacecraftVisualization.get_geo_traces(country_feature, gmst)
-    coastline_traces = SpacecraftVisualization.get_geo_traces(coastline_feature, gmst)
-    lat_lines = SpacecraftVisualization.create_latitude_lines(gmst=gmst)
-    lon_lines = SpacecraftVisualization.create_longitude_lines(gmst=gmst)
-
-    for trace in country_traces + coastline_traces + lat_lines + lon_lines:
-        trace.showlegend = False
-        fig.add_trace(trace)
+    # Add the Earth and other geographical features, built once per process and only rotated here
+    fig.add_trace(earth_mesh_trace(epoch, mesh_resolution))
+    fig.add_trace(geo_lines_trace(gmst, resolution))
     
     # Add periapsis and apoapsis points
     periapsis_ECI, apoapsis_ECI = periapsis_apoapsis_points(orbit)
@@ -127,8 +174,7 @@ def visualize_orbit(
     # Simulation data
     if data is not None:
         r_eci = data.y[0:3]
-        t_sol = data.t
-        T_aw_data = data.additional_data['spacecraft_temperature']
+        T_aw_data = data['spacecraft_temperature']
         trajectory_trace = SpacecraftVisualization.create_3d_scatter(
             r_eci[0], r_eci[1], r_eci[2], T_aw_data, name='Simulated trajectory', colorscale='Agsunset'
         )
@@ -211,7 +257,7 @@ def plot_heatmap(
         showlegend=True,
     )
 
-    st.plotly_chart(fig_colorscale, use_container_width=True)
+    return fig_colorscale
 
 @njit
 def compute_vertex_indices(num_lat, num_lon):
@@ -256,7 +302,7 @@ def add_annotations(fig, x_positions, texts, min_velocity, max_velocity, color):
         fig.add_shape(type='line', x0=x_pos, x1=x_pos, y0=min_velocity, y1=max_velocity, yref='y', xref='x', line=dict(color=color, width=2, dash='dot'))
         fig.add_annotation(x=x_pos, y=max_velocity, text=text, showarrow=True, font=dict(size=10), xanchor='center', yshift=10)
 
-def plot_ground_track(longitudes, latitudes, normalized_altitude, custom_colorscale, tickvals, ticktext, colormap, final_position_label, st):
+def plot_ground_track(longitudes, latitudes, normalized_altitude, custom_colorscale, tickvals, ticktext, colormap, final_position_label):
     # Add a single trace for the ground track
     fig7 = go.Figure()
     fig7.add_trace(go.Scattergeo(
@@ -345,7 +391,7 @@ def plot_ground_track(longitudes, latitudes, normalized_altitude, custom_colorsc
     )
     fig7.update_geos(resolution=110)
     fig7.update_layout(legend=dict(y=1.1, yanchor="top", xanchor="left", x=0, orientation="h"))
-    st.plotly_chart(fig7, use_container_width=True)
+    return fig7
 
 class SpacecraftVisualization:
     @staticmethod
@@ -438,14 +484,16 @@ class SpacecraftVisualization:
         :param N: number of points to use for each latitude and longitude line
         :return: plotly mesh trace
         '''
-        EARTH_COLOR_SCALE = [
-            (0.0, '#00144F'), # Dark blue   
-            (0.35, '#03172E'),   
-            (0.48, '#001963'),  
-            (0.52, '#0048A5'),  
-            (0.75, '#2F78FF'),
-            (1.0, '#659BFF'), # Light blue
-        ]
+        return SpacecraftVisualization.create_spheroid_mesh_trace(SpacecraftVisualization.spheroid_mesh_data(epoch, N))
+
+    @staticmethod
+    def spheroid_mesh_data(epoch, N=50):
+        '''
+        Computes the spheroid vertices, triangles and solar zenith shading
+        :param epoch: epoch object
+        :param N: number of points to use for each latitude and longitude line
+        :return: dict of numpy arrays for go.Mesh3d
+        '''
         latitude, longitude = np.meshgrid(np.linspace(-90, 90, N), np.linspace(-180, 180, N))
         current_time = epoch.datetime
 
@@ -478,10 +526,24 @@ class SpacecraftVisualization:
         
         vertex_indices = compute_vertex_indices(num_lat, num_lon)
 
-        return go.Mesh3d(
+        return dict(
             x=x.flatten(), y=y.flatten(), z=z.flatten(),
             i=vertex_indices[0], j=vertex_indices[1], k=vertex_indices[2],
             intensity=norm_zenith_flat,
+        )
+
+    @staticmethod
+    def create_spheroid_mesh_trace(mesh):
+        EARTH_COLOR_SCALE = [
+            (0.0, '#00144F'), # Dark blue   
+            (0.35, '#03172E'),   
+            (0.48, '#001963'),  
+            (0.52, '#0048A5'),  
+            (0.75, '#2F78FF'),
+            (1.0, '#659BFF'), # Light blue
+        ]
+        return go.Mesh3d(
+            **mesh,
             colorscale=EARTH_COLOR_SCALE,
             colorbar=None,
             showscale=False,
@@ -1,10 +1,15 @@
 #!/bin/bash
 
-# Kill any existing Streamlit server processes
+# Kill any existing Streamlit server and job service processes
 kill $(lsof -ti :8501) 2>/dev/null
+kill $(lsof -ti :8503) 2>/dev/null
 
-# Start the Streamlit app without opening the browser
-streamlit run app.py --browser.serverAddress 0.0.0.0 --server.port 8501 --server.headless true &
+# Start the job service; its worker processes run the simulations for the front ends
+python job_service.py --port 8503 &
+echo $! > job_service.pid
+
+# Start the Streamlit app without opening the browser, as a client of the job service
+REENTRY_JOB_SERVICE=http://localhost:8503 streamlit run app.py --browser.serverAddress 0.0.0.0 --server.port 8501 --server.headless true &
 
 # Save the Streamlit server's PID
 echo $! > streamlit.pid
@@ -0,0 +1,204 @@
+import math
+import numpy as np
+from constants import EARTH_R, EARTH_OMEGA, TOUCHDOWN_ALTITUDE, DEG_TO_RAD
+from coordinate_converter import eci_to_ecef, ecef_to_geodetic, haversine_distance
+from ensemble import propagate_ensemble, TOUCHDOWN
+from scenario import make_scenario, scenario_epoch, scenario_model
+from spacecraft_model import force_model_params
+
+# Landing site targeting: the entry controls of a scenario that put its impact point on a target, by
+# shooting. The miss (north, east in m) is driven to zero with Newton steps on a finite difference
+# Jacobian, whose columns are propagated together with the nominal in one parallel ensemble call,
+# and Broyden updates from then on, so an iteration costs one trajectory until the Jacobian goes
+# stale. Steps are kept within a trust region in the scaled controls, grown while the linear model
+# predicts the miss well and shrunk when it does not. Solutions are cached per scenario: a new target
+# starts from the nearest solved one, corrected to first order with its Jacobian, and usually needs
+# no finite differences at all.
+#
+# epoch_offset flies the same inertial entry state later by that many seconds: the Earth turns under
+# it, which moves the impact point west by about 0.25 deg per minute.
+TARGETING_CONTROLS = ('gamma', 'azimuth', 'epoch_offset')  # deg, deg, s
+DEFAULT_CONTROLS = ('gamma', 'azimuth')
+FD_STEPS = {'gamma': 0.01, 'azimuth': 0.05, 'epoch_offset': 5.0}
+CONTROL_SCALES = {'gamma': 1.0, 'azimuth': 10.0, 'epoch_offset': 900.0}  # unit of each control in the trust region
+TRUST_RADIUS = 1.0  # initial trust region radius, scaled controls
+MAX_TRUST_RADIUS = 16.0
+
+
+def local_miss(latitude, longitude, target_latitude, target_longitude):
+    '''
+    :return: (..., 2) north and east distance of points from the target in m, flat Earth around the target
+    '''
+    d_lon = (np.asarray(longitude) - target_longitude + 180.0) % 360.0 - 180.0
+    north = EARTH_R * DEG_TO_RAD * (np.asarray(latitude) - target_latitude)
+    east = EARTH_R * DEG_TO_RAD * math.cos(DEG_TO_RAD * target_latitude) * d_lon
+    return np.stack((north, east), axis=-1)
+
+
+class TargetingSolution:
+    '''
+    Controls that hit a target, and what it took to find them
+    '''
+    def __init__(self, controls, target, impact, miss, y0, jd_epoch, jacobian, converged, iterations, trajectories, warm_started):
+        self.controls = controls  # dict of control name -> value
+        self.target = target  # (latitude, longitude) in deg
+        self.impact = impact  # (latitude, longitude) in deg of the last iterate
+        self.miss = miss  # distance of the impact from the target in m
+        self.y0 = y0  # ECI entry state
+        self.jd_epoch = jd_epoch  # julian date of the entry state, the scenario epoch plus epoch_offset
+        self.jacobian = jacobian  # (2, n_controls) d(north, east miss) / d(controls) at the solution
+        self.converged = converged
+        self.iterations = iterations
+        self.trajectories = trajectories  # trajectories propagated, finite differences included
+        self.warm_started = warm_started
+
+
+class Targeter:
+    '''
+    Solves entry controls for target impact points, keeping the solutions as starting points for
+    nearby targets of the same scenario
+    '''
+    def __init__(self, controls=DEFAULT_CONTROLS, tol=250.0, max_iterations=25, warm_start_radius=2000e3):
+        '''
+        :param controls: subset of TARGETING_CONTROLS solved for, the other scenario inputs stay fixed
+        :param tol: impact miss distance at convergence, m
+        :param max_iterations: Newton / Broyden iterations per solve
+        :param warm_start_radius: cached solutions farther than this from a new target (m) are not used
+        '''
+        unknown = set(controls) - set(TARGETING_CONTROLS)
+        if unknown:
+            raise ValueError(f"Unknown targeting controls {sorted(unknown)}, expected some of {list(TARGETING_CONTROLS)}")
+        self.controls = tuple(controls)
+        self.tol = tol
+        self.max_iterations = max_iterations
+        self.warm_start_radius = warm_start_radius
+        self.cache = {}  # fixed scenario inputs -> list of TargetingSolution
+        self.scale = np.array([CONTROL_SCALES[name] for name in self.controls])
+
+    def _key(self, scenario):
+        return tuple((name, str(value)) for name, value in sorted(scenario.items()) if name not in self.controls)
+
+    def _impacts(self, scenario, X):
+        # impact latitude and longitude (NaN without touchdown) of every row of controls, propagated in parallel
+        model = self._model
+        values = {name: X[:, j] for j, name in enumerate(self.controls)}
+        for name in ('gamma', 'azimuth'):
+            if name not in self.controls:
+                values[name] = np.full(len(X), scenario[name], dtype=np.float64)
+        offset = values.get('epoch_offset', np.zeros(len(X)))
+        y0s = np.array([model.get_initial_state(v=scenario['v'], lat=scenario['lat'], lon=scenario['lon'], alt=scenario['alt_init'] * 1000,
+                                                azimuth=azimuth, gamma=gamma, gmst=self._gmst0)
+                        for gamma, azimuth in zip(values['gamma'], values['azimuth'])])
+        gmst0 = self._gmst0 + EARTH_OMEGA * offset
+        params = force_model_params(model.epoch + offset / 86400.0, gmst0, model.Cd, model.A, model.m, model.gravity, model.space_weather, model.duration)
+        result = propagate_ensemble(y0s, params, (0.0, scenario['tf']), rtol=model.rtol, atol=model.atol, stop_altitude=TOUCHDOWN_ALTITUDE)
+        self._trajectories += len(result)
+        impacts = np.full((len(X), 2), np.nan)
+        for i in np.flatnonzero(result.status == TOUCHDOWN):
+            latitude, longitude, _ = ecef_to_geodetic(*eci_to_ecef(result.y_end[i, 0:3], gmst0[i] + EARTH_OMEGA * result.t_end[i]))
+            impacts[i] = latitude, longitude
+        return impacts, y0s
+
+    def _jacobian(self, scenario, x, target):
+        # miss at x and its forward differences, all in one ensemble
+        steps = np.array([FD_STEPS[name] for name in self.controls])
+        X = np.vstack((x, x + np.diag(steps)))
+        impacts, y0s = self._impacts(scenario, X)
+        F = local_miss(impacts[:, 0], impacts[:, 1], *target)
+        if np.isnan(F).any():
+            raise RuntimeError(f"No touchdown before tf={scenario['tf']} s around {dict(zip(self.controls, x))}, cannot target from there")
+        return F[0], ((F[1:] - F[0]) / steps[:, None]).T, impacts[0], y0s[0]
+
+    def _warm_start(self, key, target):
+        # nearest solved target of the same scenario within warm_start_radius
+        solved = [s for s in self.cache.get(key, []) if s.converged]
+        if not solved:
+            return None
+        distances = [haversine_distance(s.target[0], s.target[1], target[0], target[1]) for s in solved]
+        nearest = int(np.argmin(distances))
+        return solved[nearest] if distances[nearest] <= self.warm_start_radius else None
+
+    def _step(self, J, F, radius):
+        # least squares (minimum norm with three controls) Newton step, shortened to the trust region
+        dz = -np.linalg.lstsq(J * self.scale, F, rcond=None)[0]
+        length = np.linalg.norm(dz)
+        return (dz if length <= radius else dz * radius / length) * self.scale
+
+    def solve(self, scenario, target_latitude, target_longitude):
+        '''
+        :param scenario: scenario dict, its values of the controls are the first guess without a cached solution
+        :param target_latitude: deg
+        :param target_longitude: deg
+        :return: TargetingSolution
+        '''
+        scenario = make_scenario(**scenario)
+        epoch, self._gmst0 = scenario_epoch(scenario['calendar'], scenario['clock'])
+        self._model = scenario_model(scenario, epoch, self._gmst0)
+        self._trajectories = 0
+        target = (target_latitude, target_longitude)
+        key = self._key(scenario)
+
+        cached = self._warm_start(key, target)
+        F = None
+        if cached is not None:
+            # first order correction of the cached solution towards the new target
+            x = np.array([cached.controls[name] for name in self.controls])
+            x_guess = x + self._step(cached.jacobian, local_miss(cached.impact[0], cached.impact[1], *target), TRUST_RADIUS)
+            impacts, y0s = self._impacts(scenario, x_guess[None, :])
+            if not np.isnan(impacts[0]).any():
+                x, J, F, impact, y0 = x_guess, cached.jacobian, local_miss(impacts[0, 0], impacts[0, 1], *target), impacts[0], y0s[0]
+        else:
+            x = np.array([scenario.get(name, 0.0) for name in self.controls], dtype=np.float64)
+        fresh = F is None  # Jacobian from finite differences at the current iterate
+        if fresh:
+            F, J, impact, y0 = self._jacobian(scenario, x, target)
+
+        iterations = 0
+        radius = TRUST_RADIUS
+        while np.linalg.norm(F) > self.tol and iterations < self.max_iterations:
+            iterations += 1
+            accepted = False
+            # a step of a fresh Jacobian is retried in a smaller region, a Broyden step gets one try
+            for _ in range(6 if fresh else 1):
+                dx = self._step(J, F, radius)
+                impacts, y0s = self._impacts(scenario, (x + dx)[None, :])
+                F_new = local_miss(impacts[0, 0], impacts[0, 1], *target)
+                # actual over predicted reduction of the miss; a rejected Broyden step blames the Jacobian, not the region
+                predicted = np.linalg.norm(F) - np.linalg.norm(F + J @ dx)
+                ratio = (np.linalg.norm(F) - np.linalg.norm(F_new)) / predicted if predicted > 0.0 else -1.0
+                if not ratio >= 0.1 and (fresh or ratio > 0.0):
+                    radius = 0.5 * min(radius, np.linalg.norm(dx / self.scale))
+                elif ratio > 0.4:
+                    radius = min(3.0 * radius, MAX_TRUST_RADIUS)
+                if ratio > 0.0:
+                    accepted = True
+                    break
+            if not accepted:
+                if fresh:
+                    break
+                # the Broyden Jacobian no longer points downhill: rebuild it at the current iterate
+                F, J, impact, y0 = self._jacobian(scenario, x, target)
+                fresh = True
+                continue
+            # Broyden update, in the control scaling
+            u = dx / self.scale
+            J = J + np.outer(F_new - F - J @ dx, u / self.scale) / np.dot(u, u)
+            x, F, impact, y0 = x + dx, F_new, impacts[0], y0s[0]
+            fresh = False
+
+        offset = x[self.controls.index('epoch_offset')] if 'epoch_offset' in self.controls else 0.0
+        solution = TargetingSolution(dict(zip(self.controls, x.tolist())), target, tuple(impact.tolist()), float(np.linalg.norm(F)), y0,
+                                     self._model.epoch + offset / 86400.0, J, bool(np.linalg.norm(F) <= self.tol), iterations,
+                                     self._trajectories, cached is not None)
+        self.cache.setdefault(key, []).append(solution)
+        return solution
+
+
+def solve_landing(scenario, target_latitude, target_longitude, controls=DEFAULT_CONTROLS, tol=250.0, targeter=None):
+    '''
+    Entry controls of a scenario that land it on a target, see Targeter
+    :param targeter: Targeter to reuse, keeps its cache of solutions for warm starts
+    :return: TargetingSolution
+    '''
+    targeter = targeter or Targeter(controls, tol)
+    return targeter.solve(scenario, target_latitude, target_longitude)
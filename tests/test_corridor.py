@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+from corridor import corridor_search, STEEP, INSIDE, SHALLOW
+
+SCENARIO = {'calendar': '2024-01-01', 'alt_init': 120.0, 'v': 8000.0, 'tf': 2000}
+
+
+class OutcomeEvaluator:
+    # stands in for CorridorEvaluator with outcomes given as (upper gamma, outcome) bands from steep to shallow
+    scenario = {'v': 7800.0}
+
+    def __init__(self, bands):
+        self.bands = bands
+        self.propagations = 0
+
+    def evaluate(self, v, gamma):
+        gamma = np.asarray(gamma, dtype=np.float64)
+        outcome = np.full(len(gamma), SHALLOW)
+        for upper, band in reversed(self.bands):
+            outcome[gamma < upper] = band
+        self.propagations += len(gamma)
+        return pd.DataFrame({'v': v, 'gamma': gamma, 'outcome': outcome})
+
+
+def _outcome(result, gamma):
+    samples = result.samples
+    return samples['outcome'][samples['gamma'] == gamma].iloc[0]
+
+
+def test_corridor_brackets_the_boundaries():
+    result = corridor_search(SCENARIO, tol=0.05)
+    assert not result.unordered[0]
+    (steep_lo, steep_hi), (shallow_lo, shallow_hi) = result.steep[0], result.shallow[0]
+    assert steep_hi - steep_lo <= 0.05 and shallow_hi - shallow_lo <= 0.05
+    # the outcome changes across each bracket
+    assert _outcome(result, steep_lo) == STEEP and _outcome(result, steep_hi) == INSIDE
+    assert _outcome(result, shallow_lo) == INSIDE and _outcome(result, shallow_hi) == SHALLOW
+    assert -20.0 < result.bounds[0, 0] < result.bounds[0, 1] < 0.0
+
+
+def test_unordered_outcomes_are_flagged():
+    # a second, narrower inside band above a skip-out band
+    evaluator = OutcomeEvaluator(((-10.0, STEEP), (-6.0, INSIDE), (-5.0, SHALLOW), (-3.0, INSIDE)))
+    with pytest.warns(UserWarning, match='not monotonic'):
+        result = corridor_search(evaluator=evaluator, tol=0.01)
+    assert result.unordered[0]
+    # the bounds are those of the widest inside run
+    np.testing.assert_allclose(result.bounds[0], (-10.0, -6.0), atol=0.01)
+
+
+def test_monotonic_outcomes_are_not_flagged():
+    result = corridor_search(evaluator=OutcomeEvaluator(((-12.3, STEEP), (-3.4, INSIDE))), tol=0.01)
+    assert not result.unordered[0]
+    np.testing.assert_allclose(result.bounds[0], (-12.3, -3.4), atol=0.01)
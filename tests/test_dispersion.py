@@ -0,0 +1,31 @@
+import numpy as np
+from dispersion import error_ellipse, scenario_dispersion, unscented_dispersion, _outcomes
+from scenario import make_scenario, scenario_epoch, scenario_model
+from targeting import local_miss
+
+SCENARIO = {'calendar': '2024-06-01', 'alt_init': 120, 'gamma': -5, 'tf': 2000}
+SIGMA = {'v': 3.0, 'gamma': 0.02}
+
+
+def _monte_carlo_footprint(n, seed):
+    scenario = make_scenario(**SCENARIO)
+    epoch, gmst0 = scenario_epoch(scenario['calendar'], scenario['clock'])
+    model = scenario_model(scenario, epoch, gmst0)
+    inputs = tuple(SIGMA)
+    mean = np.array([scenario[name] for name in inputs])
+    samples = mean + np.random.default_rng(seed).standard_normal((n, len(inputs))) * np.array([SIGMA[name] for name in inputs])
+    outcomes = _outcomes(scenario, model, gmst0, inputs, np.vstack((mean, samples)))
+    miss = local_miss(outcomes[1:, 0], outcomes[1:, 1], *outcomes[0, 0:2])
+    return np.cov(miss.T)
+
+
+def test_footprints_agree():
+    # the entry dispersion is small enough for the footprint to stay linear: a long, thin ellipse
+    linear = scenario_dispersion(SCENARIO, SIGMA).impact.ellipse()
+    unscented = unscented_dispersion(SCENARIO, SIGMA).ellipse()
+    monte_carlo = error_ellipse(_monte_carlo_footprint(1000, seed=1))
+    for major, minor, azimuth in (unscented, monte_carlo):
+        assert abs(major / linear[0] - 1.0) < 0.05
+        assert minor < 0.01 * major
+        assert abs(azimuth - linear[2]) < 0.5  # deg
+    assert abs(unscented[0] / linear[0] - 1.0) < 0.01
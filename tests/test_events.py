@@ -0,0 +1,29 @@
+import numpy as np
+from scenario import run_scenario
+
+
+def test_no_apoapsis_before_entry():
+    # climbing away from the start, the orbit's apoapsis comes before the Karman line is ever crossed
+    trajectory = run_scenario({'calendar': '2024-01-01', 'gamma': 1.0, 'v': 7500.0, 'tf': 6000}, diagnostics=False)
+    assert len(trajectory.events['karman_line']) and len(trajectory.events['touchdown'])
+    assert len(trajectory.events['apoapsis']) == 0
+
+
+def test_apoapsis_after_skip_out():
+    trajectory = run_scenario({'calendar': '2024-01-01', 'gamma': -0.5, 'v': 7950.0, 'alt_init': 110.0, 'tf': 5000}, diagnostics=False)
+    assert len(trajectory.events['apoapsis']) == 1
+    assert trajectory.events['apoapsis'].t[0] > trajectory.events['karman_line'].t[0]
+    r, v = trajectory.events['apoapsis'].y[0, 0:3], trajectory.events['apoapsis'].y[0, 3:6]
+    assert abs(np.dot(r, v) / np.linalg.norm(r)) < 1e-6  # radial velocity, m/s
+
+
+def test_events_independent_of_sampling():
+    # events are located on the solver's dense output, not on the output samples
+    coarse = run_scenario({'calendar': '2024-01-01', 'tf': 2500, 'dt': 100}, diagnostics=False)
+    fine = run_scenario({'calendar': '2024-01-01', 'tf': 2500, 'dt': 1}, diagnostics=False)
+    assert len(fine.events['touchdown']) and len(fine.events['max_deceleration'])
+    assert coarse.events.keys() == fine.events.keys()
+    for name, record in fine.events.items():
+        assert len(coarse.events[name]) == len(record)
+        np.testing.assert_array_equal(coarse.events[name].t, record.t)
+        np.testing.assert_array_equal(coarse.events[name].y, record.y)
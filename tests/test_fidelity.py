@@ -0,0 +1,29 @@
+import os
+import numpy as np
+import pytest
+from benchmarks.fidelity_benchmark import GOLDEN_DIR, SCENARIOS, SAMPLE_DT, make_spacecraft, initial_state, impact_point
+from constants import FIDELITY_PRESETS
+from coordinate_converter import haversine_distance
+
+# impact point error (m) and touchdown time error (s) each preset is documented to stay within (copy_text.py:
+# 'preview' a few kilometres, 'standard' a few metres, 'high' centimetres)
+TOLERANCES = {'preview': (10e3, 2.0), 'standard': (10.0, 0.01), 'high': (0.1, 1e-4)}
+
+
+def test_every_preset_has_a_tolerance():
+    assert TOLERANCES.keys() == FIDELITY_PRESETS.keys()
+
+
+@pytest.mark.parametrize('name', SCENARIOS)
+@pytest.mark.parametrize('fidelity', FIDELITY_PRESETS)
+def test_preset_against_golden(name, fidelity):
+    scenario = SCENARIOS[name]
+    golden = np.load(os.path.join(GOLDEN_DIR, f'{name}.npz'))
+    spacecraft = make_spacecraft(scenario, fidelity)
+    y0 = initial_state(spacecraft, scenario)
+    np.testing.assert_array_equal(y0, golden['y0'])
+    trajectory = spacecraft.run_simulation((0.0, scenario['tf']), y0, np.arange(0.0, scenario['tf'], SAMPLE_DT), diagnostics=False)
+    t_impact, lat, lon = impact_point(spacecraft, trajectory)
+    distance, time = TOLERANCES[fidelity]
+    assert haversine_distance(lat, lon, float(golden['impact_lat']), float(golden['impact_lon'])) < distance
+    assert abs(t_impact - float(golden['t_impact'])) < time
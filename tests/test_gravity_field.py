@@ -0,0 +1,67 @@
+import math
+import numpy as np
+from scipy.special import lpmv
+from constants import EARTH_MU, EARTH_R, EARTH_J2
+from gravity_field import GravityField
+from scenario import run_scenario
+from spacecraft_model import J2_perturbation_numba
+
+SCENARIO = {'calendar': '2024-01-01', 'tf': 2500}
+
+
+def _write_j2_icgem(path):
+    lines = ['begin_of_head', 'modelname j2', f'earth_gravity_constant {EARTH_MU:.15E}', f'radius {EARTH_R:.15E}',
+             'max_degree 2', 'norm fully_normalized', 'end_of_head']
+    for n in range(3):
+        for m in range(n + 1):
+            C = 1.0 if n == 0 else -EARTH_J2 / math.sqrt(5.0) if (n, m) == (2, 0) else 0.0
+            lines.append(f'gfc {n} {m} {C:.15E} 0.0 0.0 0.0')
+    path.write_text('\n'.join(lines))
+
+
+def _disturbing_potential(field, r):
+    # direct sum of the spherical harmonic series past the central term, with scipy's associated Legendre functions
+    radius = np.linalg.norm(r)
+    sin_phi, longitude = r[2] / radius, math.atan2(r[1], r[0])
+    U = 0.0
+    for n in range(2, field.degree + 1):
+        for m in range(min(n, field.order) + 1):
+            # fully normalized, without the Condon-Shortley phase scipy includes
+            norm = math.sqrt((1 if m == 0 else 2) * (2 * n + 1) * math.exp(math.lgamma(n - m + 1) - math.lgamma(n + m + 1)))
+            P = (-1) ** m * norm * lpmv(m, n, sin_phi)
+            U += (field.R / radius) ** n * P * (field.C[n, m] * math.cos(m * longitude) + field.S[n, m] * math.sin(m * longitude))
+    return field.mu / radius * U
+
+
+def test_field_acceleration_is_the_potential_gradient():
+    rng = np.random.default_rng(7)
+    degree, order = 30, 20
+    C = rng.normal(scale=1e-6, size=(degree + 1, degree + 1))
+    S = rng.normal(scale=1e-6, size=(degree + 1, degree + 1))
+    C[0, 0], C[1], S[1] = 1.0, 0.0, 0.0
+    C[2, 0] = -EARTH_J2 / math.sqrt(5.0)
+    S[:, 0] = 0.0
+    field = GravityField(np.tril(C), np.tril(S), EARTH_MU, EARTH_R, degree, order)
+    h = 10.0  # m
+    for r in ([EARTH_R + 200e3, 0.0, 0.0], [3.0e6, -4.0e6, 3.5e6], [1.0e5, -2.0e5, 6.5e6], [-5.0e6, 1.5e6, -4.0e6]):
+        r = np.array(r)
+        gradient = np.array([(_disturbing_potential(field, r + h * e) - _disturbing_potential(field, r - h * e)) / (2 * h) for e in np.eye(3)])
+        perturbation = field.acceleration(r) + EARTH_MU * r / np.linalg.norm(r) ** 3
+        np.testing.assert_allclose(perturbation, gradient, rtol=0, atol=1e-8 * np.abs(gradient).max())
+
+
+def test_j2_field_acceleration():
+    field = GravityField.from_j2()
+    for r in ([EARTH_R + 400e3, 0.0, 0.0], [3.0e6, -4.0e6, 3.5e6], [0.0, 1.0e6, -6.6e6]):
+        r = np.array(r)
+        expected = -EARTH_MU * r / np.linalg.norm(r) ** 3 + J2_perturbation_numba(r, EARTH_MU, EARTH_J2, EARTH_R)
+        np.testing.assert_allclose(field.acceleration(r), expected, rtol=1e-12)
+
+
+def test_j2_field_matches_default_gravity(tmp_path):
+    path = tmp_path / 'j2.gfc'
+    _write_j2_icgem(path)
+    default = run_scenario(SCENARIO, diagnostics=False)
+    field = run_scenario(dict(SCENARIO, gravity_file=str(path), gravity_degree=2), diagnostics=False)
+    assert abs(field.events['touchdown'].t[0] - default.events['touchdown'].t[0]) < 1e-4  # s
+    assert np.abs(field.events['touchdown'].y[0, 0:3] - default.events['touchdown'].y[0, 0:3]).max() < 0.005  # m
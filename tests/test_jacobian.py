@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from scenario import make_scenario, scenario_epoch, scenario_model
+from spacecraft_model import state_derivative_numba, jacobian_numba, stm_derivative_numba, stm_jacobian_numba, STM_STATE_SIZE
+
+T = 100.0  # s
+# altitude in m and speed in m/s: above the drag, in the entry, and near the ground
+STATES = ((300e3, 7700.0), (70e3, 6000.0), (30e3, 1000.0))
+
+
+@pytest.fixture(scope='module')
+def model():
+    scenario = make_scenario(calendar='2024-01-01')
+    epoch, gmst0 = scenario_epoch(scenario['calendar'], scenario['clock'])
+    return scenario_model(scenario, epoch, gmst0)
+
+
+def _state(model, alt, v):
+    return model.get_initial_state(v=v, lat=45.0, lon=-75.0, alt=alt, azimuth=90.0, gamma=-5.0, gmst=model.gmst0)
+
+
+def _central_differences(fun, z, steps, params):
+    return np.column_stack([(fun(T, z + h * e, params) - fun(T, z - h * e, params)) / (2 * h) for h, e in zip(steps, np.eye(len(z)))])
+
+
+def _assert_blocks_close(jac, expected, rows, columns, rtol):
+    # entries of one Jacobian span many orders of magnitude, so each block is compared to its own scale
+    for r in rows:
+        for c in columns:
+            np.testing.assert_allclose(jac[r, c], expected[r, c], rtol=0, atol=rtol * np.abs(expected[r, c]).max() + 1e-15)
+
+
+@pytest.mark.parametrize('alt, v', STATES)
+def test_jacobian_matches_finite_differences(model, alt, v):
+    y = _state(model, alt, v)
+    expected = _central_differences(state_derivative_numba, y, [1.0] * 3 + [1e-3] * 3, model.params)
+    blocks = (slice(0, 3), slice(3, 6))
+    _assert_blocks_close(jacobian_numba(T, y, model.params), expected, blocks, blocks, 1e-4)
+
+
+@pytest.mark.parametrize('alt, v', STATES)
+def test_stm_jacobian_matches_finite_differences(model, alt, v):
+    Phi = np.eye(6) + 0.1 * np.random.default_rng(0).standard_normal((6, 6))
+    z = np.concatenate((_state(model, alt, v), Phi.ravel()))
+    expected = _central_differences(stm_derivative_numba, z, [1.0] * 3 + [1e-3] * 3 + [1e-3] * 36, model.params)
+    jac = stm_jacobian_numba(T, z, model.params)
+    assert jac.shape == (STM_STATE_SIZE, STM_STATE_SIZE)
+    state, position, velocity, stm = slice(0, 6), slice(0, 3), slice(3, 6), slice(6, STM_STATE_SIZE)
+    _assert_blocks_close(jac, expected, (position, velocity), (position, velocity), 1e-4)
+    # the variational equations are linear in Phi
+    _assert_blocks_close(jac, expected, (state, stm), (stm,), 1e-6)
+    # the second order terms dA/dy Phi are left out on purpose
+    assert not jac[stm, state].any()
@@ -0,0 +1,121 @@
+import os
+import threading
+import time
+import numpy as np
+import pytest
+from job_client import JobServiceClient
+from job_service import resolve_data_files, serve
+from jobs import JobLimitError, QueueFullError, RUNNING, DONE, CANCELLED
+from scenario import make_scenario
+
+TIMEOUT = 120.0  # s, per job
+SHORT = {'calendar': '2024-01-01', 'tf': 1000}
+# stays in orbit, so it runs until it is cancelled
+LONG = {'calendar': '2024-01-01', 'gamma': 0.0, 'v': 7613.0, 'tf': 10_000_000, 'dt': 10}
+
+
+@pytest.fixture(scope='module')
+def service(tmp_path_factory):
+    # one worker, one queue slot and one unfinished job per client; starting the worker compiles the force model
+    server, service = serve('localhost', 0, workers=1, max_queue=1, max_jobs_per_client=1, abandon_after=None,
+                            results_dir=str(tmp_path_factory.mktemp('jobs')))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    deadline = time.time() + 600.0
+    while not service.health()['ready']:
+        assert time.time() < deadline, 'the worker did not start'
+        time.sleep(0.2)
+    yield service, f'http://localhost:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+    service.shutdown()
+
+
+def _wait(job, status=None):
+    # polls like a front end until the job finishes (or reaches status)
+    deadline = time.time() + TIMEOUT
+    while not (job.done if status is None else job.status == status):
+        assert time.time() < deadline, f'job {job.id} is still {job.status}'
+        time.sleep(0.1)
+        job.touch()
+    return job
+
+
+def test_submit_progress_result(service):
+    _, url = service
+    job = JobServiceClient(url, 'progress').submit(dict(SHORT, tf=3000))
+    events = list(job.events())
+    assert events[-1][0] == DONE and job.status == DONE
+    progress = [status['progress'] for _, status in events]
+    assert progress == sorted(progress) and progress[-1] == 1.0
+    trajectory = job.result
+    touchdown = trajectory.events['touchdown'].t[0]
+    np.testing.assert_array_equal(trajectory.t, np.arange(0.0, touchdown, 10.0))
+    assert 'spacecraft_temperature' in trajectory.to_dataframe()
+
+
+def test_cancel_removes_results(service):
+    service, url = service
+    job = _wait(JobServiceClient(url, 'cancel').submit(LONG), RUNNING)
+    job.cancel()
+    _wait(job)
+    assert job.status == CANCELLED
+    store_path = service.get(job.id).store_path
+    assert os.path.exists(store_path)
+    # finished jobs are removed with their files once kept long enough
+    keep_finished, service.keep_finished = service.keep_finished, 0.0
+    try:
+        deadline = time.time() + 10.0
+        while service.get(job.id) is not None:
+            assert time.time() < deadline, 'the cancelled job was not removed'
+            time.sleep(0.1)
+    finally:
+        service.keep_finished = keep_finished
+    assert not os.path.exists(store_path) and not os.path.exists(store_path + '.json')
+
+
+def test_limits(service):
+    _, url = service
+    first = _wait(JobServiceClient(url, 'a').submit(LONG), RUNNING)
+    with pytest.raises(JobLimitError):
+        JobServiceClient(url, 'a').submit(SHORT)
+    # the only worker is busy: one job waits, the next one is refused
+    queued = JobServiceClient(url, 'b').submit(SHORT)
+    with pytest.raises(QueueFullError):
+        JobServiceClient(url, 'c').submit(SHORT)
+    first.cancel()
+    assert _wait(queued).status == DONE
+    assert _wait(first).status == CANCELLED
+
+
+def test_resume(service):
+    _, url = service
+    client = JobServiceClient(url, 'resume')
+    base = _wait(client.submit(SHORT))
+    with pytest.raises(ValueError):
+        client.submit(dict(SHORT, v=7000.0, tf=3000), resume=base.id)  # not the same scenario
+    resumed = _wait(client.submit(dict(SHORT, tf=3000), resume=base.id))
+    full = _wait(client.submit(dict(SHORT, tf=3000)))
+    assert resumed.status == DONE and full.status == DONE
+    np.testing.assert_array_equal(resumed.result.t, full.result.t)
+    assert resumed.result.events.keys() == full.result.events.keys()
+    assert len(resumed.result.events['touchdown']) == 1
+
+
+def test_data_files_stay_in_the_data_directory(tmp_path):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    (data_dir / 'SW-All.csv').write_text('')
+    (tmp_path / 'secret.csv').write_text('')
+    os.symlink(tmp_path / 'secret.csv', data_dir / 'link.csv')
+
+    resolved = resolve_data_files(make_scenario(space_weather_file='SW-All.csv'), str(data_dir))
+    assert resolved['space_weather_file'] == os.path.realpath(data_dir / 'SW-All.csv')
+    assert resolve_data_files(make_scenario(), None)['space_weather_file'] is None
+    for name in ('../secret.csv', str(tmp_path / 'secret.csv'), 'link.csv', 'missing.csv', '..'):
+        with pytest.raises(ValueError):
+            resolve_data_files(make_scenario(space_weather_file=name), str(data_dir))
+        with pytest.raises(ValueError):
+            resolve_data_files(make_scenario(gravity_file=name), str(data_dir))
+    with pytest.raises(ValueError):
+        resolve_data_files(make_scenario(space_weather_file='SW-All.csv'), None)
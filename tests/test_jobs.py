@@ -0,0 +1,93 @@
+import threading
+import time
+import pytest
+from jobs import JobManager, JobLimitError, RUNNING, DONE, FAILED, CANCELLED
+
+TIMEOUT = 10.0  # s
+
+
+def _wait_for(condition):
+    deadline = time.time() + TIMEOUT
+    while not condition():
+        assert time.time() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def _halfway(gate, progress_callback):
+    # reports half of the run, then waits for the test
+    progress_callback(0.5, 0.1)
+    gate.wait(TIMEOUT)
+    progress_callback(1.0, 0.2)
+    return 'trajectory'
+
+
+def _forever(progress_callback):
+    # a run that only ends through its progress callback
+    while True:
+        progress_callback(0.5, 0.1)
+        time.sleep(0.01)
+
+
+def _failing(progress_callback):
+    raise ValueError('diverged')
+
+
+@pytest.fixture
+def manager():
+    manager = JobManager(max_workers=1, max_jobs_per_user=1, abandon_after=None)
+    yield manager
+    manager.shutdown()
+
+
+def test_submit_progress_result(manager):
+    gate = threading.Event()
+    job = manager.submit('user', _halfway, gate)
+    _wait_for(lambda: job.progress == 0.5)
+    assert job.status == RUNNING and manager.get(job.id) is job
+    gate.set()
+    job.future.result(TIMEOUT)
+    assert job.status == DONE and job.progress == 1.0 and job.result == 'trajectory'
+    # finished jobs leave the manager, the front end keeps its Job
+    assert manager.get(job.id) is None
+
+
+def test_failure_is_kept(manager):
+    job = manager.submit('user', _failing)
+    job.future.result(TIMEOUT)
+    assert job.status == FAILED and isinstance(job.error, ValueError)
+
+
+def test_cancel(manager):
+    running = manager.submit('a', _forever)
+    _wait_for(lambda: running.status == RUNNING)
+    queued = manager.submit('b', _forever)
+    manager.cancel(queued.id)
+    manager.cancel(running.id)
+    running.future.result(TIMEOUT)
+    queued.future.result(TIMEOUT)
+    assert running.status == CANCELLED and queued.status == CANCELLED
+    assert queued.elapsed == 0.0  # never started
+    assert not manager.jobs
+
+
+def test_per_user_limit(manager):
+    job = manager.submit('a', _forever)
+    with pytest.raises(JobLimitError):
+        manager.submit('a', _forever)
+    other = manager.submit('b', _forever)
+    # a cancelled job no longer counts, even before its worker has stopped
+    manager.cancel_user('a')
+    again = manager.submit('a', _forever)
+    for j in (job, other, again):
+        manager.cancel(j.id)
+        j.future.result(TIMEOUT)
+
+
+def test_abandoned_job_cancels_itself():
+    manager = JobManager(max_workers=1, abandon_after=0.2)
+    try:
+        job = manager.submit('user', _forever)
+        job.future.result(TIMEOUT)
+        assert job.status == CANCELLED
+    finally:
+        manager.shutdown()
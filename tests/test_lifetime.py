@@ -0,0 +1,21 @@
+import numpy as np
+from benchmarks.lifetime_benchmark import make_spacecraft, initial_state
+from lifetime import predict_lifetime
+
+# a light vehicle on a 120 x 170 km orbit: under two days to reentry, so the full run takes a second
+SCENARIO = dict(perigee=120.0, apogee=170.0, inc=28.5, Cd=2.2, A=14.0, m=500.0)
+LIFETIME_RTOL = 0.03  # the README's 2-3 % on the benchmark orbits
+
+
+def test_lifetime_against_full_run():
+    spacecraft = make_spacecraft(SCENARIO)
+    y0 = initial_state(SCENARIO)
+    result = predict_lifetime(spacecraft, y0)
+    assert result.reentered
+    assert result.t_handoff > 0.5 * result.lifetime  # most of the decay is in mean elements
+
+    tf = 1.5 * result.lifetime
+    trajectory = spacecraft.run_simulation((0.0, tf), y0, np.arange(0.0, tf, 600.0), diagnostics=False)
+    touchdown = trajectory.events['touchdown']
+    assert len(touchdown)
+    assert abs(result.lifetime - touchdown.t[0]) < LIFETIME_RTOL * touchdown.t[0]
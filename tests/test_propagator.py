@@ -0,0 +1,29 @@
+import numpy as np
+from astropy.time import Time
+from spacecraft_model import SpacecraftModel
+
+EPOCH = Time('2024-01-01 20:00:00', scale='tdb')
+# a light, high-drag body: its long descent near terminal velocity is stiff
+DEBRIS = dict(v=7500.0, lat=45.0, lon=0.0, alt=120e3, azimuth=90.0, gamma=-1.0)
+
+
+def _run(sim_type, Cd, A, m, state, tf):
+    spacecraft = SpacecraftModel(Cd=Cd, A=A, m=m, epoch=EPOCH, sim_type=sim_type)
+    y0 = spacecraft.get_initial_state(**state)
+    return spacecraft.run_simulation((0.0, tf), y0, np.arange(0.0, tf, 10.0), diagnostics=False)
+
+
+def test_auto_switches_on_stiff_descent():
+    explicit = _run('RK45', 2.2, 1.0, 2.0, DEBRIS, 20000.0)
+    auto = _run('Auto', 2.2, 1.0, 2.0, DEBRIS, 20000.0)
+    assert auto.checkpoint.method == 'Radau'
+    assert auto.nfev < explicit.nfev / 5
+    np.testing.assert_allclose(auto.events['touchdown'].t, explicit.events['touchdown'].t, atol=0.01)
+
+
+def test_auto_stays_explicit_on_capsule_entry():
+    capsule = dict(v=7540.0, lat=45.0, lon=-75.0, alt=500e3, azimuth=90.0, gamma=-2.0)
+    explicit = _run('RK45', 1.3, 14.0, 5000.0, capsule, 3700.0)
+    auto = _run('Auto', 1.3, 14.0, 5000.0, capsule, 3700.0)
+    assert auto.checkpoint.method == 'RK45'
+    assert auto.nfev == explicit.nfev
@@ -0,0 +1,26 @@
+import numpy as np
+from constants import EARTH_OMEGA
+from coordinate_converter import eci_to_ecef, ecef_to_geodetic, haversine_distance
+from quicklook import scenario_quicklook
+from scenario import make_scenario, run_scenario, scenario_epoch
+
+# the README's "within a few km and a second of the full run", with some margin
+IMPACT_DISTANCE = 10e3  # m
+IMPACT_TIME = 2.0  # s
+
+
+def test_quicklook_lands_near_the_full_run():
+    scenario = make_scenario(calendar='2024-01-01')
+    look = scenario_quicklook(scenario)
+    assert look.impact is not None
+
+    trajectory = run_scenario(scenario, diagnostics=False)
+    touchdown = trajectory.events['touchdown']
+    assert len(touchdown)
+    _, gmst0 = scenario_epoch(scenario['calendar'], scenario['clock'])
+    t_impact = touchdown.t[0]
+    latitude, longitude, _ = ecef_to_geodetic(*eci_to_ecef(np.ascontiguousarray(touchdown.y[0][0:3]), gmst0 + EARTH_OMEGA * t_impact))
+
+    assert abs(look.t_end - t_impact) < IMPACT_TIME
+    assert haversine_distance(look.impact[0], look.impact[1], latitude, longitude) < IMPACT_DISTANCE
+    assert look.t[-1] == look.t_end
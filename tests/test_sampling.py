@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from sampling import equidistribute
+
+T = np.linspace(0.0, 1000.0, 2001)
+# a coast, then a fast change in the middle
+MONITORS = np.vstack((np.tanh((T - 500.0) / 10.0), np.exp(-((T - 500.0) / 20.0) ** 2)))
+
+
+@pytest.mark.parametrize('budget', [2, 50, 333])
+@pytest.mark.parametrize('uniform_share', [0.2, 1.0])
+def test_equidistribute_spans_the_pilot(budget, uniform_share):
+    times = equidistribute(T, MONITORS, budget, uniform_share)
+    assert times.shape == (budget,)
+    assert np.all(np.diff(times) > 0.0)
+    assert times[0] == T[0]
+    assert times[-1] == T[-1]
+
+
+def test_equidistribute_is_dense_where_the_monitors_change():
+    times = equidistribute(T, MONITORS, 200)
+    fast = np.count_nonzero(np.abs(times - 500.0) < 50.0)
+    assert fast > 4 * np.count_nonzero(times < 100.0)
+    np.testing.assert_allclose(equidistribute(T, MONITORS, 200, 1.0), np.linspace(T[0], T[-1], 200))
+
+
+def test_equidistribute_constant_monitors_are_uniform():
+    np.testing.assert_allclose(equidistribute(T, np.ones((2, len(T))), 11), np.linspace(T[0], T[-1], 11))
+
+
+@pytest.mark.parametrize('uniform_share', [0.0, -0.1, 1.5, np.nan])
+def test_equidistribute_rejects_uniform_share(uniform_share):
+    with pytest.raises(ValueError):
+        equidistribute(T, MONITORS, 10, uniform_share)
@@ -0,0 +1,33 @@
+import numpy as np
+from sensitivity import SENSITIVITY_INPUTS, SENSITIVITY_OUTPUTS, sobol_analysis
+
+# Ishigami function of the first three inputs, uniform on [-pi, pi]; the other inputs have no effect
+A, B = 7.0, 0.1
+VARIANCE = A**2 / 8 + B * np.pi**4 / 5 + B**2 * np.pi**8 / 18 + 0.5
+S1 = np.zeros(len(SENSITIVITY_INPUTS))
+ST = np.zeros(len(SENSITIVITY_INPUTS))
+S1[0] = ST[0] = 0.5 * (1 + B * np.pi**4 / 5) ** 2 / VARIANCE
+S1[1] = ST[1] = A**2 / 8 / VARIANCE
+ST[0] += 8 * B**2 * np.pi**8 / 225 / VARIANCE
+ST[2] = 8 * B**2 * np.pi**8 / 225 / VARIANCE
+
+
+class IshigamiEvaluator:
+    # stands in for SensitivityEvaluator
+    scenario = {}
+    propagations = 0
+
+    def evaluate(self, X):
+        y = np.sin(X[:, 0]) + A * np.sin(X[:, 1]) ** 2 + B * X[:, 2] ** 4 * np.sin(X[:, 0])
+        return np.repeat(y[:, None], len(SENSITIVITY_OUTPUTS), axis=1)
+
+
+def test_sobol_indices_of_ishigami():
+    bounds = {name: (-np.pi, np.pi) for name in SENSITIVITY_INPUTS}
+    result = sobol_analysis(bounds=bounds, n=4096, seed=3, evaluator=IshigamiEvaluator())
+    indices = result[SENSITIVITY_OUTPUTS[0]]
+    np.testing.assert_allclose(indices['S1'], S1, atol=0.03)
+    np.testing.assert_allclose(indices['ST'], ST, atol=0.03)
+    # the bootstrap intervals hold the exact values
+    assert np.all((indices['S1_low'] <= S1) & (S1 <= indices['S1_high']))
+    assert np.all((indices['ST_low'] <= ST) & (ST <= indices['ST_high']))
@@ -0,0 +1,54 @@
+import math
+import os
+import numpy as np
+from space_weather import SpaceWeather, load_space_weather, parse_celestrak, space_weather_f107
+
+HEADER = 'DATE,BSRN,AP_AVG,F10.7_OBS,F10.7_OBS_CENTER81'
+
+
+def _write_csv(path, rows):
+    path.write_text('\n'.join([HEADER] + rows) + '\n')
+    return str(path)
+
+
+def test_reload_after_download(tmp_path):
+    path = _write_csv(tmp_path / 'SW-All.csv', ['2024-01-01,1,15,150.0,140.0', '2024-01-02,2,15,160.0,141.0'])
+    assert load_space_weather(path).table[0, 1] == 150.0
+    # a re-downloaded file replaces both the cached table and its .npy
+    _write_csv(tmp_path / 'SW-All.csv', ['2024-01-01,1,15,155.0,140.0', '2024-01-02,2,15,160.0,141.0'])
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+    assert load_space_weather(path).table[0, 1] == 155.0
+
+
+def test_parse_celestrak(tmp_path):
+    path = _write_csv(tmp_path / 'SW.csv', [
+        '2024-01-02,2,15,160.0,141.0',
+        '2024-01-01,1,15,150.0,140.0',
+        '2024-01-02,2,80,999.0,999.0',  # duplicate date: the first row is kept
+        '2024-01-03,3,7,170.0,142.0',
+        '2024-02-01,,,,145.0',  # monthly prediction without daily flux or Ap
+    ])
+    table = parse_celestrak(path)
+    # daily values at noon, 2024-01-01 12:00 is JD 2460311.0
+    np.testing.assert_array_equal(table[:, 0], [2460311.0, 2460312.0, 2460313.0])
+    np.testing.assert_array_equal(table[:, 1:], [[150.0, 140.0, 15.0], [160.0, 141.0, 15.0], [170.0, 142.0, 7.0]])
+
+
+def test_effective_f107():
+    weather = SpaceWeather(np.array([[2460311.0, 150.0, 140.0, 15.0], [2460312.0, 160.0, 141.0, 15.0], [2460313.0, 170.0, 142.0, 7.0]]))
+    table = weather.pack(2460300.0, 2460320.0)
+    # by hand: ap 15 is Kp 3, 140 + (1.3 * 10 + 28 * 3 + 0.03 e^3) / 3.24
+    first = 140.0 + (13.0 + 84.0 + 0.03 * math.exp(3.0)) / 3.24
+    assert math.isclose(space_weather_f107(2460311.0, table), first, rel_tol=1e-12)
+    assert math.isclose(first, 170.124249, rel_tol=1e-8)
+    # halfway between the first two rows, every column is interpolated
+    assert math.isclose(space_weather_f107(2460311.5, table), 140.5 + (1.3 * 14.5 + 84.0 + 0.03 * math.exp(3.0)) / 3.24, rel_tol=1e-12)
+    # lookups out of order move the bracket hint; before and after the table the end rows hold
+    last = space_weather_f107(2460313.0, table)
+    assert table[1] == 1
+    assert space_weather_f107(2460300.0, table) == first
+    assert table[1] == 0
+    assert space_weather_f107(2460320.0, table) == last
+    assert table[1] == 1
+    np.testing.assert_array_equal(weather.effective_f107(np.array([2460311.0, 2460313.0])), [first, last])
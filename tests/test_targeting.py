@@ -0,0 +1,32 @@
+import numpy as np
+from constants import EARTH_OMEGA
+from coordinate_converter import eci_to_ecef, ecef_to_geodetic
+from scenario import make_scenario, run_scenario, scenario_epoch
+from targeting import Targeter, local_miss, solve_landing
+
+SCENARIO = {'calendar': '2024-01-01', 'tf': 3700}
+TARGET = (40.0, -20.0)  # about 1000 km from the default scenario's impact point
+NEARBY = (40.2, -19.5)
+
+
+def test_solve_landing_hits_the_target():
+    solution = solve_landing(SCENARIO, *TARGET, tol=250.0)
+    assert solution.converged and solution.miss <= 250.0
+    # fly the solved controls with the single-run integrator
+    trajectory = run_scenario(dict(SCENARIO, **solution.controls), diagnostics=False)
+    scenario = make_scenario(**SCENARIO)
+    _, gmst0 = scenario_epoch(scenario['calendar'], scenario['clock'])
+    touchdown = trajectory.events['touchdown']
+    latitude, longitude, _ = ecef_to_geodetic(*eci_to_ecef(touchdown.y[0, 0:3], gmst0 + EARTH_OMEGA * touchdown.t[0]))
+    assert np.linalg.norm(local_miss(latitude, longitude, *TARGET)) < 250.0
+
+
+def test_warm_start_is_cheaper():
+    targeter = Targeter()
+    targeter.solve(SCENARIO, *TARGET)
+    warm = targeter.solve(SCENARIO, *NEARBY)
+    cold = solve_landing(SCENARIO, *NEARBY)
+    assert warm.warm_started and not cold.warm_started
+    assert warm.converged and cold.converged
+    assert warm.iterations < cold.iterations
+    assert warm.trajectories < cold.trajectories
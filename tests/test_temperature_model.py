@@ -0,0 +1,55 @@
+import numpy as np
+from constants import MATERIALS
+from scenario import make_scenario, scenario_epoch, scenario_model
+from temperature_model import HEAT_TERMS, heat_balance, thermal_environment, thermal_sweep
+
+# a short entry from 120 km, through peak heating
+SCENARIO = {'calendar': '2024-01-01', 'alt_init': 120, 'gamma': -5, 'tf': 600}
+
+
+def _model_and_trajectory(**inputs):
+    scenario = make_scenario(**dict(SCENARIO, **inputs))
+    epoch, gmst0 = scenario_epoch(scenario['calendar'], scenario['clock'])
+    model = scenario_model(scenario, epoch, gmst0)
+    y0 = model.get_initial_state(v=scenario['v'], lat=scenario['lat'], lon=scenario['lon'], alt=scenario['alt_init'] * 1000,
+                                 azimuth=scenario['azimuth'], gamma=scenario['gamma'], gmst=gmst0)
+    trajectory = model.run_simulation((0, scenario['tf']), y0, np.arange(0, scenario['tf'], scenario['dt']))
+    return model, trajectory, scenario
+
+
+def test_heat_balance_matches_spacecraft_temperature():
+    model, trajectory, scenario = _model_and_trajectory()
+    trade = model.material_trade_study(trajectory)
+    T_s = trajectory['spacecraft_temperature']
+    assert T_s.max() > T_s.min() + 1.0  # the trajectory does heat the shield
+    row = trade.loc[scenario['material']]
+    peak = np.argmax(T_s)
+    np.testing.assert_allclose(row['peak_temperature'], T_s[peak], rtol=1e-12)
+    assert row['peak_temperature_time'] == trajectory.t[peak]
+
+    # temperature and its last step for the scenario's material, sample by sample
+    cases = [[*MATERIALS[scenario['material']].values(), model.m, model.height]]
+    terms = heat_balance(*thermal_environment(trajectory, model), cases, model.dt, model.iter_fact)
+    np.testing.assert_allclose(terms['T_s'][0], T_s, rtol=1e-12)
+    np.testing.assert_allclose(terms['dT'][0], trajectory['spacecraft_temperature_change'], rtol=1e-9, atol=1e-12)
+
+
+def test_thermal_sweep_shape_and_axis_order():
+    model, trajectory, _ = _model_and_trajectory()
+    environment = thermal_environment(trajectory, model)
+    materials = {name: MATERIALS[name] for name in [*MATERIALS][:3]}
+    masses = (500.0, 1000.0)
+    capsule_lengths = (0.5, 1.0, 2.0, 4.0)
+    names, terms = thermal_sweep(*environment, model.dt, materials, masses, capsule_lengths, model.iter_fact)
+    assert names == [*materials]
+    assert terms.keys() == set(HEAT_TERMS)
+    for term in terms.values():
+        assert term.shape == (3, 2, 4, len(trajectory))
+
+    # each cell is the heat balance of that material, mass and capsule length alone
+    for i, name in enumerate(names):
+        for j, mass in enumerate(masses):
+            for k, length in enumerate(capsule_lengths):
+                single = heat_balance(*environment, [[*materials[name].values(), mass, length]], model.dt, model.iter_fact)
+                for term in HEAT_TERMS:
+                    np.testing.assert_array_equal(terms[term][i, j, k], single[term][0])
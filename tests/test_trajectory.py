@@ -0,0 +1,58 @@
+import numpy as np
+from scenario import can_extend, make_scenario, run_scenario, scenario_epoch, scenario_model
+from trajectory import TrajectoryStore
+
+SCENARIO = {'calendar': '2024-01-01', 'tf': 1500}
+
+
+def _model_and_state(**inputs):
+    scenario = make_scenario(**dict(SCENARIO, **inputs))
+    epoch, gmst0 = scenario_epoch(scenario['calendar'], scenario['clock'])
+    model = scenario_model(scenario, epoch, gmst0)
+    y0 = model.get_initial_state(v=scenario['v'], lat=scenario['lat'], lon=scenario['lon'], alt=scenario['alt_init'] * 1000,
+                                 azimuth=scenario['azimuth'], gamma=scenario['gamma'], gmst=gmst0)
+    return model, y0, scenario
+
+
+def _assert_same_events(loaded, trajectory):
+    assert loaded.events.keys() == trajectory.events.keys()
+    for name, record in trajectory.events.items():
+        assert loaded.events[name].y.shape == record.y.shape
+        np.testing.assert_array_equal(loaded.events[name].t, record.t)
+        np.testing.assert_array_equal(loaded.events[name].y, record.y)
+
+
+def test_store_round_trip(tmp_path):
+    model, y0, scenario = _model_and_state()
+    path = str(tmp_path / 'run.npy')
+    trajectory = model.run_simulation((0, scenario['tf']), y0, np.arange(0, scenario['tf'], scenario['dt']), store_path=path)
+    loaded = TrajectoryStore.load(path)
+    np.testing.assert_array_equal(loaded.t, trajectory.t)
+    np.testing.assert_array_equal(loaded.y, trajectory.y)
+    _assert_same_events(loaded, trajectory)
+    np.testing.assert_array_equal(loaded.checkpoint.y, trajectory.checkpoint.y)
+
+
+def test_stm_store_round_trip(tmp_path):
+    # event states of an stm run carry the 36 STM entries after the state
+    model, y0, scenario = _model_and_state()
+    path = str(tmp_path / 'stm.npy')
+    trajectory = model.run_simulation((0, scenario['tf']), y0, np.arange(0, scenario['tf'], scenario['dt']), store_path=path, stm=True)
+    assert trajectory.events['karman_line'].y.shape[1] == 42
+    _assert_same_events(TrajectoryStore.load(path), trajectory)
+
+
+def test_resume_matches_full_run():
+    # the resumed run restarts the integrator at the checkpoint, so it agrees with a straight run to within the
+    # integration error; at 'standard' fidelity that error alone moves touchdown by tens of metres
+    scenario = dict(SCENARIO, fidelity='high', tf=2500)
+    partial = dict(scenario, tf=1000)
+    assert can_extend(partial, scenario)
+    full = run_scenario(scenario, diagnostics=False)
+    resumed = run_scenario(scenario, diagnostics=False, resume=run_scenario(partial, diagnostics=False))
+    np.testing.assert_array_equal(resumed.t, full.t)
+    assert np.abs(resumed.y[0:3] - full.y[0:3]).max() < 0.025  # m
+    assert resumed.events.keys() == full.events.keys()
+    for name, record in full.events.items():
+        assert len(resumed.events[name]) == len(record)
+    assert np.abs(resumed.events['touchdown'].y[0, 0:3] - full.events['touchdown'].y[0, 0:3]).max() < 0.025
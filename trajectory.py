@@ -0,0 +1,269 @@
+import json
+import os
+import numpy as np
+from events import EventRecord
+from propagator import Checkpoint
+
+# -----------------
+# TRAJECTORY LAYOUT
+# -----------------
+
+# Vector quantities are stored as three consecutive columns so that a whole vector
+# can be handed out as a single (3, n) view of the buffer.
+VECTOR_COLUMNS = {
+    'position': ('x', 'y', 'z'),
+    'velocity': ('vx', 'vy', 'vz'),
+    'acceleration': ('acceleration_x', 'acceleration_y', 'acceleration_z'),
+    'gravitational_acceleration': ('gravitational_acceleration_x', 'gravitational_acceleration_y', 'gravitational_acceleration_z'),
+    'J2_acceleration': ('J2_acceleration_x', 'J2_acceleration_y', 'J2_acceleration_z'),
+    'moon_acceleration': ('moon_acceleration_x', 'moon_acceleration_y', 'moon_acceleration_z'),
+    'sun_acceleration': ('sun_acceleration_x', 'sun_acceleration_y', 'sun_acceleration_z'),
+    'drag_acceleration': ('drag_acceleration_x', 'drag_acceleration_y', 'drag_acceleration_z'),
+}
+
+SCALAR_COLUMNS = (
+    'altitude',
+    'spacecraft_temperature',
+    'spacecraft_heat_flux',
+    'spacecraft_heat_flux_conduction',
+    'spacecraft_heat_flux_radiation',
+    'spacecraft_heat_flux_total',
+    'spacecraft_temperature_change',
+)
+
+TRAJECTORY_COLUMNS = ('t',) + tuple(column for group in VECTOR_COLUMNS.values() for column in group) + SCALAR_COLUMNS
+
+
+class Trajectory:
+    '''
+    Simulation output stored as one contiguous struct-of-arrays buffer of shape (n_columns, n_samples).
+    Every column is a contiguous row of the buffer, so named columns, vectors and time slices
+    are numpy views and never copies.
+    '''
+    def __init__(self, buffer, columns=TRAJECTORY_COLUMNS, t_events=None, y_events=None, events=None, status=0, message='', nfev=0, checkpoint=None):
+        if buffer.ndim != 2 or buffer.shape[0] != len(columns):
+            raise ValueError(f"Buffer of shape {buffer.shape} does not match {len(columns)} columns")
+        self.buffer = buffer
+        self.columns = tuple(columns)
+        self.index = {name: i for i, name in enumerate(self.columns)}
+        self.t_events = t_events if t_events is not None else []
+        self.y_events = y_events if y_events is not None else []
+        self.events = events if events is not None else {}  # EventRecord by event name, located by the integrator
+        self.status = status
+        self.message = message
+        self.nfev = nfev
+        self.checkpoint = checkpoint  # propagator.Checkpoint to continue the run from (run_simulation(resume=...))
+
+    @classmethod
+    def empty(cls, n_samples, columns=TRAJECTORY_COLUMNS, **kwargs):
+        return cls(np.zeros((len(columns), n_samples), dtype=np.float64), columns, **kwargs)
+
+    def __len__(self):
+        return self.buffer.shape[1]
+
+    def __contains__(self, name):
+        return name in self.index or name in VECTOR_COLUMNS
+
+    def __getitem__(self, key):
+        '''
+        :param key: column name, vector name, slice, boolean mask or integer index array
+        :return: column view (str), (3, n) vector view, or a new Trajectory
+        '''
+        if isinstance(key, str):
+            if key in VECTOR_COLUMNS:
+                return self.vector(key)
+            return self.buffer[self.index[key]]
+        if isinstance(key, slice):
+            return self._derive(self.buffer[:, key])
+        key = np.asarray(key)
+        if key.dtype == bool:
+            return self.where(key)
+        return self._derive(self.buffer[:, key])
+
+    def _derive(self, buffer):
+        return Trajectory(buffer, self.columns, t_events=self.t_events, y_events=self.y_events, events=self.events, status=self.status, message=self.message, nfev=self.nfev, checkpoint=self.checkpoint)
+
+    @property
+    def t(self):
+        return self.buffer[self.index['t']]
+
+    @property
+    def y(self):
+        # state vector rows (x, y, z, vx, vy, vz), same layout as an OdeResult
+        start = self.index['x']
+        return self.buffer[start:start + 6]
+
+    def vector(self, name):
+        '''
+        Returns a (3, n) view of a vector quantity
+        :param name: vector name, e.g. 'drag_acceleration'
+        :return: numpy view
+        '''
+        start = self.index[VECTOR_COLUMNS[name][0]]
+        return self.buffer[start:start + 3]
+
+    def where(self, mask):
+        '''
+        Selects the samples where mask is True. A mask that selects one contiguous run of samples
+        (the usual case: everything before touchdown, a time window...) returns a view, any other
+        mask compacts the selected samples into a new buffer.
+        :param mask: boolean array with one entry per sample
+        :return: Trajectory
+        '''
+        mask = np.asarray(mask, dtype=bool)
+        selected = np.flatnonzero(mask)
+        if selected.size == 0:
+            return self._derive(self.buffer[:, 0:0])
+        first, last = selected[0], selected[-1]
+        if last - first + 1 == selected.size:
+            return self._derive(self.buffer[:, first:last + 1])
+        return self._derive(self.buffer[:, selected])
+
+    def above_altitude(self, altitude=0.0):
+        return self.where(self['altitude'] >= altitude)
+
+    def window(self, t_start, t_end):
+        '''
+        Returns the samples with t_start <= t <= t_end as a view. On a memory-mapped trajectory
+        only the pages of that window are read from disk.
+        '''
+        t = self.t
+        start = np.searchsorted(t, t_start, side='left')
+        end = np.searchsorted(t, t_end, side='right')
+        return self[start:end]
+
+    def write_sample(self, k, values):
+        '''
+        Writes one sample of equations_of_motion output into column k
+        :param k: sample index
+        :param values: dict of scalars and 3-vectors keyed like equations_of_motion
+        '''
+        for name, value in values.items():
+            if name == 'velocity':
+                continue  # already part of the state rows
+            if name in VECTOR_COLUMNS:
+                start = self.index[VECTOR_COLUMNS[name][0]]
+                self.buffer[start:start + 3, k] = value
+            elif name in self.index:
+                self.buffer[self.index[name], k] = value
+
+    # zero-copy handoff
+    # -----------------
+
+    def to_numpy(self):
+        return self.buffer
+
+    def to_dict(self):
+        return {name: self.buffer[i] for i, name in enumerate(self.columns)}
+
+    def to_dataframe(self):
+        import pandas as pd
+        # the transposed buffer already has pandas' internal (columns, rows) block layout
+        return pd.DataFrame(self.buffer.T, columns=list(self.columns), copy=False)
+
+    def to_arrow(self):
+        import pyarrow as pa
+        # every column is a contiguous float64 row (also for time slices), which arrow wraps without copying
+        return pa.table({name: pa.array(self.buffer[i]) for i, name in enumerate(self.columns)})
+
+
+class TrajectoryStore:
+    '''
+    Append-only trajectory output. Kept in memory by default; with a path the buffer is a
+    memory-mapped .npy file (plus a .json sidecar with the metadata), so the samples live in the
+    page cache instead of the process heap and a finished run can be reopened with load().
+    '''
+    def __init__(self, capacity, path=None, columns=TRAJECTORY_COLUMNS):
+        self.columns = tuple(columns)
+        self.path = path
+        self.length = 0
+        self.buffer = self._allocate(max(int(capacity), 1))
+
+    def _allocate(self, capacity):
+        shape = (len(self.columns), capacity)
+        if self.path is None:
+            return np.zeros(shape, dtype=np.float64)
+        return np.lib.format.open_memmap(self.path, mode='w+', dtype=np.float64, shape=shape)
+
+    def _grow(self, capacity):
+        old = self.buffer[:, :self.length]
+        if self.path is None:
+            buffer = self._allocate(capacity)
+            buffer[:, :self.length] = old
+        else:
+            # move the filled part to a temporary file, then rebuild the map at the new size
+            tmp_path = self.path + '.tmp.npy'
+            tmp = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float64, shape=old.shape)
+            tmp[:] = old
+            tmp.flush()
+            del old, tmp
+            self.buffer = None
+            buffer = self._allocate(capacity)
+            buffer[:, :self.length] = np.load(tmp_path, mmap_mode='r')
+            os.remove(tmp_path)
+        self.buffer = buffer
+
+    def append(self, block):
+        '''
+        :param block: array of shape (n_columns, k) in column order
+        '''
+        k = block.shape[1]
+        if self.length + k > self.buffer.shape[1]:
+            self._grow(max(2 * self.buffer.shape[1], self.length + k))
+        self.buffer[:, self.length:self.length + k] = block
+        self.length += k
+
+    def trajectory(self, **kwargs):
+        return Trajectory(self.buffer[:, :self.length], self.columns, **kwargs)
+
+    def flush(self, **kwargs):
+        if self.path is None:
+            return
+        self.buffer.flush()
+        with open(self.path + '.json', 'w') as f:
+            json.dump(trajectory_metadata(self.columns, self.length, **kwargs), f)
+
+    @staticmethod
+    def load(path, mode='r'):
+        '''
+        Reopens a flushed store as a Trajectory over the memory map, without reading the samples
+        :param path: .npy path given to the store
+        :param mode: numpy mmap_mode
+        :return: Trajectory
+        '''
+        with open(path + '.json') as f:
+            metadata = json.load(f)
+        return trajectory_from_metadata(np.load(path, mmap_mode=mode), metadata)
+
+
+def trajectory_metadata(columns, length, t_events=None, y_events=None, events=None, status=0, message='', nfev=0, checkpoint=None):
+    # JSON-compatible description of a trajectory buffer: the .json sidecar of a store
+    return {
+        'columns': list(columns),
+        'length': int(length),
+        't_events': [np.asarray(te).tolist() for te in (t_events or [])],
+        'y_events': [np.asarray(ye).tolist() for ye in (y_events or [])],
+        'events': {name: {'t': record.t.tolist(), 'y': record.y.tolist(), 'value': record.value.tolist()} for name, record in (events or {}).items()},
+        'status': int(status),
+        'message': message,
+        'nfev': int(nfev),
+        'checkpoint': checkpoint.to_dict() if checkpoint is not None else None,
+        # event states are as wide as the integrated state: 6, or STM_STATE_SIZE for run_simulation(stm=True)
+        'state_size': int(np.size(checkpoint.y)) if checkpoint is not None else 6,
+    }
+
+
+def trajectory_from_metadata(buffer, metadata):
+    '''
+    Rebuilds a Trajectory from a (n_columns, capacity) buffer and its trajectory_metadata
+    '''
+    state_size = metadata.get('state_size', 6)
+    return Trajectory(
+        buffer[:, :metadata['length']], metadata['columns'],
+        t_events=[np.asarray(te) for te in metadata['t_events']],
+        y_events=[np.asarray(ye) for ye in metadata['y_events']],
+        events={name: EventRecord(np.asarray(record['t']), np.asarray(record['y'], dtype=float).reshape(-1, state_size), np.asarray(record['value']))
+                for name, record in metadata.get('events', {}).items()},
+        status=metadata['status'], message=metadata['message'], nfev=metadata['nfev'],
+        checkpoint=Checkpoint.from_dict(metadata['checkpoint']) if metadata.get('checkpoint') else None,
+    )